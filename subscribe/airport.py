@@ -9,6 +9,7 @@ import os
 import random
 import re
 import string
+import threading
 import time
 import traceback
 import urllib
@@ -18,14 +19,17 @@ from copy import deepcopy
 from dataclasses import dataclass, field
 from enum import Enum
 
+import decoder
+import httpcache
 import mailtm
 import renewal
 import utils
 import yaml
+import yamlio
 from logger import logger
 
 import subconverter
-from clash import is_mihomo, verify
+from clash import is_mihomo, validate
 
 EMAILS_DOMAINS = [
     "gmail.com",
@@ -51,6 +55,9 @@ LETTERS = set(string.ascii_letters + string.digits)
 # 标记数字位数
 # SUFFIX_BITS = 2
 
+# 订阅内容解析结果，以内容哈希为键，相同内容只解析一次
+DECODED_RESULTS, DECODED_LOCKS, DECODED_LOCK = {}, {}, threading.Lock()
+
 
 class Category(Enum):
     # 远程订阅
@@ -63,15 +70,6 @@ class Category(Enum):
     LINK = 3
 
 
-# deal with !<str>
-def str_constructor(loader, node):
-    return str(loader.construct_scalar(node))
-
-
-yaml.SafeLoader.add_constructor("str", str_constructor)
-yaml.FullLoader.add_constructor("str", str_constructor)
-
-
 def lookup(name: str) -> Category:
     name = utils.trim(name)
     for item in Category:
@@ -123,6 +121,153 @@ def issspanel(domain: str) -> bool:
     return False if sniff(url=url) == 200 else sniff(url=f"{domain}/auth/login") == 200
 
 
+class Renamer(object):
+    """filter and rename proxies of an airport, all patterns are compiled once"""
+
+    # 需要进行 ChatGPT 连通性测试的节点名
+    CHATGPT_REGEX = re.compile(f"{utils.CHATGPT_FLAG}|(Chat)?GPT", flags=re.I)
+
+    GPT_REGEX = re.compile(r"((\s+)?([\-\|_]+)?(\s+)?)?(Chat)?GPT", flags=re.I)
+
+    # 节点名中的网址
+    DOMAIN_REGEX = re.compile(r"(?:https?://)?(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z\u4e00-\u9fa5]{2,}", flags=re.I)
+
+    FLAG_REGEX = re.compile(r"^[\U0001F1E6-\U0001F1FF]{2}")
+
+    # 括号及其内容以及特殊字符
+    SYMBOL_REGEX = re.compile(
+        r"\[[^\[]*\]|[（\(][^（\(]*[\)）]|{[^{]*}|<[^<]*>|【[^【]*】|「[^「]*」|[^a-zA-Z0-9\u4e00-\u9fa5_×\.\-|\s]",
+        flags=re.I,
+    )
+
+    BLANK_REGEX = re.compile(r"\s+|\r|\n|\\r|\\n", flags=re.I)
+
+    DASH_REGEX = re.compile(r"((\s+)?-(\s+)?)+")
+
+    def __init__(
+        self,
+        name: str,
+        include: str = "",
+        exclude: str = "",
+        rename: str = "",
+        chatgpt: dict = None,
+        emoji_patterns: dict = None,
+        remained: bool = False,
+        tag: str = "",
+    ):
+        self.name = name
+        self.include, self.exclude = None, None
+        try:
+            self.include = re.compile(include, flags=re.I) if include else None
+            self.exclude = re.compile(exclude, flags=re.I) if exclude else None
+        except re.error:
+            # include 无效时 exclude 同样不生效
+            logger.error(
+                f"filter proxies error, maybe include or exclude regex exists problems, include: {include}\texclude: {exclude}"
+            )
+
+        # re对group的引用方法: https://stackoverflow.com/questions/7191209/re-sub-replace-with-matched-content
+        self.rename, self.replacement = None, ""
+        try:
+            if RENAME_SEPARATOR in rename:
+                words = rename.split(RENAME_SEPARATOR, maxsplit=1)
+                old, self.replacement = words[0].strip(), words[1].strip()
+                self.rename = re.compile(old, flags=re.I) if old else None
+            elif rename:
+                self.rename = re.compile(rename, flags=re.I)
+        except re.error:
+            logger.error(f"invalid rename regex, ignore it, rename: {rename}\tseparator: {RENAME_SEPARATOR}")
+
+        chatgpt = chatgpt if chatgpt and type(chatgpt) == dict else {}
+        self.enable = chatgpt.get("enable", False)
+        self.operate = utils.trim(chatgpt.get("operate", "IN")).upper()
+        self.pattern = None
+        try:
+            pattern = utils.trim(chatgpt.get("regex", ""))
+            self.pattern = re.compile(pattern, flags=re.I) if pattern else None
+        except re.error:
+            logger.error(f"invalid chatgpt regex, ignore it, regex: {chatgpt.get('regex', '')}")
+
+        self.emoji_patterns = emoji_patterns
+        self.remained = remained
+        self.tag = tag.strip().upper() if tag else ""
+
+    def accept(self, name: str) -> bool:
+        if self.include and not self.include.search(name):
+            return False
+
+        return not self.exclude or self.exclude.search(name) is None
+
+    def transform(self, name: str) -> tuple[str, bool | None]:
+        """returns new name and whether to detect ChatGPT connectivity, None means not a ChatGPT candidate"""
+        detect = None
+        try:
+            if self.rename:
+                name = self.rename.sub(self.replacement, name)
+
+            # 标记需要进行ChatGPT连通性测试的节点
+            if self.enable or self.CHATGPT_REGEX.search(name):
+                detect = True
+                if self.pattern:
+                    match = self.pattern.search(name)
+                    detect = match is None if self.operate != "IN" else match is not None
+
+                name = self.GPT_REGEX.sub(" ", name)
+
+            # 重命名带网址的节点
+            name = self.DOMAIN_REGEX.sub("", name)
+        except:
+            logger.error(f"rename error, name: {name},\trename: {self.rename}\tseparator: {RENAME_SEPARATOR}")
+
+        # 是否添加 emoji
+        indexers = self.emoji_patterns
+        if self.remained and not self.FLAG_REGEX.search(name):
+            indexers = None
+
+        name = self.SYMBOL_REGEX.sub(" ", name).strip()
+        name = (
+            self.BLANK_REGEX.sub(" ", name)
+            .replace("_", "-")
+            .replace("+", "-")
+            .strip(r"""!"#$%&'()*+,-./:;<=>?@[\]^_`{|}~ """)
+        )
+        name = self.DASH_REGEX.sub("-", name)
+        if not name:
+            name = f"{self.name[0]}{self.name[-1]}-{''.join(random.sample(string.ascii_uppercase, 3))}"
+
+        if len(name) > 30:
+            i, j, k, n = 10, 4, 4, len(name)
+            alphabets = [x for x in name[i : n - j] if x in LETTERS]
+            if len(alphabets) > k:
+                abbreviation = "".join(random.sample(alphabets, k)).strip()
+            else:
+                abbreviation = "".join(alphabets)
+
+            name = f"{name[:i].strip()}-{abbreviation}-{name[-j:].strip()}"
+
+        if indexers:
+            emoji = utils.get_emoji(text=name, patterns=indexers, default="🇺🇸")
+            name = f"{emoji} {name}" if emoji else name
+
+        name = name.upper()
+        if self.tag:
+            name = f"{self.tag}-{name}"
+
+        return name, detect
+
+    def apply(self, item: dict) -> bool:
+        """rename the proxy in place, returns False if it's filtered out"""
+        name = item.get("name", "")
+        if not self.accept(name):
+            return False
+
+        item["name"], detect = self.transform(name)
+        if detect is not None:
+            item["chatgpt"] = detect
+
+        return True
+
+
 class AirPort:
     def __init__(
         self,
@@ -168,6 +313,9 @@ class AirPort:
         self.password = ""
         self.available = True
 
+        # 校验未通过的节点数量，按原因统计
+        self.rejects = {}
+
     @staticmethod
     def get_register_require(domain: str, proxy: str = "", default: bool = True) -> RegisterRequire:
         domain = utils.extract_domain(url=domain, include_protocal=True)
@@ -452,6 +600,7 @@ class AirPort:
             logger.error(f"[ParseError] cannot found any proxies because subscribe url is empty, domain: {self.ref}")
             return []
 
+        cache, cached, response_headers = None, None, None
         if self.sub.startswith(utils.FILEPATH_PROTOCAL):
             self.sub = self.sub[len(utils.FILEPATH_PROTOCAL) - 1 :]
             if not os.path.exists(self.sub) or not os.path.isfile(self.sub):
@@ -465,135 +614,87 @@ class AirPort:
             headers["Accept-Encoding"] = "gzip"
             headers["User-Agent"] = "V2RayN; Clash.Meta; Mihomo"
 
+            # 订阅内容未变化时直接复用上次解析结果
+            cache, variant = httpcache.instance(), f"{int(ignore_exclude)}{int(special_protocols)}"
+            if cache is not None:
+                record = cache.get(url=self.sub, agent=headers["User-Agent"])
+                cached = cache.load_nodes(content_hash=record.get("digest", ""), variant=variant)
+                if cached:
+                    headers.update(cache.conditions(record))
+
             trace = os.environ.get("TRACE_ENABLE", "false").lower() in ["true", "1"]
-            text = utils.http_get(url=self.sub, headers=headers, retry=retry, timeout=30, trace=trace).strip()
+            status, text, response_headers = utils.http_fetch(
+                url=self.sub, headers=headers, retry=retry, timeout=30, trace=trace
+            )
+            text = text.strip() if status == 200 else ""
+
+            if cache is not None:
+                if status == 304 and cached:
+                    cache.touch(url=self.sub, agent=headers["User-Agent"])
+                    logger.info(f"[ParseInfo] subscription not modified, reuse cached proxies, domain: {self.ref}")
+                    text = None
+                elif text:
+                    # 内容未变化时由 decode 直接返回缓存的解析结果
+                    cache.set(url=self.sub, agent=headers["User-Agent"], headers=response_headers, content=text)
 
         if "" == text or (
-            text.startswith("{") and text.endswith("}") and not re.search(r'"outbounds":', text, flags=re.I)
+            text and text.startswith("{") and text.endswith("}") and not re.search(r'"outbounds":', text, flags=re.I)
         ):
             logger.error(f"[ParseError] cannot found any proxies, subscribe: {utils.mask(url=self.sub)}")
             return []
 
-        chatgpt = chatgpt if chatgpt and type(chatgpt) == dict else None
-        enable, operate, pattern = False, "IN", ""
-        if chatgpt:
-            enable = chatgpt.get("enable", False)
-            operate = utils.trim(chatgpt.get("operate", "IN")).upper()
-            pattern = utils.trim(chatgpt.get("regex", ""))
-
         try:
-            chars = utils.random_chars(length=3, punctuation=False)
-            artifact = f"{self.name}-{chars}"
-
-            nodes = self.decode(
-                text=text,
-                artifact=artifact,
-                program=bin_name,
-                ignore=ignore_exclude,
-                special=special_protocols,
-            )
+            if text is None:
+                nodes = cached.get("nodes", [])
+                self.rejects.update(cached.get("rejects", {}))
+            else:
+                chars = utils.random_chars(length=3, punctuation=False)
+                artifact = f"{self.name}-{chars}"
+
+                nodes = self.decode(
+                    text=text,
+                    artifact=artifact,
+                    program=bin_name,
+                    ignore=ignore_exclude,
+                    special=special_protocols,
+                    stats=self.rejects,
+                )
+
+            if self.rejects:
+                logger.info(
+                    f"[ParseInfo] drop {sum(self.rejects.values())} invalid proxies, domain: {self.ref}, reasons: {self.rejects}"
+                )
 
             if not nodes:
                 logger.info(f"cannot found any proxy, domain: {self.ref}")
                 return []
 
+            # 订阅状态检查可直接复用本次请求结果
+            if text is not None and response_headers is not None:
+                httpcache.statuses().set(
+                    url=self.sub,
+                    state="active",
+                    userinfo=response_headers.get("subscription-userinfo", ""),
+                )
+
+            renamer = Renamer(
+                name=self.name,
+                include=self.include,
+                exclude=self.exclude,
+                rename=self.rename,
+                chatgpt=chatgpt,
+                emoji_patterns=emoji_patterns,
+                remained=remained,
+                tag=tag,
+            )
+
             proxies = []
             unused_nodes = self.fetch_unused(cookie, auth, rate)
             for item in nodes:
                 name = item.get("name", "")
-                if utils.isblank(name) or name in unused_nodes:
+                if utils.isblank(name) or name in unused_nodes or not renamer.apply(item):
                     continue
 
-                try:
-                    if self.include and not re.search(self.include, name, re.I):
-                        continue
-                    else:
-                        if self.exclude and re.search(self.exclude, name, re.I):
-                            continue
-                except:
-                    logger.error(
-                        f"filter proxies error, maybe include or exclude regex exists problems, include: {self.include}\texclude: {self.exclude}"
-                    )
-
-                try:
-                    if self.rename:
-                        # re对group的引用方法: https://stackoverflow.com/questions/7191209/re-sub-replace-with-matched-content
-                        if RENAME_SEPARATOR in self.rename:
-                            words = self.rename.split(RENAME_SEPARATOR, maxsplit=1)
-                            old = words[0].strip()
-                            new = words[1].strip()
-                            if old:
-                                name = re.sub(old, new, name, flags=re.I)
-                        else:
-                            name = re.sub(self.rename, "", name, flags=re.I)
-
-                    # 标记需要进行ChatGPT连通性测试的节点
-                    flag, detect = (
-                        enable or re.search(f"{utils.CHATGPT_FLAG}|(Chat)?GPT", name, flags=re.I),
-                        True,
-                    )
-                    if flag and pattern:
-                        match = re.search(pattern, name, flags=re.I)
-                        detect = match is None if operate != "IN" else match is not None
-
-                    if flag:
-                        name = re.sub(
-                            r"((\s+)?([\-\|_]+)?(\s+)?)?(Chat)?GPT",
-                            " ",
-                            name,
-                            flags=re.I,
-                        )
-                        item["chatgpt"] = detect
-
-                    # 重命名带网址的节点
-                    regex = r"(?:https?://)?(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z\u4e00-\u9fa5]{2,}"
-                    name = re.sub(regex, "", name, flags=re.I)
-                except:
-                    logger.error(
-                        f"rename error, name: {name},\trename: {self.rename}\tseparator: {RENAME_SEPARATOR}\tchatgpt: {pattern}\tdomain: {self.ref}"
-                    )
-
-                # 是否添加 emoji
-                indexers = emoji_patterns
-                if remained and not re.search(r"^[\U0001F1E6-\U0001F1FF]{2}", name):
-                    indexers = None
-
-                name = re.sub(
-                    r"\[[^\[]*\]|[（\(][^（\(]*[\)）]|{[^{]*}|<[^<]*>|【[^【]*】|「[^「]*」|[^a-zA-Z0-9\u4e00-\u9fa5_×\.\-|\s]",
-                    " ",
-                    name,
-                    flags=re.I,
-                ).strip()
-
-                name = (
-                    re.sub(r"\s+|\r|\n|\\r|\\n", " ", name, flags=re.I)
-                    .replace("_", "-")
-                    .replace("+", "-")
-                    .strip(r"""!"#$%&'()*+,-./:;<=>?@[\]^_`{|}~ """)
-                )
-                name = re.sub(r"((\s+)?-(\s+)?)+", "-", name)
-                if not name:
-                    name = f"{self.name[0]}{self.name[-1]}-{''.join(random.sample(string.ascii_uppercase, 3))}"
-
-                if len(name) > 30:
-                    i, j, k, n = 10, 4, 4, len(name)
-                    alphabets = [x for x in name[i : n - j] if x in LETTERS]
-                    if len(alphabets) > k:
-                        abbreviation = "".join(random.sample(alphabets, k)).strip()
-                    else:
-                        abbreviation = "".join(alphabets)
-
-                    name = f"{name[:i].strip()}-{abbreviation}-{name[-j:].strip()}"
-
-                if indexers:
-                    emoji = utils.get_emoji(text=name, patterns=indexers, default="🇺🇸")
-                    name = f"{emoji} {name}" if emoji else name
-
-                item["name"] = name.upper()
-
-                if "" != tag.strip():
-                    item["name"] = tag.strip().upper() + "-" + item["name"]
-
                 # 方便过滤无效订阅
                 item["sub"] = self.sub
                 item["liveness"] = self.liveness
@@ -613,10 +714,159 @@ class AirPort:
             )
             return []
 
+    @staticmethod
+    def convert(text: str, program: str, artifact: str = "", ignore: bool = False, throw: bool = False) -> list:
+        def load(stream) -> list:
+            try:
+                return yamlio.load_proxies(stream)
+            except Exception as e:
+                if throw:
+                    raise e
+                else:
+                    logger.error(f"cannot load yaml file, artifact: {artifact}, message:\n{traceback.format_exc()}")
+
+            return []
+
+        # 优先使用常驻的 subconverter 服务
+        pool = subconverter.server_pool()
+        if pool is not None:
+            content = pool.convert(content=text, target="clash", list_only=True, ignore_exclude=ignore)
+            if content is not None:
+                logger.info(f"subconverter server completed, artifact: [{artifact}]\tsuccess=[{bool(content)}]")
+                return load(content) if content else []
+
+        artifact = utils.trim(text=artifact)
+        if not artifact:
+            artifact = utils.random_chars(length=6, punctuation=False)
+
+        v2ray_file = os.path.join(PATH, "subconverter", f"{artifact}.txt")
+        clash_file = os.path.join(PATH, "subconverter", f"{artifact}.yaml")
+
+        try:
+            with open(v2ray_file, "w+", encoding="UTF8") as f:
+                f.write(text)
+                f.flush()
+        except:
+            if os.path.exists(v2ray_file):
+                os.remove(v2ray_file)
+
+            logger.error(f"save file fialed, artifact: {artifact}")
+            traceback.print_exc()
+
+        generate_conf = os.path.join(PATH, "subconverter", "generate.ini")
+        success = subconverter.generate_conf(
+            generate_conf,
+            artifact,
+            f"{artifact}.txt",
+            f"{artifact}.yaml",
+            "clash",
+            True,
+            ignore,
+        )
+        if not success:
+            logger.error("cannot generate subconverter config file")
+            os.remove(v2ray_file)
+            return []
+
+        # 与并发的其他转换请求合并，只调用一次 subconverter
+        success = subconverter.batch(binname=program, artifact=artifact) and os.path.isfile(clash_file)
+        logger.info(f"subconverter completed, artifact: [{artifact}]\tsuccess=[{success}]")
+
+        os.remove(v2ray_file)
+        if not success:
+            return []
+
+        with open(clash_file, "r", encoding="utf8", errors="ignore") as reader:
+            nodes = load(reader)
+
+        # 已经读取，可以删除
+        os.remove(clash_file)
+        return nodes
+
     @staticmethod
     def decode(
-        text: str, program: str, artifact: str = "", ignore: bool = False, special: bool = False, throw: bool = False
+        text: str,
+        program: str,
+        artifact: str = "",
+        ignore: bool = False,
+        special: bool = False,
+        throw: bool = False,
+        stats: dict = None,
+    ) -> list:
+        """
+        parse subscription content to valid proxies, reasons of invalid proxies are counted into stats if given,
+        results are memoized by content hash so that identical content is only decoded once
+        """
+        text = utils.trim(text=text)
+        if not text:
+            return []
+
+        content_hash, variant = httpcache.digest(text), f"{int(ignore)}{int(special)}"
+        key = f"{content_hash}-{variant}"
+        with DECODED_LOCK:
+            lock = DECODED_LOCKS.setdefault(key, threading.Lock())
+
+        # 相同内容并发解析时只需执行一次
+        with lock:
+            cached = DECODED_RESULTS.get(key, None)
+            if cached is None:
+                cache = httpcache.instance()
+                if cache is not None:
+                    data = cache.load_nodes(content_hash=content_hash, variant=variant)
+                    if data:
+                        cached = (data.get("nodes", []), data.get("rejects", {}))
+                        DECODED_RESULTS[key] = cached
+
+            if cached is None:
+                rejects = {}
+                nodes = AirPort.resolve(
+                    text=text,
+                    program=program,
+                    artifact=artifact,
+                    ignore=ignore,
+                    special=special,
+                    throw=throw,
+                    stats=rejects,
+                )
+
+                # 解析失败可能由网络等临时原因导致，不缓存
+                if nodes:
+                    cached = (nodes, rejects)
+                    DECODED_RESULTS[key] = cached
+
+                    cache = httpcache.instance()
+                    if cache is not None:
+                        cache.save_nodes(content_hash=content_hash, nodes=nodes, rejects=rejects, variant=variant)
+                else:
+                    cached = ([], rejects)
+            else:
+                logger.debug(f"[DecodeInfo] reuse decoded proxies of identical content, artifact: {artifact}")
+
+        # 解析完成后移除锁，避免锁的数量随内容持续增长，之后的调用直接读取缓存结果
+        with DECODED_LOCK:
+            if DECODED_LOCKS.get(key, None) is lock:
+                DECODED_LOCKS.pop(key, None)
+
+        nodes, rejects = cached
+        if stats is not None:
+            for reason, count in rejects.items():
+                stats[reason] = stats.get(reason, 0) + count
+
+        # 调用方会修改节点属性，需返回副本
+        return deepcopy(nodes)
+
+    @staticmethod
+    def resolve(
+        text: str,
+        program: str,
+        artifact: str = "",
+        ignore: bool = False,
+        special: bool = False,
+        throw: bool = False,
+        stats: dict = None,
     ) -> list:
+        """parse subscription content to valid proxies without memoization"""
+
         def clean_text(document: str) -> str:
             document = utils.trim(text=document)
             if not document:
@@ -643,86 +893,32 @@ class AirPort:
             or (text.startswith("{") and text.endswith("}"))
             or not re.search(r"^proxies:([\s\r\n]+)?$", text, flags=re.MULTILINE)
         ):
-            artifact = utils.trim(text=artifact)
-            if not artifact:
-                artifact = utils.random_chars(length=6, punctuation=False)
-
-            v2ray_file = os.path.join(PATH, "subconverter", f"{artifact}.txt")
-            clash_file = os.path.join(PATH, "subconverter", f"{artifact}.yaml")
-
-            try:
-                with open(v2ray_file, "w+", encoding="UTF8") as f:
-                    f.write(text)
-                    f.flush()
-            except:
-                if os.path.exists(v2ray_file):
-                    os.remove(v2ray_file)
-
-                logger.error(f"save file fialed, artifact: {artifact}")
-                traceback.print_exc()
-
-            generate_conf = os.path.join(PATH, "subconverter", "generate.ini")
-            success = subconverter.generate_conf(
-                generate_conf,
-                artifact,
-                f"{artifact}.txt",
-                f"{artifact}.yaml",
-                "clash",
-                True,
-                ignore,
-            )
-            if not success:
-                logger.error("cannot generate subconverter config file")
-                os.remove(v2ray_file)
-                return []
-
-            time.sleep(random.random())
-            success = subconverter.convert(binname=program, artifact=artifact)
-            logger.info(f"subconverter completed, artifact: [{artifact}]\tsuccess=[{success}]")
-
-            os.remove(v2ray_file)
-            if not success:
-                return []
-
-            with open(clash_file, "r", encoding="utf8", errors="ignore") as reader:
-                config = None
-                try:
-                    config = yaml.load(reader, Loader=yaml.SafeLoader)
-                except yaml.constructor.ConstructorError:
-                    reader.seek(0, 0)
-                    yaml.add_multi_constructor(
-                        "str",
-                        lambda loader, suffix, node: None,
-                        Loader=yaml.SafeLoader,
-                    )
-                    config = yaml.load(reader, Loader=yaml.SafeLoader)
-                except Exception as e:
-                    if throw:
-                        raise e
-                    else:
-                        logger.error(f"cannot load yaml file, artifact: {artifact}, message:\n{traceback.format_exc()}")
-
-                nodes = [] if not config else config.get("proxies", [])
-
-            # 已经读取，可以删除
-            os.remove(clash_file)
+            # 优先直接解析分享链接，无法处理的格式再交由 subconverter 转换
+            nodes = decoder.decode(text=text, ignore=ignore)
+            if nodes is None:
+                nodes = AirPort.convert(text=text, program=program, artifact=artifact, ignore=ignore, throw=throw)
         else:
             nodes = None
             try:
-                nodes = yaml.load(text, Loader=yaml.SafeLoader).get("proxies", [])
+                nodes = yamlio.load_proxies(text)
             except yaml.scanner.ScannerError:
                 text = clean_text(document=text)
-                nodes = yaml.load(text, Loader=yaml.SafeLoader).get("proxies", [])
-            except yaml.constructor.ConstructorError:
-                yaml.add_multi_constructor("str", lambda loader, suffix, node: None, Loader=yaml.SafeLoader)
-                nodes = yaml.load(text, Loader=yaml.FullLoader).get("proxies", [])
+                nodes = yamlio.load_proxies(text)
             except Exception as e:
                 if throw:
                     raise e
                 else:
                     logger.error(f"cannot load yaml file, artifact: {artifact}, message:\n{traceback.format_exc()}")
 
-        return [] if not nodes else [x for x in nodes if verify(x, special)]
+        proxies = []
+        for node in nodes or []:
+            reason = validate(node, special)
+            if not reason:
+                proxies.append(node)
+            elif stats is not None:
+                stats[reason] = stats.get(reason, 0) + 1
+
+        return proxies
 
     @staticmethod
     def enable_special_protocols() -> bool:
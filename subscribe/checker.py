@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import time
+import urllib
+import urllib.parse
+import urllib.request
+
+import utils
+from logger import logger
+from tqdm import tqdm
+
+import clash
+import storage
+
+# 通用测试地址
+YOUTUBE_URL = "https://www.youtube.com/s/player/23010b46/player_ias.vflset/en_US/remote.js"
+
+
+class Controller(object):
+    """minimal http/1.1 client keeping alive connections to clash external controller"""
+
+    def __init__(self, api_url: str, size: int = 64):
+        host, _, port = utils.trim(api_url).rpartition(":")
+        self.host = host or "127.0.0.1"
+        self.port = int(port)
+        self.size = max(1, size)
+        self.idles = []
+
+    async def acquire(self, fresh: bool = False) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        while self.idles and not fresh:
+            reader, writer = self.idles.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+
+        return await asyncio.open_connection(self.host, self.port)
+
+    def release(self, connection: tuple[asyncio.StreamReader, asyncio.StreamWriter], reusable: bool) -> None:
+        if reusable and len(self.idles) < self.size:
+            self.idles.append(connection)
+        else:
+            connection[1].close()
+
+    async def request(self, path: str, fresh: bool = False) -> tuple[int, bytes]:
+        connection = await self.acquire(fresh=fresh)
+        reader, writer = connection
+        reusable = False
+        try:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n\r\n".encode("utf8"))
+            await writer.drain()
+
+            # 空闲连接已被服务端关闭时读取到空行
+            line = await reader.readline()
+            words = line.split(maxsplit=2)
+            if len(words) < 2 or not words[1].isdigit():
+                raise ConnectionError(f"invalid status line: {line[:64]}")
+
+            status = int(words[1])
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            if "chunked" in headers.get("transfer-encoding", "").lower():
+                chunks = []
+                while True:
+                    length = int((await reader.readline()).split(b";")[0].strip(), 16)
+                    if length == 0:
+                        await reader.readline()
+                        break
+
+                    chunks.append(await reader.readexactly(length))
+                    await reader.readline()
+
+                body = b"".join(chunks)
+            else:
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+
+            reusable = headers.get("connection", "").lower() != "close"
+            return status, body
+        finally:
+            self.release(connection, reusable)
+
+    async def delay(self, name: str, url: str, timeout: int, expected: int = 0) -> int:
+        """query delay of the proxy, returns -1 if failed"""
+        params = {"timeout": timeout, "url": url}
+        if expected > 0:
+            params["expected"] = expected
+
+        path = f"/proxies/{urllib.parse.quote(name, safe='')}/delay?{urllib.parse.urlencode(params)}"
+
+        # 连接异常时使用新连接重试一次，节点本身超时不重试
+        for i in range(2):
+            try:
+                status, body = await asyncio.wait_for(self.request(path, fresh=i > 0), timeout=timeout / 1000 + 3)
+                if status != 200:
+                    return -1
+
+                return json.loads(body).get("delay", -1)
+            except asyncio.TimeoutError:
+                # python 3.11 起 asyncio.TimeoutError 即 OSError 的子类 TimeoutError，需优先捕获
+                return -1
+            except (ConnectionError, asyncio.IncompleteReadError, OSError, ValueError):
+                if i == 0:
+                    await asyncio.sleep(random.randint(30, 200) / 1000)
+
+        return -1
+
+    def close(self) -> None:
+        while self.idles:
+            _, writer = self.idles.pop()
+            writer.close()
+
+
+async def probe(controller: Controller, proxy: dict, timeout: int, test_url: str, delay: int, strict: bool) -> int:
+    """returns the max delay among all targets, -1 means the proxy is unavailable"""
+    name = proxy.get("name", "")
+    if not name or not isinstance(name, str):
+        return -1
+
+    targets = [test_url, YOUTUBE_URL]
+    if strict:
+        targets.append(random.choice(clash.DOWNLOAD_URL))
+
+    tasks = [asyncio.ensure_future(controller.delay(name=name, url=x, timeout=timeout)) for x in targets]
+    alive, cost = True, 0
+    try:
+        # 任意一个目标失败即取消其余目标
+        for future in asyncio.as_completed(tasks):
+            value = await future
+            if value <= 0 or value > delay:
+                alive = False
+                break
+
+            cost = max(cost, value)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if alive and proxy.pop("chatgpt", False) and not name.endswith(utils.CHATGPT_FLAG):
+        # check for ChatGPT Web and API: https://chat.openai.com and https://api.openai.com
+        if await controller.delay(name=name, url="https://chat.openai.com/favicon.ico", timeout=5000, expected=200) > 0:
+            url = "https://api.openai.com/v1/engines"
+            if await controller.delay(name=name, url=url, timeout=timeout, expected=401) > 0:
+                proxy["name"] = f"{name}{utils.CHATGPT_FLAG}"
+
+    return cost if alive else -1
+
+
+async def batch_probe(
+    shards: list[tuple[str, list]],
+    timeout: int,
+    test_url: str,
+    delay: int,
+    strict: bool,
+    concurrency: int,
+    show_progress: bool,
+) -> list[list[int]]:
+    total = sum(len(x[1]) for x in shards)
+    progress = tqdm(total=total, desc="Progress", leave=True) if show_progress else None
+
+    async def run(controller: Controller, semaphore: asyncio.Semaphore, proxy: dict) -> int:
+        async with semaphore:
+            try:
+                return await probe(controller, proxy, timeout, test_url, delay, strict)
+            except Exception:
+                return -1
+            finally:
+                if progress is not None:
+                    progress.update(1)
+
+    async def run_shard(api_url: str, proxies: list) -> list[int]:
+        controller = Controller(api_url=api_url, size=concurrency)
+        semaphore = asyncio.Semaphore(concurrency)
+        try:
+            return await asyncio.gather(*[run(controller, semaphore, p) for p in proxies])
+        finally:
+            controller.close()
+
+    try:
+        return await asyncio.gather(*[run_shard(api_url, proxies) for api_url, proxies in shards])
+    finally:
+        if progress is not None:
+            progress.close()
+
+
+def check_shards(
+    shards: list[tuple[str, list]],
+    timeout: int,
+    test_url: str,
+    delay: int,
+    strict: bool = False,
+    concurrency: int = 64,
+    show_progress: bool = False,
+) -> list[list[int]]:
+    """
+    check each group of proxies through its own controller in parallel, concurrency applies to every controller,
+    returns delays of proxies grouped like shards, -1 means unavailable
+    """
+    if not shards:
+        return []
+
+    concurrency = max(1, concurrency)
+    starttime = time.time()
+
+    delays = asyncio.run(
+        batch_probe(
+            shards=shards,
+            timeout=timeout,
+            test_url=test_url,
+            delay=delay,
+            strict=strict,
+            concurrency=concurrency,
+            show_progress=show_progress,
+        )
+    )
+
+    count = sum(len(x[1]) for x in shards)
+    logger.info(
+        f"[Concurrent] asyncio execute [check] finished, count: {count}, shards: {len(shards)}, concurrency: {concurrency}, cost: {time.time()-starttime:.2f}s"
+    )
+
+    return delays
+
+
+def check(
+    proxies: list,
+    api_url: str,
+    timeout: int,
+    test_url: str,
+    delay: int,
+    strict: bool = False,
+    concurrency: int = 64,
+    show_progress: bool = False,
+) -> list[bool]:
+    """check proxies concurrently with asyncio, returns a mask with the same order as proxies"""
+    if not proxies:
+        return []
+
+    delays = check_shards(
+        shards=[(api_url, proxies)],
+        timeout=timeout,
+        test_url=test_url,
+        delay=delay,
+        strict=strict,
+        concurrency=concurrency,
+        show_progress=show_progress,
+    )
+
+    return [x > 0 for x in delays[0]]
+
+
+class LivenessCache(object):
+    """
+    liveness results keyed by proxy fingerprint, proxies verified within ttl are not probed again,
+    records not updated within retention are evicted
+    """
+
+    def __init__(self, filepath: str, ttl: float, retention: float = 7 * 24 * 3600, threshold: int = 3):
+        self.ttl = ttl
+        self.threshold = max(1, threshold)
+        self.store = storage.Store(filepath=filepath, ttl=retention)
+
+    def lookup(self, proxy: dict, delay: int = 0) -> int | None:
+        """
+        returns cached delay if the proxy is decided within ttl under the delay threshold of current run,
+        -1 means unavailable, None means need probe
+        """
+        record = self.store.get(clash.fingerprint(proxy))
+        if not record or self.ttl <= 0:
+            return None
+
+        now = time.time()
+        streak = record.get("streak", 0)
+        if streak <= 0 and now - record.get("success", 0) <= self.ttl:
+            # 缓存的延迟超过本次阈值时需重新检测
+            if 0 < delay < record.get("delay", 0):
+                return None
+
+            if proxy.pop("chatgpt", False) and record.get("gpt", False):
+                name = proxy.get("name", "")
+                if not name.endswith(utils.CHATGPT_FLAG):
+                    proxy["name"] = f"{name}{utils.CHATGPT_FLAG}"
+
+            return record.get("delay", 0) or 1
+
+        # 连续多次失败的节点在有效期内同样不再检测，除非本次阈值更宽松
+        limit = record.get("limit", 0)
+        if streak >= self.threshold and now - record.get("checked", 0) <= self.ttl and (limit <= 0 or delay <= limit):
+            return -1
+
+        return None
+
+    def record(self, proxy: dict, delay: int, limit: int = 0) -> None:
+        """save the probe result, limit is the delay threshold used by the probe"""
+        key, now = clash.fingerprint(proxy), time.time()
+        record = self.store.get(key) or {}
+
+        if delay > 0:
+            record.update(
+                delay=delay,
+                success=now,
+                streak=0,
+                gpt=str(proxy.get("name", "")).endswith(utils.CHATGPT_FLAG),
+            )
+        else:
+            record["streak"] = record.get("streak", 0) + 1
+            record["limit"] = limit
+
+        record["checked"] = now
+        self.store.set(key, record)
+
+    def save(self) -> bool:
+        return self.store.save()
+
+
+def liveness_cache(directory: str) -> LivenessCache | None:
+    """create liveness cache under directory if environment variable LIVENESS_CACHE_TTL (minutes) is positive"""
+    try:
+        ttl = float(os.environ.get("LIVENESS_CACHE_TTL", "0").strip() or 0)
+    except ValueError:
+        logger.warning("[CheckerWarn] invalid LIVENESS_CACHE_TTL, liveness cache is disabled")
+        ttl = 0
+
+    if ttl <= 0:
+        return None
+
+    return LivenessCache(filepath=os.path.join(directory, "liveness.json"), ttl=ttl * 60)
+
+
+class Cluster(object):
+    """multiple clash instances, each one loads a shard of proxies with its own mixed port and controller"""
+
+    # 每个实例至少负责的节点数量
+    MIN_SHARD_SIZE = 200
+
+    def __init__(self, workspace: str, binpath: str, shards: int = 0, cache: LivenessCache = None):
+        self.workspace = workspace
+        self.binpath = binpath
+        self.shards = shards if shards > 0 else (os.cpu_count() or 1)
+        self.cache = cache
+        self.processes = []
+        self.ports = []
+        self.controllers = []
+
+    def split(self, proxies: list) -> list[list]:
+        num = max(1, min(self.shards, math.ceil(len(proxies) / self.MIN_SHARD_SIZE)))
+        size = math.ceil(len(proxies) / num)
+        return [proxies[i : i + size] for i in range(0, len(proxies), size)]
+
+    def home(self, index: int) -> str:
+        if index == 0:
+            return self.workspace
+
+        directory = os.path.join(self.workspace, "shards", str(index))
+        os.makedirs(directory, exist_ok=True)
+
+        # 避免各实例争抢同一缓存文件，同时复用 geoip 数据库
+        mmdb = os.path.join(self.workspace, "Country.mmdb")
+        target = os.path.join(directory, "Country.mmdb")
+        if os.path.isfile(mmdb) and not os.path.exists(target):
+            try:
+                os.link(mmdb, target)
+            except OSError:
+                shutil.copyfile(mmdb, target)
+
+        return directory
+
+    def load(self, proxies: list) -> list[list]:
+        """
+        load proxies into running instances through controller's hot reload,
+        instances are only started when there are not enough of them
+        """
+        shards, filename = self.split(proxies), "config.yaml"
+        started = len(self.processes)
+
+        for i, items in enumerate(shards):
+            directory = self.home(i)
+            if i < started and self.processes[i].poll() is None:
+                clash.generate_shard_config(directory, items, filename, self.ports[i], self.controllers[i])
+                self.reload(controller=self.controllers[i], filepath=os.path.join(directory, filename))
+                continue
+
+            if i == 0:
+                mixed_port, controller = 7890, clash.EXTERNAL_CONTROLLER
+            else:
+                mixed_port, controller = utils.free_port(), f"127.0.0.1:{utils.free_port()}"
+
+            clash.generate_shard_config(directory, items, filename, mixed_port, controller)
+
+            utils.chmod(self.binpath)
+            process = subprocess.Popen([self.binpath, "-d", directory, "-f", os.path.join(directory, filename)])
+
+            if i < started:
+                # 实例已退出，原位置重新启动
+                self.processes[i], self.ports[i], self.controllers[i] = process, mixed_port, controller
+            else:
+                self.processes.append(process)
+                self.ports.append(mixed_port)
+                self.controllers.append(controller)
+
+        if len(self.processes) > started:
+            logger.info(f"startup clash now, workspace: {self.workspace}, instances: {len(self.processes)}")
+
+        return shards
+
+    @staticmethod
+    def reload(controller: str, filepath: str) -> None:
+        data = json.dumps({"path": filepath}).encode(encoding="utf8")
+        request = urllib.request.Request(
+            url=f"http://{controller}/configs?force=true",
+            data=data,
+            headers={"Content-Type": "application/json"},
+            method="PUT",
+        )
+
+        try:
+            urllib.request.urlopen(request, timeout=30)
+        except Exception as e:
+            # 交由 wait 判断是否加载成功
+            logger.error(f"reload clash config failed, controller: {controller}, message: {str(e)}")
+
+    def check(
+        self,
+        proxies: list,
+        timeout: int,
+        test_url: str,
+        delay: int,
+        strict: bool = False,
+        concurrency: int = 64,
+        show_progress: bool = False,
+        ready_timeout: float = 30,
+    ) -> list[bool]:
+        """load proxies and check them, returns a mask with the same order as proxies"""
+        if not proxies:
+            return []
+
+        # 有效期内已确定结果的节点直接复用缓存
+        delays = [self.cache.lookup(p, delay=delay) if self.cache else None for p in proxies]
+        indexes = [i for i, x in enumerate(delays) if x is None]
+        if len(indexes) < len(proxies):
+            logger.info(f"[Checker] reuse cached liveness results: {len(proxies) - len(indexes)}/{len(proxies)}")
+
+        if indexes:
+            pendings = [proxies[i] for i in indexes]
+            groups = self.load(proxies=pendings)
+            self.wait(shards=groups, timeout=ready_timeout)
+
+            # 总并发数平均分配到各个实例
+            results = check_shards(
+                shards=list(zip(self.controllers, groups)),
+                timeout=timeout,
+                test_url=test_url,
+                delay=delay,
+                strict=strict,
+                concurrency=math.ceil(concurrency / len(groups)),
+                show_progress=show_progress,
+            )
+
+            for i, value in zip(indexes, itertools.chain.from_iterable(results)):
+                delays[i] = value
+                if self.cache:
+                    self.cache.record(proxies[i], value, limit=delay)
+
+        return [x > 0 for x in delays]
+
+    def wait(self, shards: list[list], timeout: float = 30) -> None:
+        """block until every instance serves its controller and has loaded all proxies of its shard"""
+        deadline, interval = time.time() + max(timeout, 1), 0.1
+        pendings = {i: set(p.get("name", "") for p in items) for i, items in enumerate(shards)}
+
+        while pendings:
+            for i in list(pendings.keys()):
+                if self.processes[i].poll() is not None:
+                    raise RuntimeError(
+                        f"clash exited unexpectedly with code {self.processes[i].returncode}, controller: {self.controllers[i]}"
+                    )
+
+                if self.ready(controller=self.controllers[i], names=pendings[i]):
+                    pendings.pop(i)
+
+            if not pendings:
+                break
+
+            if time.time() >= deadline:
+                controllers = [self.controllers[i] for i in pendings]
+                raise TimeoutError(f"clash is not ready after {timeout}s, controllers: {controllers}")
+
+            time.sleep(interval)
+            interval = min(interval * 1.5, 2)
+
+    @staticmethod
+    def ready(controller: str, names: set) -> bool:
+        try:
+            response = urllib.request.urlopen(f"http://{controller}/version", timeout=2)
+            if response.getcode() != 200:
+                return False
+
+            response = urllib.request.urlopen(f"http://{controller}/proxies", timeout=5)
+            proxies = json.loads(response.read()).get("proxies", {})
+            return names.issubset(proxies.keys())
+        except Exception:
+            return False
+
+    def stop(self) -> None:
+        for process in self.processes:
+            try:
+                process.terminate()
+            except:
+                logger.error(f"terminate clash process error, pid: {process.pid}")
+
+        self.processes, self.ports, self.controllers = [], [], []
+        shutil.rmtree(os.path.join(self.workspace, "shards"), ignore_errors=True)
+
+        if self.cache:
+            self.cache.save()
+
+
+def liveness(
+    workspace: str,
+    binpath: str,
+    proxies: list,
+    timeout: int,
+    test_url: str,
+    delay: int,
+    strict: bool = False,
+    concurrency: int = 64,
+    shards: int = 0,
+    show_progress: bool = False,
+    ready_timeout: float = 30,
+    cache: LivenessCache = None,
+) -> list[bool]:
+    """
+    start clash instances for proxies and check them, returns a mask with the same order as proxies,
+    raise TimeoutError if clash is not ready within ready_timeout seconds
+    """
+    if not proxies:
+        return []
+
+    cluster = Cluster(workspace=workspace, binpath=binpath, shards=shards, cache=cache)
+    try:
+        return cluster.check(
+            proxies=proxies,
+            timeout=timeout,
+            test_url=test_url,
+            delay=delay,
+            strict=strict,
+            concurrency=concurrency,
+            show_progress=show_progress,
+            ready_timeout=ready_timeout,
+        )
+    finally:
+        cluster.stop()
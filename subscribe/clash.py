@@ -3,21 +3,21 @@
 # @Author  : wzdnzd
 # @Time    : 2022-07-15
 
-import itertools
+import hashlib
 import json
 import os
 import random
 import re
 import ssl
 import string
+import typing
 import urllib
 import urllib.parse
 import urllib.request
-from collections import defaultdict
 
 import executable
 import utils
-import yaml
+import yamlio
 
 CTX = ssl.create_default_context()
 CTX.check_hostname = False
@@ -33,63 +33,78 @@ EXTERNAL_CONTROLLER = "127.0.0.1:9090"
 
 
 def generate_config(path: str, proxies: list, filename: str) -> list:
-    os.makedirs(path, exist_ok=True)
     external_config = filter_proxies(proxies)
+    write_config(path=path, filename=filename, external_config=external_config)
+
+    return external_config.get("proxies", [])
+
+
+def write_config(
+    path: str,
+    filename: str,
+    external_config: dict,
+    mixed_port: int = 7890,
+    controller: str = EXTERNAL_CONTROLLER,
+) -> None:
+    os.makedirs(path, exist_ok=True)
     config = {
-        "mixed-port": 7890,
-        "external-controller": EXTERNAL_CONTROLLER,
+        "mixed-port": mixed_port,
+        "external-controller": controller,
         "mode": "Rule",
         "log-level": "silent",
     }
 
     config.update(external_config)
     with open(os.path.join(path, filename), "w+", encoding="utf8") as f:
-        yaml.dump(config, f, allow_unicode=True)
+        yamlio.dump(config, f)
 
-    return config.get("proxies", [])
 
+def generate_shard_config(path: str, proxies: list, filename: str, mixed_port: int, controller: str) -> None:
+    """write config for proxies that have been deduplicated by filter_proxies"""
+    config = assemble(proxies=proxies, names=[p.get("name", "") for p in proxies])
+    write_config(path=path, filename=filename, external_config=config, mixed_port=mixed_port, controller=controller)
 
-def filter_proxies(proxies: list) -> dict:
-    config = {
-        "proxies": [],
+
+def assemble(proxies: list, names: list) -> dict:
+    return {
+        "proxies": proxies,
         "proxy-groups": [
             {
                 "name": "automatic",
                 "type": "url-test",
-                "proxies": [],
+                "proxies": list(names),
                 "url": "https://www.google.com/favicon.ico",
                 "interval": 300,
             },
-            {"name": "🌐 Proxy", "type": "select", "proxies": ["automatic"]},
+            {"name": "🌐 Proxy", "type": "select", "proxies": ["automatic"] + list(names)},
         ],
         "rules": ["MATCH,🌐 Proxy"],
     }
 
+
+def filter_proxies(proxies: list) -> dict:
     # 按名字排序方便在节点相同时优先保留名字靠前的
     proxies.sort(key=lambda p: str(p.get("name", "")))
-    unique_proxies, hosts = [], defaultdict(list)
+    keys, groups = set(), {}
 
     for item in proxies:
-        if not proxies_exists(item, hosts):
-            unique_proxies.append(item)
-            key = f"{item.get('server')}:{item.get('port')}"
-            hosts[key].append(item)
-
-    # 防止多个代理节点名字相同导致clash配置错误
-    groups, unique_names = {}, set()
-    for key, group in itertools.groupby(unique_proxies, key=lambda p: p.get("name", "")):
-        items = groups.get(key, [])
-        items.extend(list(group))
-        groups[key] = items
+        if not item or identity(item) in keys:
+            continue
+
+        keys.update(identities(item))
+
+        # 防止多个代理节点名字相同导致clash配置错误
+        groups.setdefault(item.get("name", ""), []).append(item)
 
     # 优先保留不重复的节点的名字
     unique_proxies = sorted(groups.values(), key=lambda x: len(x))
+    unique_names = set(items[0].get("name") for items in unique_proxies if len(items) <= 1)
+
     proxies.clear()
     for items in unique_proxies:
         size = len(items)
         if size <= 1:
             proxies.extend(items)
-            unique_names.add(items[0].get("name"))
             continue
         for i in range(size):
             item = items[i]
@@ -112,54 +127,88 @@ def filter_proxies(proxies: list) -> dict:
     for _ in range(3):
         random.shuffle(proxies)
 
-    config["proxies"] += proxies
-    config["proxy-groups"][0]["proxies"] += list(unique_names)
-    config["proxy-groups"][1]["proxies"] += list(unique_names)
-
-    return config
-
+    return assemble(proxies=list(proxies), names=list(unique_names))
 
-def proxies_exists(proxy: dict, hosts: dict) -> bool:
-    if not proxy:
-        return True
-    if not hosts:
-        return False
-
-    key = f"{proxy.get('server')}:{proxy.get('port')}"
-    proxies = hosts.get(key, [])
-
-    if not proxies:
-        return False
 
+def hashable(value: object) -> object:
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def identity(proxy: dict) -> tuple | None:
+    """
+    key used to look up whether an equivalent proxy has been kept, None means never duplicated,
+    a proxy is duplicated if one of the kept proxies behind the same server and port has the same credential
+    """
+    host = f"{proxy.get('server')}:{proxy.get('port')}"
     protocol = proxy.get("type", "")
+
     if protocol == "http" or protocol == "socks5":
-        return True
-    elif protocol == "ss" or protocol == "trojan":
-        return any(p.get("password", "") == proxy.get("password", "") for p in proxies)
+        return (host,)
+    elif protocol == "ss" or protocol == "trojan" or protocol == "hysteria2":
+        return (host, "password", hashable(proxy.get("password", "")))
     elif protocol == "ssr":
-        return any(
-            str(p.get("protocol-param", "")).lower() == str(proxy.get("protocol-param", "")).lower() for p in proxies
-        )
+        return (host, "protocol-param", str(proxy.get("protocol-param", "")).lower())
     elif protocol == "vmess" or protocol == "vless":
-        return any(p.get("uuid", "") == proxy.get("uuid", "") for p in proxies)
+        return (host, "uuid", hashable(proxy.get("uuid", "")))
     elif protocol == "snell":
-        return any(p.get("psk", "") == proxy.get("psk", "") for p in proxies)
+        return (host, "psk", hashable(proxy.get("psk", "")))
     elif protocol == "tuic":
         if proxy.get("token", ""):
-            return any(p.get("token", "") == proxy.get("token", "") for p in proxies)
-        return any(p.get("uuid", "") == proxy.get("uuid", "") for p in proxies)
-    elif protocol == "hysteria2":
-        return any(p.get("password", "") == proxy.get("password", "") for p in proxies)
+            return (host, "token", hashable(proxy.get("token", "")))
+        return (host, "uuid", hashable(proxy.get("uuid", "")))
     elif protocol == "hysteria":
         key = "auth-str" if "auth-str" in proxy else "auth_str"
-        value = proxy.get(key, "")
-        for p in proxies:
-            if "auth-str" in p and p.get("auth-str", "") == value:
-                return True
-            if "auth_str" in p and p.get("auth_str", "") == value:
-                return True
+        return (host, "auth", hashable(proxy.get(key, "")))
+
+    return None
+
+
+def identities(proxy: dict) -> list[tuple]:
+    """all keys a kept proxy can be matched by, credentials of any protocol are compared behind the same host"""
+    host = f"{proxy.get('server')}:{proxy.get('port')}"
+    keys = [
+        (host,),
+        (host, "password", hashable(proxy.get("password", ""))),
+        (host, "protocol-param", str(proxy.get("protocol-param", "")).lower()),
+        (host, "uuid", hashable(proxy.get("uuid", ""))),
+        (host, "psk", hashable(proxy.get("psk", ""))),
+        (host, "token", hashable(proxy.get("token", ""))),
+    ]
+
+    for key in ["auth-str", "auth_str"]:
+        if key in proxy:
+            keys.append((host, "auth", hashable(proxy.get(key, ""))))
+
+    return keys
+
+
+def credential(proxy: dict) -> str:
+    """the credential field that identifies a proxy of its protocol"""
+    protocol = proxy.get("type", "")
+    if protocol in ["ss", "trojan", "hysteria2"]:
+        return str(proxy.get("password", ""))
+    elif protocol == "ssr":
+        return str(proxy.get("protocol-param", "")).lower()
+    elif protocol in ["vmess", "vless"]:
+        return str(proxy.get("uuid", ""))
+    elif protocol == "snell":
+        return str(proxy.get("psk", ""))
+    elif protocol == "tuic":
+        return str(proxy.get("token", "") or proxy.get("uuid", ""))
+    elif protocol == "hysteria":
+        return str(proxy.get("auth-str", proxy.get("auth_str", "")))
+
+    return ""
 
-    return False
+
+def fingerprint(proxy: dict) -> str:
+    """stable identity of a proxy made of type, server, port and credential, independent of its name"""
+    text = f"{proxy.get('type', '')}|{proxy.get('server', '')}|{proxy.get('port', '')}|{credential(proxy)}"
+    return hashlib.md5(text.encode("utf8")).hexdigest()
 
 
 SS_SUPPORTED_CIPHERS = [
@@ -246,353 +295,501 @@ def check_ports(port: str, ranges: str, protocol: str) -> bool:
     return True
 
 
-def verify(item: dict, mihomo: bool = True) -> bool:
-    if not item or type(item) != dict or "type" not in item:
+# 带宽，如 100、100 Mbps
+BANDWIDTH_REGEX = re.compile(r"^\d+(\.\d+)?(\s+)?([kmgt]?bps)?$", flags=re.I)
+
+IPV4_REGEX = re.compile(r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$")
+
+IPV6_REGEX = re.compile(r"^(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}$")
+
+# 标准格式的 uuid，其余格式交由 uuid 模块判断
+UUID_REGEX = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+# 布尔类型的取值，0 和 1 同样允许
+BOOLEANS = (False, True)
+
+VLESS_NETWORKS = frozenset(["ws", "tcp", "grpc", "http", "h2"])
+
+
+def typed(kind: type, *keys: str) -> typing.Callable[[dict], str]:
+    """properties must be exactly of the kind if present"""
+
+    def rule(item: dict) -> str:
+        for key in keys:
+            if key in item and type(item[key]) != kind:
+                return f"invalid-{key}"
+        return ""
+
+    return rule
+
+
+def boolean(*keys: str) -> typing.Callable[[dict], str]:
+    def rule(item: dict) -> str:
+        for key in keys:
+            if key in item and item[key] not in BOOLEANS:
+                return f"invalid-{key}"
+        return ""
+
+    return rule
+
+
+def numeric(*keys: str) -> typing.Callable[[dict], str]:
+    def rule(item: dict) -> str:
+        for key in keys:
+            if key in item and not utils.is_number(item[key]):
+                return f"invalid-{key}"
+        return ""
+
+    return rule
+
+
+def choice(key: str, options: list, reason: str = "", strip: bool = False) -> typing.Callable[[dict], str]:
+    """the property must be one of options if present"""
+    options, reason = frozenset(options), reason or f"invalid-{key}"
+
+    def rule(item: dict) -> str:
+        if key not in item:
+            return ""
+
+        value = utils.trim(item.get(key, "")) if strip else item[key]
+        return "" if value in options else reason
+
+    return rule
+
+
+def required(key: str, options: list, reason: str) -> typing.Callable[[dict], str]:
+    options = frozenset(options)
+
+    def rule(item: dict) -> str:
+        return "" if item[key] in options else reason
+
+    return rule
+
+
+def valid_ws_opts(opts: dict) -> bool:
+    if not opts or type(opts) != dict:
+        return False
+    if "path" in opts and type(opts["path"]) != str:
         return False
 
-    try:
-        # name must be string
-        name = str(item.get("name", "")).strip().upper()
-        if not name:
-            return False
-        item["name"] = name
+    return "headers" not in opts or type(opts["headers"]) == dict
 
-        # server must be string
-        server = str(item.get("server", "")).strip().lower()
-        if not server:
-            return False
-        item["server"] = server
 
-        # port must be valid port number
-        if not check_ports(item.get("port", ""), item.get("ports", None), item.get("type", "")):
-            return False
+def valid_grpc_opts(opts: dict) -> bool:
+    if not opts or type(opts) != dict:
+        return False
+
+    return "grpc-service-name" in opts and type(opts["grpc-service-name"]) == str
+
+
+def valid_h2_opts(opts: dict) -> bool:
+    if not opts or type(opts) != dict:
+        return False
 
-        # check uuid
-        if "uuid" in item and not utils.verify_uuid(item.get("uuid")):
+    return "host" not in opts or type(opts["host"]) == list
+
+
+def valid_http_opts(opts: dict) -> bool:
+    if not opts or type(opts) != dict:
+        return False
+    if "path" in opts and type(opts["path"]) != list:
+        return False
+    if "headers" in opts:
+        headers = opts.get("headers", {})
+        if not isinstance(headers, dict):
             return False
 
-        # check servername and sni
-        for attribute in ["servername", "sni"]:
-            if attribute in item and type(item[attribute]) != str:
+        for key, value in headers.items():
+            if not isinstance(key, str):
                 return False
-
-        for attribute in ["udp", "tls", "skip-cert-verify", "tfo"]:
-            if attribute in item and item[attribute] not in [False, True]:
+            if key.lower() == "host" and not isinstance(value, list):
                 return False
 
-        authentication = "password"
+    return True
 
-        if item["type"] == "ss":
-            ciphers = SS_SUPPORTED_CIPHERS if not mihomo else SS_SUPPORTED_CIPHERS + MIHOMO_SS_SUPPORTED_CIPHERS
-            if item["cipher"] not in ciphers:
-                return False
 
-            plugin = item.get("plugin", "")
+def transport(
+    options: dict[str, tuple[list, typing.Callable[[dict], bool]]], default: str, strip: bool, exclusive: bool
+) -> typing.Callable[[dict], str]:
+    """
+    options maps transport options key to the networks it can be used with and its validator,
+    only the first present key is checked if exclusive
+    """
+    options = {k: (frozenset(v[0]), v[1]) for k, v in options.items()}
+
+    def rule(item: dict) -> str:
+        network = utils.trim(item.get("network", default)) if strip else item.get("network", default)
+        for key, (networks, validate) in options.items():
+            if key not in item:
+                continue
+            if network not in networks or not validate(item.get(key, {})):
+                return f"invalid-{key}"
+            if exclusive:
+                break
 
-            # clash: https://clash.wiki/configuration/outbound.html#shadowsocks
-            # mihomo: https://wiki.metacubex.one/config/proxies/ss/#plugin
-            all_plugins, meta_plugins = ["", "obfs", "v2ray-plugin"], ["shadow-tls", "restls"]
-            if mihomo:
-                all_plugins.extend(meta_plugins)
+        return ""
 
-            if plugin not in all_plugins:
-                return False
-            if plugin:
-                option = item.get("plugin-opts", {}).get("mode", "")
-                if plugin not in meta_plugins and (
-                    not option
-                    or (plugin == "v2ray-plugin" and option != "websocket")
-                    or (plugin == "obfs" and option not in ["tls", "http"])
-                ):
-                    return False
-        elif item["type"] == "ssr":
-            if item["cipher"] not in SS_SUPPORTED_CIPHERS:
-                return False
-            if item["obfs"] not in SSR_SUPPORTED_OBFS:
-                return False
-            if item["protocol"] not in SSR_SUPPORTED_PROTOCOL:
-                return False
-        elif item["type"] == "vmess":
-            authentication = "uuid"
+    return rule
 
-            # clash: https://clash.wiki/configuration/outbound.html#vmess
-            # mihomo: https://wiki.metacubex.one/config/proxies/vmess/#network
-            network, network_opts = item.get("network", "ws"), ["ws", "h2", "http", "grpc"]
-            if mihomo:
-                network_opts.append("httpupgrade")
 
-            if network not in network_opts:
-                return False
-            if item.get("network", "ws") in ["h2", "grpc"] and not item.get("tls", False):
-                return False
+def normalize(item: dict) -> str:
+    """rules shared by all protocols, name and server are normalized"""
+    # name must be string
+    name = str(item.get("name", "")).strip().upper()
+    if not name:
+        return "invalid-name"
+    item["name"] = name
 
-            # mihomo: https://wiki.metacubex.one/config/proxies/vmess/#cipher
-            ciphers = VMESS_SUPPORTED_CIPHERS + ["zero"] if mihomo else VMESS_SUPPORTED_CIPHERS
-            if item["cipher"] not in ciphers:
-                return False
-            if "alterId" not in item or not utils.is_number(item["alterId"]):
-                return False
+    # server must be string
+    server = str(item.get("server", "")).strip().lower()
+    if not server:
+        return "invalid-server"
+    item["server"] = server
 
-            if "h2-opts" in item:
-                if network != "h2":
-                    return False
-
-                h2_opts = item.get("h2-opts", {})
-                if not h2_opts or type(h2_opts) != dict:
-                    return False
-                if "host" in h2_opts and type(h2_opts["host"]) != list:
-                    return False
-            elif "http-opts" in item:
-                if network != "http":
-                    return False
-
-                http_opts = item.get("http-opts", {})
-                if not http_opts or type(http_opts) != dict:
-                    return False
-                if "path" in http_opts and type(http_opts["path"]) != list:
-                    return False
-                if "headers" in http_opts:
-                    headers = http_opts.get("headers", {})
-                    if not isinstance(headers, dict):
-                        return False
-
-                    for key, value in headers.items():
-                        if not isinstance(key, str):
-                            return False
-                        if key.lower() == "host" and not isinstance(value, list):
-                            return False
-            elif "ws-opts" in item:
-                if network != "ws" and network != "httpupgrade":
-                    return False
-
-                ws_opts = item.get("ws-opts", {})
-                if not ws_opts or type(ws_opts) != dict:
-                    return False
-                if "path" in ws_opts and type(ws_opts["path"]) != str:
-                    return False
-                if "headers" in ws_opts and type(ws_opts["headers"]) != dict:
-                    return False
-            elif "grpc-opts" in item:
-                if network != "grpc":
-                    return False
-                if not mihomo:
-                    return False
-
-                grpc_opts = item.get("grpc-opts", {})
-                if not grpc_opts or type(grpc_opts) != dict:
-                    return False
-                if "grpc-service-name" not in grpc_opts or type(grpc_opts["grpc-service-name"]) != str:
-                    return False
-        elif item["type"] == "trojan":
-            network = utils.trim(item.get("network", ""))
-
-            if "alpn" in item and type(item["alpn"]) != list:
-                return False
-            if "ws-opts" in item:
-                if network != "ws":
-                    return False
-
-                ws_opts = item.get("ws-opts", {})
-                if not ws_opts or type(ws_opts) != dict:
-                    return False
-                if "path" in ws_opts and type(ws_opts["path"]) != str:
-                    return False
-                if "headers" in ws_opts and type(ws_opts["headers"]) != dict:
-                    return False
-            if "grpc-opts" in item:
-                if network != "grpc":
-                    return False
-
-                grpc_opts = item.get("grpc-opts", {})
-                if not grpc_opts or type(grpc_opts) != dict:
-                    return False
-                if "grpc-service-name" not in grpc_opts or type(grpc_opts["grpc-service-name"]) != str:
-                    return False
-            if "flow" in item and (not mihomo or item["flow"] not in ["xtls-rprx-origin", "xtls-rprx-direct"]):
-                return False
-        elif item["type"] == "snell":
-            authentication = "psk"
-            if "version" in item and not item["version"].isdigit():
-                return False
-            if "obfs-opts" in item:
-                obfs_opts = item.get("obfs-opts", {})
-                if not obfs_opts or type(obfs_opts) != dict:
-                    return False
-                if "mode" in obfs_opts:
-                    mode = utils.trim(obfs_opts.get("mode", ""))
-                    if mode not in ["http", "tls"]:
-                        return False
-        elif item["type"] == "http" or item["type"] == "socks5":
-            authentication = "userpass"
-        elif mihomo and item["type"] in SPECIAL_PROTOCOLS:
-            if item["type"] == "vless":
-                authentication = "uuid"
-                network = utils.trim(item.get("network", "tcp"))
-
-                # mihomo: https://wiki.metacubex.one/config/proxies/vless/#network
-                network_opts = ["ws", "tcp", "grpc", "http", "h2"] if mihomo else ["ws", "tcp", "grpc"]
-
-                if network not in network_opts:
-                    return False
-                if "flow" in item:
-                    flow = utils.trim(item.get("flow", ""))
-
-                    # if flow and flow not in XTLS_FLOWS:
-                    if flow and flow != "xtls-rprx-vision":
-                        return False
-                if "ws-opts" in item:
-                    if network != "ws":
-                        return False
-
-                    ws_opts = item.get("ws-opts", {})
-                    if not ws_opts or type(ws_opts) != dict:
-                        return False
-                    if "path" in ws_opts and type(ws_opts["path"]) != str:
-                        return False
-                    if "headers" in ws_opts and type(ws_opts["headers"]) != dict:
-                        return False
-                if "grpc-opts" in item:
-                    if network != "grpc":
-                        return False
-
-                    grpc_opts = item.get("grpc-opts", {})
-                    if not grpc_opts or type(grpc_opts) != dict:
-                        return False
-                    if "grpc-service-name" not in grpc_opts or type(grpc_opts["grpc-service-name"]) != str:
-                        return False
-                if "reality-opts" in item:
-                    reality_opts = item.get("reality-opts", {})
-                    if not reality_opts or type(reality_opts) != dict:
-                        return False
-                    if "public-key" not in reality_opts or type(reality_opts["public-key"]) != str:
-                        return False
-                    if "short-id" in reality_opts:
-                        short_id = reality_opts["short-id"]
-                        if type(short_id) != str:
-                            if utils.is_number(short_id):
-                                short_id = str(short_id)
-                            else:
-                                return False
-
-                        if len(short_id) != 8 or not is_hex(short_id):
-                            return False
-
-                        reality_opts["short-id"] = short_id
-            elif item["type"] == "tuic":
-                # mihomo: https://wiki.metacubex.one/config/proxies/tuic
-                token = wrap(item.get("token", ""))
-                uuid = wrap(item.get("uuid", ""))
-                password = wrap(item.get("password", ""))
-                if not token and not uuid and not password:
-                    return False
-                if token and uuid and password:
-                    return False
-                if token:
-                    authentication = "token"
-                    item["token"] = token
-                else:
-                    if not uuid:
-                        return False
-
-                    authentication = "uuid"
-                    if password:
-                        item["password"] = password
-
-                for property in ["disable-sni", "reduce-rtt", "fast-open"]:
-                    if property in item and item[property] not in [False, True]:
-                        return False
-                for property in [
-                    "heartbeat-interval",
-                    "request-timeout",
-                    "max-udp-relay-packet-size",
-                    "max-open-streams",
-                ]:
-                    if property in item and not utils.is_number(item[property]):
-                        return False
-                if "udp-relay-mode" in item and item["udp-relay-mode"] not in ["native", "quic"]:
-                    return False
-                if "congestion-controller" in item and item["congestion-controller"] not in [
-                    "cubic",
-                    "bbr",
-                    "new_reno",
-                ]:
-                    return False
-                if "alpn" in item and type(item["alpn"]) != list:
-                    return False
-                if "ip" in item:
-                    ip = utils.trim(item.get("ip", ""))
-
-                    # ip must be valid ipv4 or ipv6 address
-                    if not re.match(r"^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$", ip) and not re.match(
-                        r"^(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}$", ip
-                    ):
-                        return False
+    # port must be valid port number
+    port, ranges = item.get("port", ""), item.get("ports", None)
+    if type(port) == int and not ranges:
+        if not 0 < port <= 65535:
+            return "invalid-port"
+    elif not check_ports(port, ranges, item.get("type", "")):
+        return "invalid-port"
+
+    # check uuid
+    if "uuid" in item:
+        uuid = item.get("uuid")
+        if not (type(uuid) == str and UUID_REGEX.fullmatch(uuid)) and not utils.verify_uuid(uuid):
+            return "invalid-uuid"
+
+    # check servername and sni
+    for key in ["servername", "sni"]:
+        if key in item and type(item[key]) != str:
+            return f"invalid-{key}"
+
+    for key in ["udp", "tls", "skip-cert-verify", "tfo"]:
+        if key in item and item[key] not in BOOLEANS:
+            return f"invalid-{key}"
+
+    return ""
+
+
+def ss_plugin(mihomo: bool) -> typing.Callable[[dict], str]:
+    # clash: https://clash.wiki/configuration/outbound.html#shadowsocks
+    # mihomo: https://wiki.metacubex.one/config/proxies/ss/#plugin
+    meta_plugins = frozenset(["shadow-tls", "restls"])
+    all_plugins = frozenset(["", "obfs", "v2ray-plugin"]) | (meta_plugins if mihomo else frozenset())
+
+    def rule(item: dict) -> str:
+        plugin = item.get("plugin", "")
+        if plugin not in all_plugins:
+            return "unsupported-plugin"
+        if plugin and plugin not in meta_plugins:
+            option = item.get("plugin-opts", {}).get("mode", "")
+            if (
+                not option
+                or (plugin == "v2ray-plugin" and option != "websocket")
+                or (plugin == "obfs" and option not in ["tls", "http"])
+            ):
+                return "invalid-plugin-opts"
+
+        return ""
+
+    return rule
+
+
+def vmess_network(mihomo: bool) -> typing.Callable[[dict], str]:
+    # clash: https://clash.wiki/configuration/outbound.html#vmess
+    # mihomo: https://wiki.metacubex.one/config/proxies/vmess/#network
+    networks = frozenset(["ws", "h2", "http", "grpc"] + (["httpupgrade"] if mihomo else []))
+
+    def rule(item: dict) -> str:
+        network = item.get("network", "ws")
+        if network not in networks:
+            return "unsupported-network"
+        if network in ["h2", "grpc"] and not item.get("tls", False):
+            return "invalid-tls"
+
+        return ""
+
+    return rule
+
+
+def vmess_alter_id(item: dict) -> str:
+    return "" if "alterId" in item and utils.is_number(item["alterId"]) else "invalid-alterId"
+
+
+def trojan_flow(mihomo: bool) -> typing.Callable[[dict], str]:
+    flows = frozenset(["xtls-rprx-origin", "xtls-rprx-direct"])
+
+    def rule(item: dict) -> str:
+        return "invalid-flow" if "flow" in item and (not mihomo or item["flow"] not in flows) else ""
+
+    return rule
+
+
+def snell_version(item: dict) -> str:
+    return "invalid-version" if "version" in item and not item["version"].isdigit() else ""
+
+
+def snell_obfs(item: dict) -> str:
+    if "obfs-opts" not in item:
+        return ""
+
+    obfs_opts = item.get("obfs-opts", {})
+    if not obfs_opts or type(obfs_opts) != dict:
+        return "invalid-obfs-opts"
+    if "mode" in obfs_opts and utils.trim(obfs_opts.get("mode", "")) not in ["http", "tls"]:
+        return "invalid-obfs-opts"
+
+    return ""
+
+
+def vless_network(item: dict) -> str:
+    # mihomo: https://wiki.metacubex.one/config/proxies/vless/#network
+    network = utils.trim(item.get("network", "tcp"))
+    return "" if network in VLESS_NETWORKS else "unsupported-network"
+
+
+def vless_flow(item: dict) -> str:
+    # if flow and flow not in XTLS_FLOWS:
+    flow = utils.trim(item.get("flow", "")) if "flow" in item else ""
+    return "invalid-flow" if flow and flow != "xtls-rprx-vision" else ""
+
+
+def vless_reality(item: dict) -> str:
+    if "reality-opts" not in item:
+        return ""
+
+    reality_opts = item.get("reality-opts", {})
+    if not reality_opts or type(reality_opts) != dict:
+        return "invalid-reality-opts"
+    if "public-key" not in reality_opts or type(reality_opts["public-key"]) != str:
+        return "invalid-reality-opts"
+    if "short-id" in reality_opts:
+        short_id = reality_opts["short-id"]
+        if type(short_id) != str:
+            if utils.is_number(short_id):
+                short_id = str(short_id)
             else:
-                for property in ["up", "down"]:
-                    if property not in item:
-                        continue
-
-                    traffic = item.get(property, "")
-                    if traffic and utils.is_number(traffic):
-                        traffic = str(traffic)
-
-                    if not re.match(r"^\d+(\.\d+)?(\s+)?([kmgt]?bps)?$", utils.trim(traffic), flags=re.I):
-                        return False
-
-                if "alpn" in item and type(item["alpn"]) != list:
-                    return False
-                for property in ["ca", "ca-str"]:
-                    if property in item and type(item[property]) != str:
-                        return False
-                if item["type"] == "hysteria2":
-                    # mihomo: https://wiki.metacubex.one/config/proxies/hysteria2
-                    authentication = "password"
-                    if "obfs" in item:
-                        obfs = utils.trim(item.get("obfs", ""))
-                        if obfs != "salamander":
-                            return False
-                    if "obfs-password" in item and type(item["obfs-password"]) != str:
-                        return False
-                else:
-                    # mihomo: https://wiki.metacubex.one/config/proxies/hysteria
-                    authentication = "auth-str" if "auth-str" in item else "auth_str"
-
-                    for property in ["auth-str", "auth_str", "obfs"]:
-                        if property in item and type(item[property]) != str:
-                            return False
-                    for property in ["disable_mtu_discovery", "fast-open"]:
-                        if property in item and item[property] not in [False, True]:
-                            return False
-                    if "protocol" in item:
-                        protocol = utils.trim(item.get("protocol", ""))
-                        if protocol not in ["udp", "wechat-video", "faketcp"]:
-                            return False
-                    if "ports" in item:
-                        ports = utils.trim(item.get("ports", [])).split(",")
-                        if not ports:
-                            return False
-                        for port in ports:
-                            # port must be valid port number
-                            if not utils.is_number(port) or int(port) <= 0 or int(port) > 65535:
-                                return False
-                    for property in ["recv_window_conn", "recv-window-conn", "recv_window", "recv-window"]:
-                        if property not in item:
-                            continue
-                        window = item.get(property, "")
-                        if not utils.is_number(window):
-                            return False
-        else:
-            return False
+                return "invalid-reality-opts"
+
+        if len(short_id) != 8 or not is_hex(short_id):
+            return "invalid-reality-opts"
+
+        reality_opts["short-id"] = short_id
+
+    return ""
+
+
+def tuic_credential(item: dict) -> str:
+    # mihomo: https://wiki.metacubex.one/config/proxies/tuic
+    token = wrap(item.get("token", ""))
+    uuid = wrap(item.get("uuid", ""))
+    password = wrap(item.get("password", ""))
+    if not token and not uuid and not password:
+        return "missing-credential"
+    if token and uuid and password:
+        return "ambiguous-credential"
+    if token:
+        item["token"] = token
+    else:
+        if not uuid:
+            return "missing-uuid"
+        if password:
+            item["password"] = password
+
+    return ""
+
+
+def tuic_ip(item: dict) -> str:
+    if "ip" not in item:
+        return ""
+
+    # ip must be valid ipv4 or ipv6 address
+    ip = utils.trim(item.get("ip", ""))
+    return "" if IPV4_REGEX.match(ip) or IPV6_REGEX.match(ip) else "invalid-ip"
+
+
+def bandwidth(item: dict) -> str:
+    for key in ["up", "down"]:
+        if key not in item:
+            continue
+
+        traffic = item.get(key, "")
+        if traffic and utils.is_number(traffic):
+            traffic = str(traffic)
+
+        if not BANDWIDTH_REGEX.match(utils.trim(traffic)):
+            return f"invalid-{key}"
+
+    return ""
+
+
+def hysteria_ports(item: dict) -> str:
+    if "ports" not in item:
+        return ""
+
+    ports = utils.trim(item.get("ports", [])).split(",")
+    for port in ports:
+        # port must be valid port number
+        if not utils.is_number(port) or int(port) <= 0 or int(port) > 65535:
+            return "invalid-ports"
+
+    return ""
+
+
+def compile_schemas(mihomo: bool) -> dict[str, tuple[tuple, str | typing.Callable[[dict], str]]]:
+    """rules and authentication property of each protocol, all rules must be passed in order"""
+    # mihomo: https://wiki.metacubex.one/config/proxies/ss/#cipher
+    ss_ciphers = SS_SUPPORTED_CIPHERS + (MIHOMO_SS_SUPPORTED_CIPHERS if mihomo else [])
+
+    # mihomo: https://wiki.metacubex.one/config/proxies/vmess/#cipher
+    vmess_ciphers = VMESS_SUPPORTED_CIPHERS + (["zero"] if mihomo else [])
+
+    schemas = {
+        "ss": ((required("cipher", ss_ciphers, "unsupported-cipher"), ss_plugin(mihomo)), "password"),
+        "ssr": (
+            (
+                required("cipher", SS_SUPPORTED_CIPHERS, "unsupported-cipher"),
+                required("obfs", SSR_SUPPORTED_OBFS, "unsupported-obfs"),
+                required("protocol", SSR_SUPPORTED_PROTOCOL, "unsupported-protocol"),
+            ),
+            "password",
+        ),
+        "vmess": (
+            (
+                vmess_network(mihomo),
+                required("cipher", vmess_ciphers, "unsupported-cipher"),
+                vmess_alter_id,
+                transport(
+                    options={
+                        "h2-opts": (["h2"], valid_h2_opts),
+                        "http-opts": (["http"], valid_http_opts),
+                        "ws-opts": (["ws", "httpupgrade"], valid_ws_opts),
+                        "grpc-opts": (["grpc"] if mihomo else [], valid_grpc_opts),
+                    },
+                    default="ws",
+                    strip=False,
+                    exclusive=True,
+                ),
+            ),
+            "uuid",
+        ),
+        "trojan": (
+            (
+                typed(list, "alpn"),
+                transport(
+                    options={"ws-opts": (["ws"], valid_ws_opts), "grpc-opts": (["grpc"], valid_grpc_opts)},
+                    default="",
+                    strip=True,
+                    exclusive=False,
+                ),
+                trojan_flow(mihomo),
+            ),
+            "password",
+        ),
+        "snell": ((snell_version, snell_obfs), "psk"),
+        "http": ((), "userpass"),
+        "socks5": ((), "userpass"),
+    }
+
+    if not mihomo:
+        return schemas
+
+    # mihomo: https://wiki.metacubex.one/config/proxies/hysteria2 and https://wiki.metacubex.one/config/proxies/hysteria
+    hysteria = (bandwidth, typed(list, "alpn"), typed(str, "ca", "ca-str"))
+
+    schemas.update(
+        {
+            "vless": (
+                (
+                    vless_network,
+                    vless_flow,
+                    transport(
+                        options={"ws-opts": (["ws"], valid_ws_opts), "grpc-opts": (["grpc"], valid_grpc_opts)},
+                        default="tcp",
+                        strip=True,
+                        exclusive=False,
+                    ),
+                    vless_reality,
+                ),
+                "uuid",
+            ),
+            "tuic": (
+                (
+                    tuic_credential,
+                    boolean("disable-sni", "reduce-rtt", "fast-open"),
+                    numeric("heartbeat-interval", "request-timeout", "max-udp-relay-packet-size", "max-open-streams"),
+                    choice("udp-relay-mode", ["native", "quic"]),
+                    choice("congestion-controller", ["cubic", "bbr", "new_reno"]),
+                    typed(list, "alpn"),
+                    tuic_ip,
+                ),
+                lambda item: "token" if wrap(item.get("token", "")) else "uuid",
+            ),
+            "hysteria2": (
+                hysteria
+                + (
+                    choice("obfs", ["salamander"], strip=True),
+                    typed(str, "obfs-password"),
+                ),
+                "password",
+            ),
+            "hysteria": (
+                hysteria
+                + (
+                    typed(str, "auth-str", "auth_str", "obfs"),
+                    boolean("disable_mtu_discovery", "fast-open"),
+                    choice("protocol", ["udp", "wechat-video", "faketcp"], strip=True),
+                    hysteria_ports,
+                    numeric("recv_window_conn", "recv-window-conn", "recv_window", "recv-window"),
+                ),
+                lambda item: "auth-str" if "auth-str" in item else "auth_str",
+            ),
+        }
+    )
+
+    return schemas
+
+
+SCHEMAS = {True: compile_schemas(mihomo=True), False: compile_schemas(mihomo=False)}
+
+
+def validate(item: dict, mihomo: bool = True) -> str:
+    """check and normalize the proxy, returns the reason code if it's invalid otherwise empty string"""
+    if not item or type(item) != dict or "type" not in item:
+        return "malformed"
+
+    try:
+        reason = normalize(item)
+        if reason:
+            return reason
+
+        schema = SCHEMAS[bool(mihomo)].get(item["type"], None)
+        if schema is None:
+            return "unsupported-type"
+
+        rules, authentication = schema
+        for rule in rules:
+            reason = rule(item)
+            if reason:
+                return reason
+
+        if not isinstance(authentication, str):
+            authentication = authentication(item)
 
         if not item.get(authentication, ""):
-            return False
+            return f"missing-{authentication}"
 
         if utils.is_number(item[authentication]):
             item[authentication] = str(item[authentication])
 
-        return True
+        return ""
     except:
-        return False
+        return "malformed"
+
+
+def verify(item: dict, mihomo: bool = True) -> bool:
+    return not validate(item=item, mihomo=mihomo)
 
 
 def check(proxy: dict, api_url: str, timeout: int, test_url: str, delay: int, strict: bool = False) -> bool:
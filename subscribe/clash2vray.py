@@ -1,5 +1,5 @@
 import requests
-import yaml
+import yamlio
 import base64
 import json
 import os
@@ -60,7 +60,7 @@ def main():
             print("Error: clash.yaml not found in the Gist", file=sys.stderr)
             sys.exit(1)
         clash_config_content = gist_content['files']['clash.yaml']['content']
-        clash_config = yaml.safe_load(clash_config_content)
+        clash_config = yamlio.load(clash_config_content)
     except Exception as e:
         print(f"Error fetching or parsing clash.yaml: {e}", file=sys.stderr)
         sys.exit(1)
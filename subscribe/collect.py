@@ -6,19 +6,17 @@
 import argparse
 import itertools
 import os
-import random
 import re
 import shutil
-import subprocess
 import sys
-import time
 
+import checker
 import crawl
 import executable
 import push
 import utils
 import workflow
-import yaml
+import yamlio
 from airport import AirPort
 from logger import logger
 from urlvalidator import isurl
@@ -241,8 +239,19 @@ def aggregate(args: argparse.Namespace) -> None:
     if os.path.exists(generate_conf) and os.path.isfile(generate_conf):
         os.remove(generate_conf)
 
-    results = utils.multi_thread_run(func=workflow.executewrapper, tasks=tasks, num_threads=args.num)
+    # 可选：启动常驻的 subconverter 服务，避免每次转换都启动新进程
+    subconverter.startup(binname=subconverter_bin)
+
+    # 并发线程的转换请求合并后只调用一次 subconverter
+    subconverter.configure(concurrency=min(args.num, len(tasks)))
+
+    try:
+        results = utils.multi_thread_run(func=workflow.executewrapper, tasks=tasks, num_threads=args.num)
+    finally:
+        subconverter.shutdown()
+
     proxies = list(itertools.chain.from_iterable([x[1] for x in results if x]))
+    workflow.report_rejects(tasks=tasks, results=results)
 
     if len(proxies) == 0:
         logger.error("exit because cannot fetch any proxy node")
@@ -254,43 +263,27 @@ def aggregate(args: argparse.Namespace) -> None:
         nodes = clash.filter_proxies(proxies).get("proxies", [])
     else:
         binpath = os.path.join(workspace, clash_bin)
-        filename = "config.yaml"
-        proxies = clash.generate_config(workspace, list(proxies), filename)
-
-        # 可执行权限
-        utils.chmod(binpath)
-
-        logger.info(f"startup clash now, workspace: {workspace}, config: {filename}")
-        process = subprocess.Popen(
-            [
-                binpath,
-                "-d",
-                workspace,
-                "-f",
-                os.path.join(workspace, filename),
-            ]
-        )
-        logger.info(f"clash start success, begin check proxies, num: {len(proxies)}")
-
-        time.sleep(random.randint(3, 6))
-        params = [
-            [p, clash.EXTERNAL_CONTROLLER, args.timeout, args.url, args.delay, False]
-            for p in proxies
-            if isinstance(p, dict)
-        ]
+        proxies = clash.filter_proxies(list(proxies)).get("proxies", [])
 
-        masks = utils.multi_thread_run(
-            func=clash.check,
-            tasks=params,
-            num_threads=args.num,
-            show_progress=display,
-        )
+        logger.info(f"begin check proxies, num: {len(proxies)}")
 
-        # 关闭clash
+        # 按实例分片启动 clash 并检测
         try:
-            process.terminate()
-        except:
-            logger.error(f"terminate clash process error")
+            masks = checker.liveness(
+                workspace=workspace,
+                binpath=binpath,
+                proxies=proxies,
+                timeout=args.timeout,
+                test_url=args.url,
+                delay=args.delay,
+                concurrency=args.num,
+                shards=args.workers,
+                show_progress=display,
+                cache=checker.liveness_cache(DATA_BASE),
+            )
+        except (TimeoutError, RuntimeError) as e:
+            logger.error(f"cannot check proxies because clash startup failed, message: {str(e)}")
+            sys.exit(1)
 
         nodes = [proxies[i] for i in range(len(proxies)) if masks[i]]
         if len(nodes) <= 0:
@@ -325,7 +318,7 @@ def aggregate(args: argparse.Namespace) -> None:
         os.remove(supplier)
 
     with open(supplier, "w+", encoding="utf8") as f:
-        yaml.dump(data, f, allow_unicode=True)
+        yamlio.dump(data, f)
 
     if os.path.exists(generate_conf) and os.path.isfile(generate_conf):
         os.remove(generate_conf)
@@ -336,15 +329,25 @@ def aggregate(args: argparse.Namespace) -> None:
     if to_mixed:
         targets.append(("convert_mixed", mixed_file, "mixed", False, args.vitiate))
 
+    artifacts = []
     for t in targets:
         success = subconverter.generate_conf(generate_conf, t[0], source, t[1], t[2], t[3], t[4])
         if not success:
             logger.error(f"cannot generate subconverter config file for target: {t[2]}")
             continue
 
-        if subconverter.convert(binname=subconverter_bin, artifact=t[0]):
+        artifacts.append(t)
+
+    # 所有目标格式只调用一次 subconverter
+    if artifacts and subconverter.batch_convert(binname=subconverter_bin, artifacts=[t[0] for t in artifacts]):
+        for t in artifacts:
+            output = os.path.join(PATH, "subconverter", t[1])
+            if not os.path.exists(output) or not os.path.isfile(output):
+                logger.error(f"converted file {output} not found, target: {t[2]}")
+                continue
+
             filepath = os.path.join(DATA_BASE, t[1])
-            shutil.move(os.path.join(PATH, "subconverter", t[1]), filepath)
+            shutil.move(output, filepath)
 
             records[t[1]] = filepath
 
@@ -585,6 +588,15 @@ if __name__ == "__main__":
         help="ignoring default proxies filter rules",
     )
 
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        required=False,
+        default=0,
+        help="number of clash instances for checking proxies, defaults to the number of cpu cores",
+    )
+
     parser.add_argument(
         "-y",
         "--yourself",
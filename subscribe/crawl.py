@@ -3,6 +3,7 @@
 # @Author  : wzdnzd
 # @Time    : 2022-07-15
 
+import asyncio
 import base64
 import gzip
 import importlib
@@ -16,6 +17,7 @@ import socket
 import ssl
 import string
 import sys
+import threading
 import time
 import traceback
 import typing
@@ -23,21 +25,23 @@ import urllib
 import urllib.error
 import urllib.parse
 import urllib.request
+from concurrent import futures
 from copy import deepcopy
 from dataclasses import dataclass
-from functools import cache
+from functools import cache, partial
 from multiprocessing.managers import ListProxy
 from multiprocessing.synchronize import Semaphore
 
 import airport
+import httpcache
 import push
 import utils
 import workflow
-import yaml
+import yamlio
 from logger import logger
 from origin import Origin
+from tqdm import tqdm
 from urlvalidator import isurl
-from yaml.constructor import ConstructorError
 
 SEPARATOR = "-"
 
@@ -69,13 +73,165 @@ def allow_single_link() -> bool:
     return os.environ.get(SINGLE_PROXIES_ENV_NAME, "").lower() == "true"
 
 
+class CrawlEngine(object):
+    """
+    runs crawling sources on a single event loop, page tasks and validations share one executor with
+    per-host concurrency limits, every page result is passed to handler as soon as it is downloaded
+    """
+
+    def __init__(self, handler: typing.Callable = None, num_threads: int = 50, per_host: int = 8, display: bool = False):
+        # handler 在事件循环线程中调用，参数为单个页面的抓取结果
+        self.handler = handler
+        self.num_threads = max(1, num_threads)
+        self.per_host = max(1, per_host)
+        self.display = display
+
+        self.loop = None
+        self.executor = None
+        self.semaphore = None
+        self.hosts = {}
+        self.pending = []
+        self.progress = None
+
+    @staticmethod
+    def host(args: list | tuple) -> str:
+        for arg in args:
+            if isinstance(arg, str) and (arg.startswith("https://") or arg.startswith("http://")):
+                return urllib.parse.urlparse(arg).hostname or ""
+
+        return ""
+
+    async def execute(self, func: typing.Callable, args: list | tuple, host: str = "") -> typing.Any:
+        host = host or self.host(args) or getattr(func, "__name__", "")
+        if host not in self.hosts:
+            concurrency, _, _ = utils.HTTP_LIMITER.policy(host)
+            self.hosts[host] = asyncio.Semaphore(concurrency or self.per_host)
+
+        async with self.hosts[host]:
+            # 被限流的 host 等待期间不占用全局并发，其他 host 的任务可继续执行
+            delay = utils.HTTP_LIMITER.pending(host)
+            while 0 < delay <= utils.HTTP_LIMITER.max_wait:
+                await asyncio.sleep(delay)
+                delay = utils.HTTP_LIMITER.pending(host)
+
+            async with self.semaphore:
+                return await self.loop.run_in_executor(self.executor, partial(func, *args))
+
+    async def gather(self, func: typing.Callable, params: list, handled: bool = True) -> list:
+        funcname = getattr(func, "__name__", repr(func))
+
+        async def run(index: int, args: list | tuple) -> tuple[int, typing.Any]:
+            try:
+                result = await self.execute(func, args if isinstance(args, (list, tuple)) else [args])
+            except Exception as e:
+                logger.error(f"function {funcname} execution generated an exception: {e}")
+                result = None
+
+            return index, result
+
+        results = [None] * len(params)
+        for task in asyncio.as_completed([run(i, p) for i, p in enumerate(params)]):
+            index, result = await task
+            results[index] = result
+
+            if result and handled and self.handler is not None:
+                try:
+                    self.handler(func, result)
+                except Exception:
+                    logger.error(f"[CrawlError] handle result of {funcname} error, message:\n{traceback.format_exc()}")
+
+        return results
+
+    def map(self, func: typing.Callable, params: list, handled: bool = True) -> list:
+        """run func over params on the engine and wait for all results, can be called from any thread except the loop"""
+        future = asyncio.run_coroutine_threadsafe(self.gather(func, params, handled), self.loop)
+        return future.result()
+
+    def spawn(self, func: typing.Callable, *args, host: str = "") -> asyncio.Task:
+        """schedule func on the engine, must be called in the loop thread"""
+        task = self.loop.create_task(self.execute(func, args, host=host))
+        self.pending.append(task)
+
+        if self.progress is not None:
+            self.progress.total += 1
+            self.progress.refresh()
+            task.add_done_callback(lambda _: self.progress.update(1))
+
+        return task
+
+    async def source(self, func: typing.Callable, **kwargs) -> typing.Any:
+        """run a crawling source in its own thread, its page tasks are dispatched to the engine by multi_thread_crawl"""
+        try:
+            return await asyncio.to_thread(func, **kwargs)
+        except Exception:
+            logger.error(f"[CrawlError] crawl source {getattr(func, '__name__', '')} error")
+            traceback.print_exc()
+            return {}
+
+    async def drain(self) -> list:
+        """wait for all spawned tasks, including those spawned while waiting"""
+        results, index = [], 0
+        while index < len(self.pending):
+            task = self.pending[index]
+            index += 1
+            try:
+                results.append(await task)
+            except Exception as e:
+                logger.error(f"[CrawlError] task execution generated an exception: {e}")
+                results.append(None)
+
+        return results
+
+    def run(self, main: typing.Callable) -> typing.Any:
+        """run coroutine function main(engine) on a new event loop"""
+        global ENGINE
+
+        async def entry() -> typing.Any:
+            self.loop = asyncio.get_running_loop()
+            self.semaphore = asyncio.Semaphore(self.num_threads)
+            self.hosts, self.pending = {}, []
+            return await main(self)
+
+        with ENGINE_LOCK:
+            if ENGINE is not None:
+                raise RuntimeError("another crawl engine is running")
+
+            ENGINE = self
+
+        self.executor = futures.ThreadPoolExecutor(max_workers=self.num_threads)
+        if self.display:
+            self.progress = tqdm(total=0, desc="Progress", leave=True)
+
+        try:
+            return asyncio.run(entry())
+        finally:
+            with ENGINE_LOCK:
+                ENGINE = None
+
+            self.executor.shutdown(wait=False)
+            if self.progress is not None:
+                self.progress.close()
+                self.progress = None
+
+
+# 正在运行的爬取引擎
+ENGINE, ENGINE_LOCK = None, threading.Lock()
+
+
+def concurrent_run(func: typing.Callable, params: list, handled: bool = False) -> list:
+    """dispatch to crawl engine if it's running, handled means results are passed to the handler of the engine"""
+    engine = ENGINE
+    if engine is not None and engine.loop is not None and not engine.loop.is_closed():
+        return engine.map(func=func, params=params, handled=handled)
+
+    return utils.multi_thread_run(func=func, tasks=params)
+
+
 def multi_thread_crawl(func: typing.Callable, params: list) -> dict:
     if not func or not params or type(params) != list:
         return {}
 
-    # concurrent run
-    results = utils.multi_thread_run(func=func, tasks=params)
-
+    results = concurrent_run(func=func, params=params, handled=True)
     funcname = getattr(func, "__name__", repr(func)).replace("_", "-")
     tasks, uri = {}, f"{SINGLE_LINK_FLAG}{funcname}"
 
@@ -102,6 +258,73 @@ def multi_thread_crawl(func: typing.Callable, params: list) -> dict:
     return tasks
 
 
+def crawl_sources(conf: dict, mode: int, connectable: bool) -> list[tuple[typing.Callable, dict]]:
+    """crawling functions and their arguments of enabled sources"""
+    sources = []
+
+    if connectable:
+        # Google
+        google_spider = conf.get("google", {})
+        if google_spider:
+            kwargs = {
+                "qdr": int(google_spider.get("qdr", 7)),
+                "push_to": google_spider.get("push_to", []),
+                "exclude": google_spider.get("exclude", ""),
+                "limits": int(google_spider.get("limits", 100)),
+                "notinurl": google_spider.get("notinurl", []),
+            }
+            sources.append((crawl_google, kwargs))
+
+        # yanex
+        yandex_spider = conf.get("yandex", {})
+        if yandex_spider:
+            kwargs = {
+                "within": int(yandex_spider.get("within", 2)),
+                "push_to": yandex_spider.get("push_to", []),
+                "exclude": yandex_spider.get("exclude", ""),
+                "pages": int(yandex_spider.get("pages", 5)),
+                "notinurl": yandex_spider.get("notinurl", []),
+            }
+            sources.append((crawl_yandex, kwargs))
+
+        # Telegram
+        telegram_spider = conf.get("telegram", {})
+        if telegram_spider and telegram_spider.get("users", {}):
+            users = telegram_spider.get("users")
+            pages = max(telegram_spider.get("pages", 1), 1)
+            sources.append((crawl_telegram, {"users": users, "pages": pages}))
+
+        # Twitter
+        twitter_spider = conf.get("twitter", {})
+        if twitter_spider:
+            sources.append((crawl_twitter, {"tasks": twitter_spider}))
+
+    # skip crawl if mode == 2
+    if mode != 2:
+        # Github
+        github_spider = conf.get("github", {})
+        if github_spider and github_spider.get("push_to", []):
+            kwargs = {
+                "limits": github_spider.get("pages", 1),
+                "push_to": github_spider.get("push_to"),
+                "exclude": github_spider.get("exclude", ""),
+                "spams": github_spider.get("spams", []),
+            }
+            sources.append((crawl_github, kwargs))
+
+        # Github Repository
+        repositories = conf.get("repositories", {})
+        if repositories:
+            sources.append((crawl_github_repo, {"repos": repositories}))
+
+        # Page
+        pages = conf.get("pages", {})
+        if pages:
+            sources.append((crawl_pages, {"pages": pages, "origin": Origin.PAGE.name}))
+
+    return sources
+
+
 def batch_crawl(conf: dict, num_threads: int = 50, display: bool = True) -> list[dict]:
     mode, connectable = crawlable()
 
@@ -136,82 +359,87 @@ def batch_crawl(conf: dict, num_threads: int = 50, display: bool = True) -> list
         # save it to environment
         os.environ[SINGLE_PROXIES_ENV_NAME] = str(allow).lower()
 
-        records, threshold = {}, conf.get("threshold", 1)
-
-        if connectable:
-            # Google
-            google_spider = conf.get("google", {})
-            if google_spider:
-                push_to = google_spider.get("push_to", [])
-                exclude = google_spider.get("exclude", "")
-                notinurl = google_spider.get("notinurl", [])
-                qdr = int(google_spider.get("qdr", 7))
-                limits = int(google_spider.get("limits", 100))
-                records.update(
-                    crawl_google(
-                        qdr=qdr,
-                        push_to=push_to,
-                        exclude=exclude,
-                        limits=limits,
-                        notinurl=notinurl,
-                    )
-                )
+        threshold = conf.get("threshold", 1)
+        exclude = conf.get("exclude", "")
+        taskconf = conf.get("config", {})
 
-            # yanex
-            yandex_spider = conf.get("yandex", {})
-            if yandex_spider:
-                push_to = yandex_spider.get("push_to", [])
-                exclude = yandex_spider.get("exclude", "")
-                notinurl = yandex_spider.get("notinurl", [])
-                within = int(yandex_spider.get("within", 2))
-                pages = int(yandex_spider.get("pages", 5))
-                records.update(
-                    crawl_yandex(
-                        within=within,
-                        push_to=push_to,
-                        exclude=exclude,
-                        pages=pages,
-                        notinurl=notinurl,
-                    )
-                )
+        # remain
+        oldsubs = {}
+        if should_persist:
+            url = pushtool.raw_url(push_conf=subspushconf)
+            try:
+                url, content = url or "", ""
+                if not url.startswith(utils.FILEPATH_PROTOCAL):
+                    content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
+                else:
+                    file = url.sub[len(utils.FILEPATH_PROTOCAL) - 1 :]
+                    if os.path.exists(file) and os.path.isfile(file):
+                        with open(file, "r", encoding="UTF8") as f:
+                            content = f.read()
 
-            # Telegram
-            telegram_spider = conf.get("telegram", {})
-            if telegram_spider and telegram_spider.get("users", {}):
-                users = telegram_spider.get("users")
-                pages = max(telegram_spider.get("pages", 1), 1)
-                records.update(crawl_telegram(users=users, pages=pages))
-
-            # Twitter
-            twitter_spider = conf.get("twitter", {})
-            if twitter_spider:
-                records.update(crawl_twitter(tasks=twitter_spider))
-
-        # skip crawl if mode == 2
-        if mode != 2:
-            # Github
-            github_spider = conf.get("github", {})
-            if github_spider and github_spider.get("push_to", []):
-                push_to = github_spider.get("push_to")
-                pages = github_spider.get("pages", 1)
-                exclude = github_spider.get("exclude", "")
-                spams = github_spider.get("spams", [])
-                records.update(crawl_github(limits=pages, push_to=push_to, exclude=exclude, spams=spams))
-
-            # Github Repository
-            repositories = conf.get("repositories", {})
-            if repositories:
-                records.update(crawl_github_repo(repos=repositories))
-
-            # Page
-            pages = conf.get("pages", {})
-            if pages:
-                records.update(crawl_pages(pages=pages, origin=Origin.PAGE.name))
+                if not utils.isblank(content):
+                    oldsubs = json.loads(content)
+            except:
+                logger.error("[CrawlError] load old subscriptions from remote error")
+                pass
+
+        # 历史订阅需与新抓取的结果合并后再检查，不参与即时检查
+        reserved = set(utils.parse_token(k) for k in oldsubs.keys())
+
+        def prepare(key: str, value: dict) -> list:
+            for k, v in taskconf.items():
+                if k not in value:
+                    value[k] = v
+
+            return [key, value, mode, connectable, exclude, threshold]
+
+        async def main(engine: CrawlEngine) -> list:
+            # 爬取过程中仅提前检查订阅状态，待所有来源合并后再生成结果，避免丢失同一订阅后续记录中的配置
+            checks, scheduled = {}, set()
+
+            def dispatch(key: str, value: dict) -> None:
+                token = utils.parse_token(key)
+                if key.startswith(SINGLE_LINK_FLAG) or token in reserved or token in scheduled:
+                    return
+
+                params = prepare(key, deepcopy(value))[1]
+                if not params.get("push_to", None) or not params.get("origin", ""):
+                    return
+                if exclude and re.search(exclude, key):
+                    return
+
+                scheduled.add(token)
+                host = urllib.parse.urlparse(key).hostname or ""
+                checks[key] = engine.spawn(subscription_status, key, connectable, host=host)
+
+            async def settle(key: str, value: dict) -> ValidateResult:
+                try:
+                    status = await checks[key]
+                except Exception:
+                    status = None
+
+                if status is None:
+                    return await engine.execute(validate, prepare(key, value))
+
+                return validate(*prepare(key, value), status=status)
+
+            def handle(func: typing.Callable, result: dict) -> None:
+                for k, v in result.items():
+                    dispatch(k, v)
+
+            # 页面下载完成后立即检查其中的订阅，无需等待所有来源爬取完毕
+            engine.handler = handle
+
+            records, sources = {}, crawl_sources(conf=conf, mode=mode, connectable=connectable)
+            results = await asyncio.gather(*[engine.source(func, **kwargs) for func, kwargs in sources])
+            for result in results:
+                if result and isinstance(result, dict):
+                    records.update(result)
 
             # Scripts
             scripts = conf.get("scripts", {})
             if scripts:
-                items = batch_call(scripts)
+                items = await engine.source(batch_call, tasks=scripts)
                 if items:
                     for item in items:
                         if not item or type(item) != dict:
@@ -238,62 +466,59 @@ def batch_crawl(conf: dict, num_threads: int = 50, display: bool = True) -> list
                             else:
                                 records.update({sub: task})
 
-        # remain
-        if should_persist:
-            url = pushtool.raw_url(push_conf=subspushconf)
-            try:
-                url, content = url or "", ""
-                if not url.startswith(utils.FILEPATH_PROTOCAL):
-                    content = utils.http_get(url=url)
-                else:
-                    file = url.sub[len(utils.FILEPATH_PROTOCAL) - 1 :]
-                    if os.path.exists(file) and os.path.isfile(file):
-                        with open(file, "r", encoding="UTF8") as f:
-                            content = f.read()
+            # tasks.update(oldsubs)
+            for k, v in oldsubs.items():
+                merged = dict(list(v.items()) + list(records.get(k, {}).items()))
+                records[k] = merged
 
-                if not utils.isblank(content):
-                    oldsubs = json.loads(content)
+            if not records:
+                return None
 
-                    # tasks.update(oldsubs)
-                    for k, v in oldsubs.items():
-                        merged = dict(list(v.items()) + list(records.get(k, {}).items()))
-                        records[k] = merged
-            except:
-                logger.error("[CrawlError] load old subscriptions from remote error")
-                pass
+            # dedup by token
+            tokens = {utils.parse_token(k): k for k in records.keys()}
+            tasks = {k: records[k] for k in tokens.values()}
 
-        if not records:
-            if peristedtasks and should_persist and mode != 2:
-                content = json.dumps(peristedtasks)
-                pushtool.push_to(content=content, push_conf=subspushconf, group="crawl")
+            finals = []
+            for key, value in tasks.items():
+                # generate single link's configuration
+                if key.startswith(SINGLE_LINK_FLAG):
+                    proxiesconf.update(prepare(key, value)[1])
 
-            logger.debug("[CrawlInfo] cannot found any subscribe from Google/Telegram/Github and Page with crawler")
-            return datasets
+                # 已在爬取过程中检查过状态，使用合并后的配置生成结果
+                if key in checks:
+                    finals.append(asyncio.ensure_future(settle(key, value)))
+                else:
+                    host = urllib.parse.urlparse(key).hostname or ""
+                    finals.append(engine.spawn(validate, *prepare(key, value), host=host))
 
-        exclude = conf.get("exclude", "")
-        taskconf = conf.get("config", {})
+            await engine.drain()
 
-        # dedup by token
-        tokens = {utils.parse_token(k): k for k in records.keys()}
-        tasks = {k: records[k] for k in tokens.values()}
+            results = []
+            for result in await asyncio.gather(*finals, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.error(f"[CrawlError] validate subscription error: {result}")
+                    result = None
 
-        time.sleep(random.randint(1, 3))
+                results.append(result)
 
-        proxiesconf, jobs = {}, []
-        for key, value in tasks.items():
-            for k, v in taskconf.items():
-                if k not in value:
-                    value[k] = v
+            return results
 
-            jobs.append([key, value, mode, connectable, exclude, threshold])
+        proxiesconf = {}
+        engine = CrawlEngine(num_threads=num_threads, display=display)
+        results = engine.run(main)
 
-            # generate single link's configuration
-            if key.startswith(SINGLE_LINK_FLAG):
-                proxiesconf.update(value)
+        if results is None:
+            if peristedtasks and should_persist and mode != 2:
+                content = json.dumps(peristedtasks)
+                pushtool.push_to(content=content, push_conf=subspushconf, group="crawl")
+
+            logger.debug("[CrawlInfo] cannot found any subscribe from Google/Telegram/Github and Page with crawler")
+            return datasets
 
         availables, unknowns, potentials, proxylinks = [], [], {}, set()
-        results = utils.multi_thread_run(func=validate, tasks=jobs, num_threads=num_threads, show_progress=display)
         for result in results:
+            if not result:
+                continue
             if result.available:
                 availables.append(result.available)
             if result.potential:
@@ -397,12 +622,8 @@ def crawl_telegram_page(
         return {}
 
     limits = max(1, limits)
-    content = utils.http_get(url=url)
-    if not content:
-        return {}
-
     return extract_subscribes(
-        content=content,
+        content="",
         push_to=pts,
         include=include,
         limits=limits,
@@ -410,6 +631,7 @@ def crawl_telegram_page(
         exclude=exclude,
         config=config,
         reversed=True,
+        stream=utils.http_stream(url=url, limiter=utils.HTTP_LIMITER),
     )
 
 
@@ -421,7 +643,7 @@ def crawl_telegram(users: dict, pages: int = 1, limits: int = 3) -> dict:
     starttime = time.time()
 
     params = [[k, v, pages, limits] for k, v in users.items()]
-    results = utils.multi_thread_run(func=generate_telegram_task, tasks=params)
+    results = concurrent_run(func=generate_telegram_task, params=params)
 
     tasks = list(itertools.chain.from_iterable(results))
     subscribes = multi_thread_crawl(func=crawl_telegram_page, params=tasks)
@@ -442,7 +664,7 @@ def crawl_single_repo(username: str, repo: str, push_to: list = [], limits: int
     limits = max(1, limits)
     url = f"https://api.github.com/repos/{username.strip()}/{repo.strip()}/commits?per_page={limits}"
 
-    content = utils.http_get(url=url)
+    content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
     if content == "":
         return {}
 
@@ -450,7 +672,7 @@ def crawl_single_repo(username: str, repo: str, push_to: list = [], limits: int
         commits = json.loads(content)
         collections = {}
         for item in commits:
-            content = utils.http_get(url=item.get("url", ""))
+            content = utils.http_get(url=item.get("url", ""), limiter=utils.HTTP_LIMITER)
             if not content:
                 continue
             commit = json.loads(content)
@@ -526,7 +748,7 @@ def crawl_google(
     collections = {}
     for start in range(0, limits, num):
         params["start"] = start
-        content = re.sub(r"\\\\n", "", utils.http_get(url=url, params=params))
+        content = re.sub(r"\\\\n", "", utils.http_get(url=url, params=params, limiter=utils.HTTP_LIMITER))
         content = re.sub(r"\?token\\\\u003d", "?token=", content, flags=re.I)
         regex = r'https?://(?:[a-zA-Z0-9_\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9_\u4e00-\u9fa5\-]+/?(?:<em(?:\s+)?class="qkunPe">/?)?api/v1/client/subscribe\?token(?:</em>)?=[a-zA-Z0-9]{16,32}'
         subscribes = re.findall(regex, content)
@@ -581,7 +803,7 @@ def crawl_yandex(
     }
 
     # get total pages
-    content = utils.http_get(url=url, headers=headers)
+    content = utils.http_get(url=url, headers=headers, limiter=utils.HTTP_LIMITER)
     if content:
         regex = r'<a class="VanillaReact Pager-Item Pager-Item_type_page" href=".*?" aria-label="Page \d+".*?>(\d+)</a>'
         groups = re.findall(regex, content, flags=re.I)
@@ -591,7 +813,7 @@ def crawl_yandex(
     collections, pages = {}, max(1, pages)
 
     for page in range(0, pages):
-        content = utils.http_get(url=f"{url}&p={page}", headers=headers)
+        content = utils.http_get(url=f"{url}&p={page}", headers=headers, limiter=utils.HTTP_LIMITER)
         if not content:
             logger.error(f"[YandexCrawl] cannot get content from page: {page}")
             continue
@@ -657,7 +879,7 @@ def search_github(page: int, cookie: str, searchtype: str, sortedby: str) -> str
         "User-Agent": utils.USER_AGENT,
         "Cookie": f"user_session={cookie}",
     }
-    content = utils.http_get(url=url, headers=headers)
+    content = utils.http_get(url=url, headers=headers, limiter=utils.HTTP_LIMITER)
     if re.search(r"<h1>Sign in to GitHub</h1>", content, flags=re.I):
         logger.error("[GithubCrawl] session has expired, please provide a valid session and try again")
         return ""
@@ -694,7 +916,7 @@ def search_github_issues(page: int, cookie: str) -> list[str]:
 def search_github_issues_byapi(peer_page: int = 50, page: int = 1) -> list[str]:
     peer_page, page = min(max(peer_page, 1), 100), max(1, page)
     url = f"https://api.github.com/search/issues?q=%22%2Fapi%2Fv1%2Fclient%2Fsubscribe%3Ftoken%3D%22&sort=created&order=desc&per_page={peer_page}&page={page}"
-    content = utils.http_get(url=url)
+    content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
     if utils.isblank(content):
         return []
     try:
@@ -726,7 +948,7 @@ def search_github_code_byapi(token: str, peer_page: int = 50, page: int = 1, exc
         "Authorization": f"Bearer {token}",
         # "X-GitHub-Api-Version": "2022-11-28"
     }
-    content, links = utils.http_get(url=url, headers=headers), set()
+    content, links = utils.http_get(url=url, headers=headers, limiter=utils.HTTP_LIMITER), set()
     if utils.isblank(content):
         return []
     try:
@@ -798,7 +1020,7 @@ def crawl_github(limits: int = 3, push_to: list = [], spams: list = [], exclude:
         pages = [x for x in range(1, limits + 1)] * 2
         params = [[x, cookie, spams] for x in pages]
 
-        results = utils.multi_thread_run(func=search_github_code, tasks=params)
+        results = concurrent_run(func=search_github_code, params=params)
         items = list(set(itertools.chain.from_iterable(results)))
 
         links.extend(items)
@@ -808,7 +1030,7 @@ def crawl_github(limits: int = 3, push_to: list = [], spams: list = [], exclude:
         pages = paging(start=1, end=limits * count, peer_page=peer_page)
         params = [[token, peer_page, x, spams] for x in pages] * 2
 
-        results = utils.multi_thread_run(func=search_github_code_byapi, tasks=params)
+        results = concurrent_run(func=search_github_code_byapi, params=params)
         items = list(set(itertools.chain.from_iterable(results)))
 
         links.extend(items)
@@ -841,23 +1063,23 @@ def crawl_single_page(
     headers: dict = None,
     origin: str = Origin.PAGE.name,
     nocache: bool = False,
+    limits: int = sys.maxsize,
 ) -> dict:
     if not url or not push_to:
         logger.error(f"[PageCrawl] cannot crawl from page: {url}")
         return {}
 
-    content = utils.http_get(url=url, headers=headers)
-    if content == "":
-        return {}
-
+    # 边下载边提取，GitHub 上的大文件无需完整读取
     return extract_subscribes(
-        content=content,
+        content="",
         push_to=push_to,
         include=include,
         exclude=exclude,
         config=config,
         source=origin,
         nocache=nocache,
+        limits=limits,
+        stream=utils.http_stream(url=url, headers=headers, limiter=utils.HTTP_LIMITER),
     )
 
 
@@ -880,8 +1102,9 @@ def crawl_pages(
         exclude = v.get("exclude", "").strip()
         config = v.get("config", {})
         nocache = v.get("nocache", False)
+        limits = max(1, int(v.get("limits", sys.maxsize)))
 
-        params.append([k, push_to, include, exclude, config, headers, origin, nocache])
+        params.append([k, push_to, include, exclude, config, headers, origin, nocache, limits])
 
     subscribes = multi_thread_crawl(func=crawl_single_page, params=params)
     if not silent:
@@ -930,7 +1153,7 @@ def get_guest_token() -> str:
         "Cookie": cookies,
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
     }
-    content = utils.http_get(url="https://twitter.com/", headers=headers)
+    content = utils.http_get(url="https://twitter.com/", headers=headers, limiter=utils.HTTP_LIMITER)
     if not content:
         return ""
 
@@ -969,7 +1192,7 @@ def username_to_id(username: str, headers: dict) -> str:
     payload = urllib.parse.urlencode({"variables": json.dumps(variables), "features": json.dumps(features)})
     url = f"https://twitter.com/i/api/graphql/sLVLhk0bGj3MVFEKTdax1w/UserByScreenName?{payload}"
     try:
-        content = utils.http_get(url=url, headers=headers)
+        content = utils.http_get(url=url, headers=headers, limiter=utils.HTTP_LIMITER)
         if not content:
             return ""
 
@@ -1030,7 +1253,7 @@ def crawl_twitter(tasks: dict) -> dict:
 
     # username to uid
     params = [[k, headers] for k in candidates.keys()]
-    uids = utils.multi_thread_run(func=username_to_id, tasks=params)
+    uids = concurrent_run(func=username_to_id, params=params)
 
     for i in range(len(uids)):
         uid = uids[i]
@@ -1070,38 +1293,56 @@ def extract_subscribes(
     config: dict = {},
     reversed: bool = False,
     nocache: bool = False,
+    stream: typing.Iterable[str] = None,
 ) -> dict:
-    if not content:
+    """extract subscriptions from content, or from text chunks of stream which stops being consumed once limits is reached"""
+    if not content and stream is None:
         return {}
     try:
         limits, collections, proxies = max(1, limits), {}, []
-        sub_regex = r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+(?:(?:(?:/index.php)?/api/v1/client/subscribe\?token=[a-zA-Z0-9]{16,32})|(?:/link/[a-zA-Z0-9]+\?(?:sub|mu|clash)=\d))"
-        extra_regex = r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+/sub\?(?:\S+)?target=\S+"
-        protocal_regex = r"(?:vmess|trojan|ss|ssr|snell|hysteria2|vless|hysteria)://[a-zA-Z0-9:.?+=@%&#_\-/]{10,}"
+        single = allow_single_link()
 
-        regex = f"{sub_regex}|{extra_regex}"
+        try:
+            excluded = re.compile(exclude) if exclude else None
+        except:
+            logger.error(
+                f"[ExtractError] maybe pattern 'include' or 'exclude' exists some problems, include: {include}\texclude: {exclude}"
+            )
+            excluded = None
 
         if include:
             try:
-                if not include.startswith("|"):
-                    pattern = f"{regex}|{include}"
-                else:
-                    pattern = f"{regex}{include}"
-
-                subscribes = re.findall(pattern, content, flags=re.I)
-            except:
+                link_pattern(include)
+            except re.error:
                 logger.error(f"[ExtractError] maybe pattern 'include' exists some problems, include: {include}")
-                subscribes = re.findall(regex, content)
-        else:
-            subscribes = re.findall(regex, content, flags=re.I)
+                include = ""
 
-        # 去重会打乱原本按日期排序的特性一致无法优先选择离当前时间较近的元素
-        # subscribes = list(set(subscribes))
+        # 自定义规则可能跨越空白字符，需读取完整内容
+        if stream is not None and (include or content):
+            content, stream = content + "".join(stream), None
+
+        # 倒序时需完整扫描，否则达到数量限制即可停止
+        if stream is not None:
+            links = scan_chunks(chunks=stream, single=single)
+        else:
+            links = scan_links(content=content, include=include, single=single)
 
         if reversed:
-            subscribes.reverse()
+            links = list(links)
+            links.reverse()
+
+        groups = []
+        for kind, sub in links:
+            if kind == "proxy":
+                groups.append(sub)
+                continue
+
+            if len(collections) >= limits:
+                if not single:
+                    break
+
+                continue
 
-        for sub in subscribes:
             items = [sub]
             # subconverter url
             if "url=" in sub:
@@ -1112,26 +1353,18 @@ def extract_subscribes(
 
                 for url in urls:
                     if not utils.isurl(url):
-                        if allow_single_link():
-                            proxies.extend([x for x in url.split("|") if re.match(protocal_regex, x, flags=re.I)])
+                        if single:
+                            proxies.extend([x for x in url.split("|") if PROTOCAL_PATTERN.match(x)])
                         continue
 
-                    items.extend([x for x in url.split("|") if not re.match(extra_regex, x, flags=re.I)])
+                    items.extend([x for x in url.split("|") if not EXTRA_PATTERN.match(x)])
 
             for s in items:
-                try:
-                    if include and not re.match(
-                        r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+.*",
-                        s,
-                    ):
-                        continue
+                if include and not DOMAIN_URL_PATTERN.match(s):
+                    continue
 
-                    if exclude and re.search(exclude, s):
-                        continue
-                except:
-                    logger.error(
-                        f"[ExtractError] maybe pattern 'include' or 'exclude' exists some problems, include: {include}\texclude: {exclude}"
-                    )
+                if excluded is not None and excluded.search(s):
+                    continue
 
                 # 强制使用https协议
                 # s = s.replace("http://", "https://", 1).strip()
@@ -1140,30 +1373,134 @@ def extract_subscribes(
                     params.update(config)
                 collections[s] = params
 
-            if len(collections) >= limits:
-                break
-
-        if allow_single_link():
-            try:
-                groups = re.findall(protocal_regex, content, flags=re.I)
-                if groups:
-                    proxies.extend([x.lower().strip() for x in groups if x])
-                    params = {
-                        "push_to": push_to,
-                        "origin": source,
-                        "proxies": list(set(proxies)),
-                    }
-                    if config:
-                        params.update(config)
-                    collections[SINGLE_LINK_FLAG] = params
-            except:
-                logger.error(f"[ExtractError] failed to extract single proxy")
+        if single and groups:
+            proxies.extend([x.lower().strip() for x in groups if x])
+            params = {
+                "push_to": push_to,
+                "origin": source,
+                "proxies": list(set(proxies)),
+            }
+            if config:
+                params.update(config)
+            collections[SINGLE_LINK_FLAG] = params
 
         return collections
     except:
         logger.error("[ExtractError] extract subscribe error")
         return {}
+    finally:
+        # 提前结束时中止下载
+        if stream is not None and hasattr(stream, "close"):
+            stream.close()
+
+
+# 机场订阅链接
+SUB_REGEX = r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+(?:(?:(?:/index.php)?/api/v1/client/subscribe\?token=[a-zA-Z0-9]{16,32})|(?:/link/[a-zA-Z0-9]+\?(?:sub|mu|clash)=\d))"
+
+# subconverter 转换链接
+EXTRA_REGEX = r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+/sub\?(?:\S+)?target=\S+"
+
+# 单个节点分享链接
+PROTOCAL_REGEX = r"(?:vmess|trojan|ss|ssr|snell|hysteria2|vless|hysteria)://[a-zA-Z0-9:.?+=@%&#_\-/]{10,}"
+
+SUB_PATTERN = re.compile(SUB_REGEX, flags=re.I)
+
+EXTRA_PATTERN = re.compile(EXTRA_REGEX, flags=re.I)
 
+PROTOCAL_PATTERN = re.compile(PROTOCAL_REGEX, flags=re.I)
+
+# 节点链接协议，较长的优先以保证与正则匹配的起始位置一致
+PROTOCAL_SCHEMES = ["hysteria2", "hysteria", "trojan", "snell", "vmess", "vless", "ssr", "ss"]
+
+# 流式扫描时保留的已扫描内容长度，需容纳最长的协议名及 "://"
+OVERLAP_WINDOW = 16
+
+DOMAIN_URL_PATTERN = re.compile(r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+.*")
+
+
+@cache
+def link_pattern(include: str) -> re.Pattern:
+    """compile subscription, subconverter and custom patterns into one, raise re.error if include is invalid"""
+    if not include.startswith("|"):
+        return re.compile(f"{SUB_REGEX}|{EXTRA_REGEX}|{include}", flags=re.I)
+
+    return re.compile(f"{SUB_REGEX}|{EXTRA_REGEX}{include}", flags=re.I)
+
+
+def scan_links(content: str, include: str = "", single: bool = False) -> typing.Iterator[tuple[str, str]]:
+    """
+    scan content once and yields ("sub", link) for subscriptions and subconverter links in order of appearance,
+    also ("proxy", link) for single proxy links if single is True, raise re.error if include is invalid
+    """
+    if include:
+        pattern = link_pattern(include)
+        for match in pattern.finditer(content):
+            yield "sub", match.group(0)
+
+        if single:
+            for kind, link in scan_links(content=content, include="", single=True):
+                if kind == "proxy":
+                    yield kind, link
+
+        return
+
+    yield from scan_chunks(chunks=[content], single=single)
+
+
+def scan_chunks(chunks: typing.Iterable[str], single: bool = False) -> typing.Iterator[tuple[str, str]]:
+    """
+    incremental scan_links without custom patterns, links are yielded as soon as the whitespace after them arrives,
+    only a small window of scanned content is kept for the scheme of links spanning chunks
+    """
+    # 所有链接均包含 "://"，仅在其出现位置尝试匹配，订阅与节点链接各自维护扫描位置，与分别 findall 的结果一致
+    buffer, search, sub_end, proxy_end, final = "", 0, 0, 0, False
+    iterator = iter(chunks)
+
+    while not final:
+        chunk = next(iterator, None)
+        if chunk is None:
+            final = True
+        else:
+            buffer += chunk
+
+        # 链接均不包含空白字符，最后一个空白字符之后的内容需等待后续数据
+        if final or buffer[-1:].isspace():
+            boundary = len(buffer)
+        else:
+            words = buffer.rsplit(None, 1)
+            boundary = len(buffer) - len(words[-1]) if len(words) == 2 else 0
+
+        index = buffer.find("://", search, boundary)
+        while index >= 0:
+            if index >= sub_end + 4:
+                for scheme in ["https", "http"]:
+                    start = index - len(scheme)
+                    if start >= sub_end and buffer[start:index].lower() == scheme:
+                        match = SUB_PATTERN.match(buffer, start) or EXTRA_PATTERN.match(buffer, start)
+                        if match:
+                            sub_end = match.end()
+                            yield "sub", match.group(0)
+                        break
+
+            if single and index >= proxy_end + 2:
+                for scheme in PROTOCAL_SCHEMES:
+                    start = index - len(scheme)
+                    if start >= proxy_end and buffer[start:index].lower() == scheme:
+                        match = PROTOCAL_PATTERN.match(buffer, start)
+                        if match:
+                            proxy_end = match.end()
+                            yield "proxy", match.group(0)
+                        break
+
+            search = index + 3
+            index = buffer.find("://", search, boundary)
+
+        # 丢弃已扫描的内容，保留协议名所需的重叠窗口
+        search = max(search, boundary - 2)
+        cut = max(0, search - OVERLAP_WINDOW)
+        if cut > 0:
+            buffer, search = buffer[cut:], search - cut
+            sub_end, proxy_end = max(0, sub_end - cut), max(0, proxy_end - cut)
 
 def validate(
     url: str,
@@ -1172,7 +1509,9 @@ def validate(
     connectable: bool,
     exclude: str = "",
     threshold: int = 1,
+    status: tuple[bool, bool] = None,
 ) -> ValidateResult:
+    """status: result of subscription_status if it has been checked in advance"""
     if (
         not params
         or not params.get("push_to", None)
@@ -1193,7 +1532,7 @@ def validate(
     defeat = params.get("defeat", 0) + 1
     discovered = params.get("discovered", False)
 
-    reachable, expired = check_status(url=url, retry=2, remain=5, spare_time=12, tolerance=72, connectable=connectable)
+    reachable, expired = status or subscription_status(url=url, connectable=connectable)
     if reachable:
         item = {"name": naming_task(url), "sub": url, "debut": True}
         item.update(params)
@@ -1217,6 +1556,11 @@ def validate(
     return result
 
 
+def subscription_status(url: str, connectable: bool) -> tuple[bool, bool]:
+    """returns whether the subscription is reachable and expired"""
+    return check_status(url=url, retry=2, remain=5, spare_time=12, tolerance=72, connectable=connectable)
+
+
 def remark(source: dict, defeat: int = 0, discovered: bool = True) -> None:
     if not source or type(source) != dict or type(defeat) != int or defeat < 0 or type(discovered) != bool:
         return
@@ -1227,6 +1571,29 @@ def remark(source: dict, defeat: int = 0, discovered: bool = True) -> None:
         source["origin"] = Origin.TEMPORARY.name
 
 
+# 探测订阅时只读取内容开头部分
+PROBE_SIZE = 4096
+
+# 开头部分全为 base64 字符
+BASE64_PROBE_PATTERN = re.compile(r"[A-Za-z0-9+/]+")
+
+# 开头部分包含非空的 proxies 列表
+PROXIES_PROBE_PATTERN = re.compile(r"^proxies:[ \t]*(?:\[[ \t]*\{|\r?\n(?:[ \t]*(?:#.*)?\r?\n)*[ \t]*-[ \t]*\S)", flags=re.M)
+
+
+def sniff_content(text: str) -> str:
+    """guess format of the subscription by the beginning of its content, returns 'base64', 'yaml' or empty string if unknown"""
+    if not text:
+        return ""
+
+    if BASE64_PROBE_PATTERN.fullmatch(text):
+        return "base64"
+    if PROXIES_PROBE_PATTERN.search(text):
+        return "yaml"
+
+    return ""
+
+
 def check_status(
     url: str,
     retry: int = 2,
@@ -1234,6 +1601,8 @@ def check_status(
     spare_time: float = 0,
     tolerance: float = 0,
     connectable: bool = True,
+    conditional: bool = True,
+    probe: bool = True,
 ) -> tuple[bool, bool]:
     """
     url: subscription link
@@ -1241,74 +1610,219 @@ def check_status(
     remain: minimum remaining traffic flow
     spare_time: minimum remaining time
     tolerance: waiting time after expiration
+    conditional: send conditional request if the subscription has been checked before
+    probe: request the first PROBE_SIZE bytes only and judge by header subscription-userinfo if possible
     """
     if not url or retry <= 0:
         return False, connectable
 
+    # 同一订阅在本次运行中只检查一次，不同阈值共享检查结果
+    status = httpcache.statuses().load(
+        url=url,
+        func=partial(fetch_status, url=url, retry=retry, conditional=conditional, probe=probe),
+    )
+
+    return judge_status(
+        status=status,
+        remain=remain,
+        spare_time=spare_time,
+        tolerance=tolerance,
+        connectable=connectable,
+    )
+
+
+def judge_status(
+    status: dict,
+    remain: float = 0,
+    spare_time: float = 0,
+    tolerance: float = 0,
+    connectable: bool = True,
+) -> tuple[bool, bool]:
+    """convert status returned by fetch_status to (available, expired)"""
+    state = (status or {}).get("state", "")
+    if state == "active":
+        # 根据订阅信息判断是否有效
+        return is_expired(header=status.get("userinfo", ""), remain=remain, spare_time=spare_time, tolerance=tolerance)
+    elif state == "expired":
+        return False, True
+    elif state == "invalid":
+        return False, False
+
+    return False, connectable
+
+
+def fetch_status(url: str, retry: int = 2, conditional: bool = True, probe: bool = True) -> dict:
+    """
+    request the subscription and returns its status, the state is one of
+    active (content is valid, judged by userinfo), expired, invalid and unknown (request failed)
+    """
+    if not url or retry <= 0:
+        return {"state": "unknown", "cacheable": False}
+
+    headers = {"User-Agent": "clash.meta"}
+
+    # 订阅内容未变化时复用上次的检查结果
+    metadata = httpcache.instance()
+    record = metadata.get(url=url, agent=headers["User-Agent"]) if metadata is not None and conditional else {}
+    if "proxies" in record:
+        # 有效期内检查过的订阅无需再次请求
+        if time.time() - record.get("checked", 0) <= httpcache.statuses().ttl:
+            state = "active" if record.get("proxies", False) else "expired"
+            return {"state": state, "userinfo": record.get("userinfo", "")}
+
+        headers.update(metadata.conditions(record))
+
+    # 不支持 Range 的服务端会返回完整内容，只读取开头部分即可
+    if probe:
+        headers["Range"] = f"bytes=0-{PROBE_SIZE - 1}"
+
     try:
-        headers = {"User-Agent": "clash.meta"}
-        request = urllib.request.Request(url=url, headers=headers)
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
-        if response.getcode() != 200:
-            return False, connectable
+        response = utils.HTTP_CLIENT.open(
+            method="GET", url=url, headers=headers, timeout=10, limiter=utils.HTTP_LIMITER
+        )
+        status, action = inspect_status(response=response, url=url, agent=headers["User-Agent"], record=record, probe=probe)
+    except utils.RateLimitedError:
+        return {"state": "unknown", "cacheable": False}
+    except Exception:
+        status, action = {"state": "unknown", "cacheable": False}, "retry"
+
+    if not action:
+        return status
+
+    # 重新请求：retry 为失败重试，refresh 为忽略缓存，full 为下载完整内容
+    return fetch_status(
+        url=url,
+        retry=retry - 1 if action == "retry" else retry,
+        conditional=conditional and action != "refresh",
+        probe=probe and action != "full",
+    )
 
-        content = str(response.read(), encoding="utf8")
 
-        # response text is too short, ignore
-        if len(content) < 32:
-            return False, False
+def inspect_status(response: typing.Any, url: str, agent: str, record: dict, probe: bool) -> tuple[dict, str]:
+    """judge the subscription by the response, returns its status and the action to request again if needed"""
+    unknown = {"state": "unknown", "cacheable": False}
+
+    # drained 表示响应内容已读取完毕，连接可以复用
+    metadata, drained = httpcache.instance(), False
+    try:
+        status = response.status
+        if status == 304 and "proxies" in record:
+            drained = True
+
+            # 流量信息会随使用变化，304 响应未携带时需重新请求
+            subscription = response.headers.get("subscription-userinfo", "")
+            if not subscription and record.get("userinfo", ""):
+                return unknown, "refresh"
+
+            metadata.touch(url=url, agent=agent, userinfo=subscription, checked=time.time())
+            if not record.get("proxies", False):
+                return {"state": "expired"}, ""
+
+            return {"state": "active", "userinfo": subscription}, ""
+
+        # 请求范围无法满足说明内容为空
+        if status == 416:
+            return {"state": "invalid"}, ""
+
+        if status >= 400:
+            try:
+                message = str(response.read(PROBE_SIZE), encoding="utf8")
+            except:
+                message = ""
+
+            if status == 404 or "token is error" in message:
+                return {"state": "expired"}, ""
+            elif status in [403, 503]:
+                return unknown, "retry"
+
+            return {"state": "invalid"}, ""
+
+        if status not in [200, 206]:
+            return unknown, ""
 
         # 订阅流量信息
-        subscription = response.getheader("subscription-userinfo")
+        subscription = response.headers.get("subscription-userinfo", None)
+
+        data = response.read(PROBE_SIZE) if probe else b""
+        completed = probe and len(data) < PROBE_SIZE
+        if status == 206 and not completed:
+            total = response.headers.get("Content-Range", "").rsplit("/", maxsplit=1)[-1].strip()
+            completed = total.isdigit() and int(total) <= len(data)
+
+        # 部分内容响应只包含请求的范围
+        drained = completed or status == 206
+
+        if not completed:
+            # 流量信息存在且内容开头即可确认格式，无需下载完整内容
+            if subscription and sniff_content(str(data, encoding="utf8", errors="ignore")):
+                if metadata is not None:
+                    metadata.set(
+                        url=url,
+                        agent=agent,
+                        headers=response.headers,
+                        content="",
+                        proxies=True,
+                        userinfo=subscription,
+                        checked=time.time(),
+                    )
 
-        if utils.isb64encode(content):
-            # parse and detect whether the subscription has expired
-            return is_expired(header=subscription, remain=remain, spare_time=spare_time, tolerance=tolerance)
+                return {"state": "active", "userinfo": subscription}, ""
 
-        try:
-            proxies = yaml.load(content, Loader=yaml.SafeLoader).get("proxies", [])
-        except ConstructorError:
-            yaml.add_multi_constructor("str", lambda loader, suffix, node: None, Loader=yaml.SafeLoader)
-            proxies = yaml.load(content, Loader=yaml.FullLoader).get("proxies", [])
-        except:
-            proxies = []
+            # 仅返回了部分内容，需重新请求完整内容
+            if status == 206:
+                return unknown, "full"
 
-        if proxies is None or len(proxies) == 0:
-            return False, True
+            chunks, size = [data], len(data)
+            for chunk in response.stream(64 * 1024):
+                size += len(chunk)
+                if size > utils.MAX_RESPONSE_SIZE:
+                    return unknown, ""
 
-        # 根据订阅信息判断是否有效
-        return is_expired(header=subscription, remain=remain, spare_time=spare_time, tolerance=tolerance)
-    except urllib.error.HTTPError as e:
-        try:
-            message = str(e.read(), encoding="utf8")
-        except:
-            message = ""
+                chunks.append(chunk)
+
+            data, drained = b"".join(chunks), True
 
-        expired = e.code == 404 or "token is error" in message
-        if not expired and e.code in [403, 503]:
-            return check_status(
+        content = str(data, encoding="utf8")
+
+        # response text is too short, ignore
+        if len(content) < 32:
+            return {"state": "invalid"}, ""
+
+        if utils.isb64encode(content):
+            available = True
+        else:
+            try:
+                proxies = yamlio.load_proxies(content)
+            except:
+                proxies = []
+
+            available = proxies is not None and len(proxies) > 0
+
+        if metadata is not None:
+            metadata.set(
                 url=url,
-                retry=retry - 1,
-                remain=remain,
-                spare_time=spare_time,
-                tolerance=tolerance,
-                connectable=connectable,
+                agent=agent,
+                headers=response.headers,
+                content=content,
+                proxies=available,
+                userinfo=subscription or "",
+                checked=time.time(),
             )
 
-        return False, expired
-    except Exception as e:
-        return check_status(
-            url=url,
-            retry=retry - 1,
-            remain=remain,
-            spare_time=spare_time,
-            tolerance=tolerance,
-            connectable=connectable,
-        )
+        if not available:
+            return {"state": "expired"}, ""
+
+        return {"state": "active", "userinfo": subscription or ""}, ""
+    except Exception:
+        return unknown, "retry"
+    finally:
+        # 丢弃未读取完的连接
+        utils.HTTP_CLIENT.close(response, discard=not drained)
 
 
 def is_expired(header: str, remain: float = 0, spare_time: float = 0, tolerance: float = 0) -> tuple[bool, bool]:
-    if utils.isblank(header):
+    info = utils.parse_userinfo(header)
+    if info is None:
         return True, False
 
     remain, spare_time, tolerance = (
@@ -1316,31 +1830,12 @@ def is_expired(header: str, remain: float = 0, spare_time: float = 0, tolerance:
         max(spare_time, 0),
         max(tolerance, 0),
     )
-    try:
-        infos = header.split(";")
-        upload, download, total, expire = 0, 0, 0, None
-        for info in infos:
-            words = info.split("=", maxsplit=1)
-            if len(words) <= 1:
-                continue
 
-            if "upload" == words[0].strip():
-                upload = eval(words[1])
-            elif "download" == words[0].strip():
-                download = eval(words[1])
-            elif "total" == words[0].strip():
-                total = eval(words[1])
-            elif "expire" == words[0].strip():
-                expire = None if utils.isblank(words[1]) else eval(words[1])
-
-        # 剩余流量大于 ${remain} GB 并且未过期则返回 True，否则返回 False
-        flag = total - (upload + download) > remain * pow(1024, 3) and (
-            expire is None or expire - time.time() > spare_time * 3600
-        )
-        expired = False if flag else (expire is not None and (expire + tolerance * 3600) <= time.time())
-        return flag, expired
-    except:
-        return True, False
+    # 剩余流量大于 ${remain} GB 并且未过期则返回 True，否则返回 False
+    expire, now = info.expire, time.time()
+    flag = info.remaining > remain * pow(1024, 3) and (expire is None or expire - now > spare_time * 3600)
+    expired = False if flag else (expire is not None and (expire + tolerance * 3600) <= now)
+    return flag, expired
 
 
 def is_available(url: str, retry: int = 2, remain: float = 0, spare_time: float = 0) -> bool:
@@ -1358,7 +1853,7 @@ def get_telegram_pages(channel: str) -> int:
         return 0
 
     url = f"https://t.me/s/{channel}"
-    content = utils.http_get(url=url)
+    content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
     before = 0
     try:
         regex = rf'<link\s+rel="canonical"\s+href="/s/{channel}\?before=(\d+)">'
@@ -1376,7 +1871,7 @@ def extract_airport_site(url: str) -> list[str]:
 
     logger.info(f"[AirPortCrawl] start collect airport, url: {url}")
 
-    content = utils.http_get(url=url)
+    content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
     if not content:
         logger.error(f"[CrawlError] cannot any content from url: {url}")
         return []
@@ -1423,7 +1918,7 @@ def collect_airport(
 
     def crawl_ccbh() -> dict:
         url = "https://ccbaohe.com/jcjd.html"
-        content = utils.http_get(url=url)
+        content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
         try:
             groups = re.split(r"【[^【]*】", content, flags=re.M)
             if not groups:
@@ -1483,7 +1978,7 @@ def collect_airport(
 
     def crawl_ygpy() -> dict:
         def get_links(url: str, prefix: str) -> list[str]:
-            content = utils.http_get(url=url)
+            content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
 
             groups = re.findall(r'href="(/vpn/\d{4}/\d{2}.html)"', content, flags=re.I)
             if not groups:
@@ -1520,7 +2015,7 @@ def collect_airport(
 
     def crawl_jctj(convert: bool = False) -> dict:
         url = "https://raw.githubusercontent.com/hwanz/SSR-V2ray-Trojan-vpn/main/README.md"
-        content = utils.http_get(url=url)
+        content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
         groups = re.findall(r"\[.*\]\((https?:\/\/[^\s\r\n]+)\)[^\r\n]+\d+G.*", content, flags=re.I)
         if not groups:
             return {}
@@ -1559,7 +2054,7 @@ def collect_airport(
 
     def run_crawl(url: str, separator: str, address_regex: str, coupon_regex: str) -> dict:
         url = utils.trim(url)
-        content = utils.http_get(url=url)
+        content = utils.http_get(url=url, limiter=utils.HTTP_LIMITER)
         if not content:
             return {}
 
@@ -0,0 +1,546 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import base64
+import json
+import os
+import re
+import urllib.parse
+from functools import cache
+
+import subconverter
+import utils
+from logger import logger
+
+PATH = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+# 单行分享链接
+LINK_REGEX = re.compile(r"^([a-zA-Z0-9]+)://", flags=re.I)
+
+
+def b64decode(text: str) -> str:
+    text = utils.trim(text).replace("-", "+").replace("_", "/")
+    text = re.sub(r"\s+", "", text)
+    if len(text) % 4 != 0:
+        text += "=" * (4 - len(text) % 4)
+
+    return base64.b64decode(text).decode(encoding="utf8", errors="ignore")
+
+
+# 无法解析的链接占比超过该值时交由 subconverter 处理
+MAX_FAILURE_RATIO = 0.2
+
+
+@cache
+def load_preference() -> tuple[list, list, bool]:
+    """load exclude, rename and emoji removal rules from subconverter's pref.toml, keep the same behavior as subconverter"""
+
+    excludes, renames, emoji = [], [], False
+    filepath = os.path.join(PATH, "subconverter", "pref.toml")
+    if not os.path.exists(filepath) or not os.path.isfile(filepath):
+        return excludes, renames, emoji
+
+    try:
+        import tomllib
+
+        with open(filepath, "rb") as f:
+            config = tomllib.load(f)
+
+        for regex in config.get("common", {}).get("exclude_remarks", []):
+            excludes.append(re.compile(regex))
+
+        for rule in config.get("node_pref", {}).get("rename_node", []):
+            match, replace = rule.get("match", ""), rule.get("replace", "")
+            if not match or not isinstance(replace, str):
+                continue
+
+            # subconverter 使用 $n 引用分组
+            replace = re.sub(r"\$(\d+)", r"\\g<\1>", replace)
+            renames.append((re.compile(match), replace))
+
+        emoji = config.get("emojis", {}).get("remove_old_emoji", False) is True
+    except ImportError:
+        logger.warning("[DecodeWarn] tomllib is unavailable, subconverter preference will be ignored")
+    except:
+        logger.error(f"[DecodeError] cannot load subconverter preference, file: {filepath}")
+
+    return excludes, renames, emoji
+
+
+def remove_emoji(name: str) -> str:
+    """same as removeEmoji of subconverter, which drops leading 4-byte characters starting with 0xF0 0x9F"""
+    text = name
+    while text and "\U0001F000" <= text[0] <= "\U0001FFFF":
+        text = text[1:]
+
+    # 全部为 emoji 时保留原名称
+    return text.strip(" ") if text else name
+
+
+def query_params(query: str) -> dict:
+    if not query:
+        return {}
+
+    return {k: v[0] for k, v in urllib.parse.parse_qs(query, keep_blank_values=True).items() if v}
+
+
+def is_true(value: str) -> bool:
+    return utils.trim(str(value)).lower() in ["1", "true", "yes"]
+
+
+def split_list(value: str) -> list:
+    return [x.strip() for x in utils.trim(value).split(",") if x.strip()]
+
+
+def split_address(address: str) -> tuple[str, int]:
+    address = utils.trim(address)
+    if address.startswith("["):
+        # ipv6
+        host, _, port = address[1:].partition("]")
+        port = port.lstrip(":")
+    else:
+        host, _, port = address.rpartition(":")
+
+    return host, int(port)
+
+
+def transport(item: dict, network: str, host: str = "", path: str = "", service: str = "") -> None:
+    """fill transport options of vmess, vless and trojan"""
+
+    network = utils.trim(network).lower() or "tcp"
+    if network == "ws" or network == "httpupgrade":
+        item["network"] = network
+        opts = {"path": path or "/"}
+        if host:
+            opts["headers"] = {"Host": host}
+        item["ws-opts"] = opts
+    elif network == "h2":
+        item["network"] = network
+        opts = {"path": path or "/"}
+        if host:
+            opts["host"] = split_list(host)
+        item["h2-opts"] = opts
+    elif network == "http":
+        item["network"] = network
+        opts = {"path": [path or "/"]}
+        if host:
+            opts["headers"] = {"Host": split_list(host)}
+        item["http-opts"] = opts
+    elif network == "grpc":
+        item["network"] = network
+        item["grpc-opts"] = {"grpc-service-name": service or path}
+    elif item.get("type", "") != "vmess":
+        # vmess 的 tcp 传输不需要显式声明 network
+        item["network"] = network
+
+
+def parse_vmess(link: str) -> dict:
+    content = link[8:]
+    name = ""
+    if "#" in content:
+        content, name = content.split("#", maxsplit=1)
+
+    config = json.loads(b64decode(content))
+    server, port = utils.trim(config.get("add", "")), int(config.get("port", 0))
+    name = utils.trim(config.get("ps", "")) or urllib.parse.unquote(name) or f"{server}:{port}"
+
+    item = {
+        "name": name,
+        "type": "vmess",
+        "server": server,
+        "port": port,
+        "uuid": utils.trim(config.get("id", "")),
+        "alterId": int(config.get("aid", 0) or 0),
+        "cipher": utils.trim(config.get("scy", "")) or "auto",
+    }
+
+    tls = utils.trim(config.get("tls", "")).lower() == "tls"
+    if tls:
+        item["tls"] = True
+        sni = utils.trim(config.get("sni", "")) or utils.trim(config.get("host", ""))
+        if sni:
+            item["servername"] = sni
+
+    network = utils.trim(config.get("net", "")).lower()
+    if network == "tcp" and utils.trim(config.get("type", "")).lower() == "http":
+        network = "http"
+
+    host, path = utils.trim(config.get("host", "")), utils.trim(config.get("path", ""))
+    transport(item=item, network=network, host=host, path=path, service=path)
+    return item
+
+
+def parse_vless(link: str) -> dict:
+    result = urllib.parse.urlsplit(link)
+    params = query_params(result.query)
+    server, port = split_address(result.netloc.rsplit("@", maxsplit=1)[-1])
+
+    item = {
+        "name": urllib.parse.unquote(result.fragment) or f"{server}:{port}",
+        "type": "vless",
+        "server": server,
+        "port": port,
+        "uuid": urllib.parse.unquote(result.netloc.rsplit("@", maxsplit=1)[0]),
+    }
+
+    security = utils.trim(params.get("security", "")).lower()
+    if security in ["tls", "reality"]:
+        item["tls"] = True
+        sni = params.get("sni", "") or params.get("peer", "")
+        if sni:
+            item["servername"] = sni
+        if params.get("fp", ""):
+            item["client-fingerprint"] = params.get("fp")
+        if security == "reality":
+            opts = {"public-key": params.get("pbk", "")}
+            if params.get("sid", ""):
+                opts["short-id"] = params.get("sid")
+            item["reality-opts"] = opts
+
+    if params.get("flow", ""):
+        item["flow"] = params.get("flow")
+    if is_true(params.get("allowInsecure", "")):
+        item["skip-cert-verify"] = True
+
+    network = params.get("type", "tcp")
+    if network == "tcp" and params.get("headerType", "") == "http":
+        network = "http"
+
+    transport(
+        item=item,
+        network=network,
+        host=params.get("host", ""),
+        path=params.get("path", ""),
+        service=params.get("serviceName", ""),
+    )
+    return item
+
+
+def parse_trojan(link: str) -> dict:
+    result = urllib.parse.urlsplit(link)
+    params = query_params(result.query)
+    server, port = split_address(result.netloc.rsplit("@", maxsplit=1)[-1])
+
+    item = {
+        "name": urllib.parse.unquote(result.fragment) or f"{server}:{port}",
+        "type": "trojan",
+        "server": server,
+        "port": port,
+        "password": urllib.parse.unquote(result.netloc.rsplit("@", maxsplit=1)[0]),
+    }
+
+    sni = params.get("sni", "") or params.get("peer", "")
+    if sni:
+        item["sni"] = sni
+    if params.get("alpn", ""):
+        item["alpn"] = split_list(params.get("alpn"))
+    if is_true(params.get("allowInsecure", "")):
+        item["skip-cert-verify"] = True
+
+    network = utils.trim(params.get("type", "")).lower()
+    if network in ["ws", "grpc"]:
+        transport(
+            item=item,
+            network=network,
+            host=params.get("host", ""),
+            path=params.get("path", ""),
+            service=params.get("serviceName", ""),
+        )
+
+    return item
+
+
+def parse_ss(link: str) -> dict:
+    content, name = link[5:], ""
+    if "#" in content:
+        content, name = content.split("#", maxsplit=1)
+
+    content, _, query = content.partition("?")
+    content = content.rstrip("/")
+    if "@" in content:
+        userinfo, address = content.rsplit("@", maxsplit=1)
+        userinfo = urllib.parse.unquote(userinfo)
+        if ":" not in userinfo:
+            userinfo = b64decode(userinfo)
+    else:
+        userinfo, address = b64decode(content).rsplit("@", maxsplit=1)
+
+    cipher, password = userinfo.split(":", maxsplit=1)
+    server, port = split_address(address)
+
+    item = {
+        "name": urllib.parse.unquote(name) or f"{server}:{port}",
+        "type": "ss",
+        "server": server,
+        "port": port,
+        "cipher": cipher.lower(),
+        "password": password,
+    }
+
+    plugin = query_params(query).get("plugin", "")
+    if plugin:
+        words = plugin.split(";")
+        options = {}
+        for word in words[1:]:
+            k, _, v = word.partition("=")
+            options[k.strip()] = v.strip()
+
+        name = words[0].strip()
+        if name in ["obfs-local", "simple-obfs"]:
+            item["plugin"] = "obfs"
+            opts = {"mode": options.get("obfs", "")}
+            if options.get("obfs-host", ""):
+                opts["host"] = options.get("obfs-host")
+            item["plugin-opts"] = opts
+        elif name == "v2ray-plugin":
+            item["plugin"] = name
+            opts = {"mode": options.get("mode", "") or "websocket"}
+            if "tls" in options:
+                opts["tls"] = True
+            if options.get("host", ""):
+                opts["host"] = options.get("host")
+            if options.get("path", ""):
+                opts["path"] = options.get("path")
+            item["plugin-opts"] = opts
+        else:
+            # 交由 verify 过滤不支持的插件
+            item["plugin"] = name
+
+    return item
+
+
+def parse_ssr(link: str) -> dict:
+    content = b64decode(link[6:])
+    main, _, query = content.partition("/?")
+    if not query and "?" in main:
+        main, _, query = main.partition("?")
+
+    # server 可能为 ipv6，从右侧拆分
+    server, port, protocol, cipher, obfs, password = main.rsplit(":", maxsplit=5)
+    params = query_params(query)
+    decode = lambda k: b64decode(params.get(k, "")) if params.get(k, "") else ""
+
+    port = int(port)
+    item = {
+        "name": decode("remarks") or f"{server}:{port}",
+        "type": "ssr",
+        "server": server,
+        "port": port,
+        "cipher": cipher,
+        "password": b64decode(password),
+        "obfs": obfs,
+        "protocol": protocol,
+    }
+
+    obfs_param, protocol_param = decode("obfsparam"), decode("protoparam")
+    if obfs_param:
+        item["obfs-param"] = obfs_param
+    if protocol_param:
+        item["protocol-param"] = protocol_param
+
+    return item
+
+
+def parse_hysteria(link: str) -> dict:
+    result = urllib.parse.urlsplit(link)
+    params = query_params(result.query)
+    server, port = split_address(result.netloc.rsplit("@", maxsplit=1)[-1])
+
+    item = {
+        "name": urllib.parse.unquote(result.fragment) or f"{server}:{port}",
+        "type": "hysteria",
+        "server": server,
+        "port": port,
+        "auth-str": params.get("auth", "") or urllib.parse.unquote(result.username or ""),
+    }
+
+    if params.get("peer", "") or params.get("sni", ""):
+        item["sni"] = params.get("peer", "") or params.get("sni", "")
+    if params.get("protocol", ""):
+        item["protocol"] = params.get("protocol")
+    if params.get("alpn", ""):
+        item["alpn"] = split_list(params.get("alpn"))
+    if params.get("obfsParam", ""):
+        item["obfs"] = params.get("obfsParam")
+    if params.get("upmbps", ""):
+        item["up"] = params.get("upmbps")
+    if params.get("downmbps", ""):
+        item["down"] = params.get("downmbps")
+    if params.get("mport", ""):
+        item["ports"] = params.get("mport")
+    if is_true(params.get("insecure", "")):
+        item["skip-cert-verify"] = True
+
+    return item
+
+
+def parse_hysteria2(link: str) -> dict:
+    result = urllib.parse.urlsplit(link)
+    params = query_params(result.query)
+    userinfo, _, address = result.netloc.rpartition("@")
+    server, port = split_address(address)
+
+    item = {
+        "name": urllib.parse.unquote(result.fragment) or f"{server}:{port}",
+        "type": "hysteria2",
+        "server": server,
+        "port": port,
+        "password": urllib.parse.unquote(userinfo) or params.get("auth", ""),
+    }
+
+    if params.get("sni", ""):
+        item["sni"] = params.get("sni")
+    if params.get("obfs", ""):
+        item["obfs"] = params.get("obfs")
+    if params.get("obfs-password", ""):
+        item["obfs-password"] = params.get("obfs-password")
+    if params.get("alpn", ""):
+        item["alpn"] = split_list(params.get("alpn"))
+    if params.get("mport", ""):
+        item["ports"] = params.get("mport")
+    if is_true(params.get("insecure", "")):
+        item["skip-cert-verify"] = True
+
+    return item
+
+
+def parse_tuic(link: str) -> dict:
+    result = urllib.parse.urlsplit(link)
+    params = query_params(result.query)
+    userinfo, _, address = result.netloc.rpartition("@")
+    server, port = split_address(address)
+    uuid, _, password = urllib.parse.unquote(userinfo).partition(":")
+
+    item = {
+        "name": urllib.parse.unquote(result.fragment) or f"{server}:{port}",
+        "type": "tuic",
+        "server": server,
+        "port": port,
+        "uuid": uuid,
+    }
+
+    if password:
+        item["password"] = password
+    if params.get("sni", ""):
+        item["sni"] = params.get("sni")
+    if params.get("alpn", ""):
+        item["alpn"] = split_list(params.get("alpn"))
+    if params.get("congestion_control", ""):
+        item["congestion-controller"] = params.get("congestion_control")
+    if params.get("udp_relay_mode", ""):
+        item["udp-relay-mode"] = params.get("udp_relay_mode")
+    if is_true(params.get("disable_sni", "")):
+        item["disable-sni"] = True
+    if is_true(params.get("allow_insecure", "")) or is_true(params.get("insecure", "")):
+        item["skip-cert-verify"] = True
+
+    return item
+
+
+PARSERS = {
+    "vmess": parse_vmess,
+    "vless": parse_vless,
+    "trojan": parse_trojan,
+    "ss": parse_ss,
+    "ssr": parse_ssr,
+    "hysteria": parse_hysteria,
+    "hysteria2": parse_hysteria2,
+    "hy2": parse_hysteria2,
+    "tuic": parse_tuic,
+}
+
+
+def parse_link(link: str) -> dict:
+    link = utils.trim(link)
+    match = LINK_REGEX.match(link)
+    if not match:
+        return None
+
+    parser = PARSERS.get(match.group(1).lower(), None)
+    if not parser:
+        return None
+
+    try:
+        return parser(link)
+    except Exception:
+        return None
+
+
+def extract_links(text: str) -> list[str]:
+    """split subscription content into share links, return None if the content is not a list of share links"""
+
+    text = utils.trim(text)
+    if not text or (text.startswith("{") and text.endswith("}")):
+        return None
+
+    if utils.isb64encode(text):
+        try:
+            text = b64decode(text)
+        except Exception:
+            return None
+
+    links = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        match = LINK_REGEX.match(line)
+
+        # 存在无法识别的格式，交由 subconverter 处理
+        if not match or match.group(1).lower() not in PARSERS:
+            return None
+
+        links.append(line)
+
+    return links
+
+
+def decode(text: str, ignore: bool = False) -> list[dict]:
+    """
+    decode v2ray subscription (plain or base64 encoded share links) into clash proxies without subconverter,
+    return None if the content contains any format that cannot be handled or too many links cannot be parsed,
+    so that caller can fallback to subconverter
+    """
+
+    links = extract_links(text)
+    if links is None:
+        return None
+
+    excludes, renames, emoji = load_preference()
+    if ignore:
+        excludes = [re.compile(subconverter.SIMPLE_EXCLUDE_REMARKS)]
+
+    proxies, failed = [], 0
+    for link in links:
+        item = parse_link(link)
+        if not item:
+            failed += 1
+            continue
+
+        name = utils.trim(item.get("name", ""))
+        if any(pattern.search(name) for pattern in excludes):
+            continue
+
+        if emoji:
+            name = remove_emoji(name)
+
+        for pattern, replace in renames:
+            name = pattern.sub(replace, name)
+
+        # 与 subconverter 的 node_pref 配置保持一致
+        item["name"] = name
+        item["udp"] = True
+        item["skip-cert-verify"] = True
+        proxies.append(item)
+
+    if failed > 0:
+        logger.warning(f"[DecodeWarn] {failed} of {len(links)} share links cannot be parsed")
+
+    # 无法解析的链接过多时交由 subconverter 处理
+    if not links or failed > len(links) * MAX_FAILURE_RATIO:
+        return None
+
+    return proxies
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import hashlib
+import json
+import os
+import threading
+import time
+import typing
+from http.client import HTTPMessage
+
+from logger import logger
+
+# 默认缓存目录
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache")
+
+
+def digest(content: str) -> str:
+    return hashlib.sha1(content.encode("utf8")).hexdigest() if content else ""
+
+
+class HttpCache(object):
+    """
+    http metadata (etag, last-modified and content hash) and decoded proxies of subscriptions,
+    every record is an individual json file so that it can be shared by multiple processes
+    """
+
+    def __init__(self, directory: str, ttl: float):
+        # ttl 单位为秒，超过有效期未更新的记录将被清理
+        self.directory = directory
+        self.ttl = ttl
+        self.evict()
+
+    def path(self, category: str, key: str) -> str:
+        return os.path.join(self.directory, category, f"{key}.json")
+
+    def read(self, category: str, key: str) -> dict:
+        filepath = self.path(category, key)
+        if not key or not os.path.isfile(filepath):
+            return {}
+
+        if time.time() - os.path.getmtime(filepath) > self.ttl:
+            return {}
+
+        try:
+            with open(filepath, "r", encoding="utf8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def write(self, category: str, key: str, data: dict) -> bool:
+        if not key or not isinstance(data, dict):
+            return False
+
+        filepath = self.path(category, key)
+        try:
+            content = json.dumps(data)
+        except Exception:
+            logger.warning(f"[HttpCacheWarn] skip unserializable record: {key}")
+            return False
+
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+            # 临时文件名需唯一，避免多进程同时写入同一记录
+            tempfile = f"{filepath}.{os.getpid()}-{threading.get_ident()}.tmp"
+            with open(tempfile, "w+", encoding="utf8") as f:
+                f.write(content)
+                f.flush()
+
+            os.replace(tempfile, filepath)
+            return True
+        except Exception:
+            logger.error(f"[HttpCacheError] cannot save cache file: {filepath}")
+            return False
+
+    def evict(self) -> int:
+        count, now = 0, time.time()
+        for category in ["http", "nodes"]:
+            directory = os.path.join(self.directory, category)
+            if not os.path.isdir(directory):
+                continue
+
+            for filename in os.listdir(directory):
+                filepath = os.path.join(directory, filename)
+                try:
+                    if now - os.path.getmtime(filepath) > self.ttl:
+                        os.remove(filepath)
+                        count += 1
+                except Exception:
+                    pass
+
+        return count
+
+    @staticmethod
+    def key(url: str, agent: str) -> str:
+        # 不同 User-Agent 返回的内容格式可能不同
+        return hashlib.sha1(f"{agent}\n{url}".encode("utf8")).hexdigest()
+
+    def get(self, url: str, agent: str) -> dict:
+        """http metadata of the last response"""
+        return self.read("http", self.key(url, agent))
+
+    def set(self, url: str, agent: str, headers: HTTPMessage, content: str, **extras) -> dict:
+        """save http metadata of the response, extras will be saved together"""
+        record = {
+            "etag": headers.get("ETag", "") if headers else "",
+            "modified": headers.get("Last-Modified", "") if headers else "",
+            "digest": digest(content),
+        }
+        record.update(extras)
+
+        self.write("http", self.key(url, agent), record)
+        return record
+
+    def touch(self, url: str, agent: str, **extras) -> dict:
+        """refresh the record after receiving 304"""
+        record = self.get(url, agent)
+        if record:
+            record.update(extras)
+            self.write("http", self.key(url, agent), record)
+
+        return record
+
+    @staticmethod
+    def conditions(record: dict) -> dict:
+        """conditional request headers for the record"""
+        headers = {}
+        if not record:
+            return headers
+
+        if record.get("etag", ""):
+            headers["If-None-Match"] = record.get("etag")
+        if record.get("modified", ""):
+            headers["If-Modified-Since"] = record.get("modified")
+
+        return headers
+
+    def load_nodes(self, content_hash: str, variant: str = "") -> dict:
+        """decoded proxies and reject reasons of the content"""
+        key = f"{content_hash}-{variant}" if content_hash and variant else content_hash
+        data = self.read("nodes", key)
+        if not isinstance(data.get("nodes", None), list):
+            return {}
+
+        # 刷新修改时间，避免仍在使用的记录被清理
+        try:
+            os.utime(self.path("nodes", key))
+        except Exception:
+            pass
+
+        return data
+
+    def save_nodes(self, content_hash: str, nodes: list, rejects: dict = None, variant: str = "") -> bool:
+        if not content_hash or not isinstance(nodes, list):
+            return False
+
+        key = f"{content_hash}-{variant}" if variant else content_hash
+        return self.write("nodes", key, {"nodes": nodes, "rejects": rejects or {}})
+
+
+class StatusCache(object):
+    """
+    status of subscriptions checked in current process, concurrent callers for the same url share one request
+    """
+
+    def __init__(self, ttl: float):
+        # ttl 单位为秒
+        self.ttl = ttl
+        self.records = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, url: str) -> dict:
+        with self.lock:
+            record = self.records.get(url, None)
+
+        if not record or time.time() - record.get("time", 0) > self.ttl:
+            return {}
+
+        return record
+
+    def set(self, url: str, **status) -> dict:
+        record = dict(status)
+        record["time"] = time.time()
+
+        with self.lock:
+            self.records[url] = record
+
+        return record
+
+    def load(self, url: str, func: typing.Callable[[], dict]) -> dict:
+        """returns the cached status, or calls func to check it and caches the result if it's cacheable"""
+        record = self.get(url)
+        if record or self.ttl <= 0:
+            return record or func()
+
+        with self.lock:
+            lock = self.locks.setdefault(url, threading.Lock())
+
+        # 同一链接并发检查时只请求一次
+        try:
+            with lock:
+                record = self.get(url)
+                if not record:
+                    status = func() or {}
+
+                    # 请求失败的结果不缓存，后续调用时重试
+                    if not status.get("cacheable", True):
+                        return status
+
+                    record = self.set(url, **status)
+
+            return record
+        finally:
+            # 检查完成后移除锁，避免其数量随链接数持续增长
+            with self.lock:
+                if self.locks.get(url, None) is lock:
+                    self.locks.pop(url, None)
+
+
+# 每个进程共享一个实例
+_INSTANCE = None
+_LOCK = threading.Lock()
+
+_STATUS = None
+
+
+def instance() -> HttpCache | None:
+    """cache under DEFAULT_DIRECTORY if environment variable HTTP_CACHE_TTL (hours) is positive"""
+    global _INSTANCE
+
+    try:
+        ttl = float(os.environ.get("HTTP_CACHE_TTL", "0").strip() or 0)
+    except ValueError:
+        logger.warning("[HttpCacheWarn] invalid HTTP_CACHE_TTL, http cache is disabled")
+        ttl = 0
+
+    if ttl <= 0:
+        return None
+
+    with _LOCK:
+        if _INSTANCE is None or _INSTANCE.ttl != ttl * 3600:
+            _INSTANCE = HttpCache(directory=DEFAULT_DIRECTORY, ttl=ttl * 3600)
+
+        return _INSTANCE
+
+
+def statuses() -> StatusCache:
+    """status cache of current process, records expire after STATUS_CACHE_TTL (minutes, default 30)"""
+    global _STATUS
+
+    try:
+        ttl = float(os.environ.get("STATUS_CACHE_TTL", "30").strip() or 30)
+    except ValueError:
+        logger.warning("[HttpCacheWarn] invalid STATUS_CACHE_TTL, use default value 30 minutes")
+        ttl = 30
+
+    ttl = max(0, ttl) * 60
+    with _LOCK:
+        if _STATUS is None or _STATUS.ttl != ttl:
+            _STATUS = StatusCache(ttl=ttl)
+
+        return _STATUS
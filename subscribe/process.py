@@ -9,19 +9,18 @@ import copy
 import itertools
 import json
 import os
-import random
 import re
-import subprocess
 import sys
 import time
 from copy import deepcopy
 
+import checker
 import crawl
 import executable
 import push
 import utils
 import workflow
-import yaml
+import yamlio
 from airport import AirPort
 from logger import logger
 from origin import Origin
@@ -451,8 +450,14 @@ def aggregate(args: argparse.Namespace) -> None:
     if os.path.exists(generate_conf) and os.path.isfile(generate_conf):
         os.remove(generate_conf)
 
+    # 可选：启动常驻的 subconverter 服务，避免每次转换都启动新进程
+    subconverter.startup(binname=subconverter_bin)
+
     logger.info(f"start fetch all subscriptions, count: [{len(tasks)}]")
-    results = utils.multi_process_run(func=workflow.executewrapper, tasks=tasks)
+    try:
+        results = utils.multi_process_run(func=workflow.executewrapper, tasks=tasks)
+    finally:
+        subconverter.shutdown()
 
     subscribes, datasets = {}, {}
     for i in range(len(results)):
@@ -465,114 +470,125 @@ def aggregate(args: argparse.Namespace) -> None:
 
         datasets[data[0]] = data[1]
 
-    for k, v in groups.items():
-        if not v:
-            logger.error(f"task is empty, group=[{k}]")
-            continue
-
-        arrays = [datasets.get(x, []) for x in v]
-        proxies = list(itertools.chain.from_iterable(arrays))
-        if len(proxies) == 0:
-            logger.error(f"exit because cannot fetch any proxy node, group=[{k}]")
-            continue
-
-        workspace = os.path.join(PATH, "clash")
-        binpath = os.path.join(workspace, clash_bin)
-        filename = "config.yaml"
-        proxies = clash.generate_config(workspace, proxies, filename)
-
-        # filer
-        skip = utils.trim(os.environ.get("SKIP_ALIVE_CHECK", "false")).lower() in ["true", "1"]
-        nochecks, starttime = proxies, time.time()
-
-        if not skip:
-            checks, nochecks = workflow.liveness_fillter(proxies=proxies)
-            if checks:
-                # executable
-                utils.chmod(binpath)
-
-                logger.info(f"startup clash now, workspace: {workspace}, config: {filename}")
-                process = subprocess.Popen(
-                    [
-                        binpath,
-                        "-d",
-                        workspace,
-                        "-f",
-                        os.path.join(workspace, filename),
-                    ]
-                )
-
-                logger.info(f"clash start success, begin check proxies, group: {k}\tcount: {len(checks)}")
-                time.sleep(random.randint(5, 8))
-
-                params = [
-                    [p, clash.EXTERNAL_CONTROLLER, args.timeout, args.url, delay, False]
-                    for p in checks
-                    if isinstance(p, dict)
-                ]
-
-                # check
-                masks = utils.multi_thread_run(
-                    func=clash.check,
-                    tasks=params,
-                    num_threads=args.num,
-                    show_progress=display,
-                )
-
-                # close clash client
-                try:
-                    process.terminate()
-                except:
-                    logger.error(f"terminate clash process error, group: {k}")
-
-                availables = [checks[i] for i in range(len(checks)) if masks[i]]
-                nochecks.extend(availables)
-
-                dead = len(checks) - len(availables)
-                logger.info(f"proxies check finished, total: {len(checks)}, alive: {len(availables)}, dead: {dead}")
+    def deliver(group: str, content: str, count: int, starttime: float) -> None:
+        # save to remote server
+        persisted = pushtool.push_to(content=content, push_conf=push_configs.get(group, {}), group=group)
+        if content and not persisted:
+            filename = os.path.join(PATH, "data", f"{group}.txt")
 
-        for item in nochecks:
-            item.pop("sub", "")
+            logger.error(f"failed to push config to remote server, group: {group}, save it to {filename}")
+            utils.write_file(filename=filename, lines=content)
 
-        if len(nochecks) <= 0:
-            logger.error(f"cannot fetch any proxy, group=[{k}], cost: {time.time()-starttime:.2f}s")
-            continue
+        cost = "{:.2f}s".format(time.time() - starttime)
+        logger.info(f"group [{group}] process finished, count: {count}, cost: {cost}")
+
+    # 需要经 subconverter 转换的分组
+    conversions = []
+
+    # clash 实例在首次检测时启动，之后各分组复用
+    workspace = os.path.join(PATH, "clash")
+    cluster = checker.Cluster(
+        workspace=workspace,
+        binpath=os.path.join(workspace, clash_bin),
+        shards=args.workers,
+        cache=checker.liveness_cache(os.path.join(PATH, "data")),
+    )
 
-        data = {"proxies": nochecks}
-        push_conf = push_configs.get(k, {})
-        target = utils.trim(push_conf.get("target", "")) or "clash"
-        mixed = target in ["v2ray", "mixed"]
+    if os.path.exists(generate_conf) and os.path.isfile(generate_conf):
+        os.remove(generate_conf)
 
-        # compress if data is too large
-        compress = False if mixed else len(nochecks) >= 300
+    try:
+        for k, v in groups.items():
+            if not v:
+                logger.error(f"task is empty, group=[{k}]")
+                continue
 
-        persisted, content = False, ""
+            arrays = [datasets.get(x, []) for x in v]
+            proxies = list(itertools.chain.from_iterable(arrays))
+            if len(proxies) == 0:
+                logger.error(f"exit because cannot fetch any proxy node, group=[{k}]")
+                continue
 
-        if mixed or compress:
-            source_file = "config.yaml"
-            filepath = os.path.join(PATH, "subconverter", source_file)
-            with open(filepath, "w+", encoding="utf8") as f:
-                yaml.dump(data, f, allow_unicode=True)
+            proxies = clash.filter_proxies(proxies).get("proxies", [])
 
-            # convert
-            dest_file = "subscribe.txt"
-            artifact = "convert"
+            # filer
+            skip = utils.trim(os.environ.get("SKIP_ALIVE_CHECK", "false")).lower() in ["true", "1"]
+            nochecks, starttime = proxies, time.time()
 
-            if os.path.exists(generate_conf) and os.path.isfile(generate_conf):
-                os.remove(generate_conf)
+            if not skip:
+                checks, nochecks = workflow.liveness_fillter(proxies=proxies)
+                if checks:
+                    logger.info(f"begin check proxies, group: {k}\tcount: {len(checks)}")
 
-            success = subconverter.generate_conf(generate_conf, artifact, source_file, dest_file, target)
-            if not success:
-                logger.error(f"cannot generate subconverter config file, group=[{k}]")
+                    # 所有分组共用 clash 实例，通过热加载切换节点
+                    try:
+                        masks = cluster.check(
+                            proxies=checks,
+                            timeout=args.timeout,
+                            test_url=args.url,
+                            delay=delay,
+                            concurrency=args.num,
+                            show_progress=display,
+                        )
+                    except (TimeoutError, RuntimeError, OSError) as e:
+                        logger.error(f"skip check proxies because clash check failed, group: {k}, message: {str(e)}")
+                        masks = [False] * len(checks)
+
+                    availables = [checks[i] for i in range(len(checks)) if masks[i]]
+                    nochecks.extend(availables)
+
+                    dead = len(checks) - len(availables)
+                    logger.info(f"proxies check finished, total: {len(checks)}, alive: {len(availables)}, dead: {dead}")
+
+            for item in nochecks:
+                item.pop("sub", "")
+
+            if len(nochecks) <= 0:
+                logger.error(f"cannot fetch any proxy, group=[{k}], cost: {time.time()-starttime:.2f}s")
                 continue
 
-            if subconverter.convert(binname=subconverter_bin, artifact=artifact):
-                filepath = os.path.join(PATH, "subconverter", dest_file)
-
-                if not os.path.exists(filepath) or not os.path.isfile(filepath):
-                    logger.error(f"converted file {filepath} not found, group: {k}")
+            data = {"proxies": nochecks}
+            push_conf = push_configs.get(k, {})
+            target = utils.trim(push_conf.get("target", "")) or "clash"
+            mixed = target in ["v2ray", "mixed"]
+
+            # compress if data is too large
+            compress = False if mixed else len(nochecks) >= 300
+
+            if mixed or compress:
+                # 所有分组统一转换，只调用一次 subconverter
+                artifact = f"convert-{len(conversions)}"
+                source_file, dest_file = f"{artifact}.yaml", f"{artifact}.txt"
+                filepath = os.path.join(PATH, "subconverter", source_file)
+                with open(filepath, "w+", encoding="utf8") as f:
+                    yamlio.dump(data, f)
+
+                success = subconverter.generate_conf(generate_conf, artifact, source_file, dest_file, target)
+                if not success:
+                    logger.error(f"cannot generate subconverter config file, group=[{k}]")
+                    workflow.cleanup(os.path.join(PATH, "subconverter"), [source_file])
                     continue
 
+                conversions.append((k, artifact, mixed, len(nochecks), starttime))
+            else:
+                content = yamlio.dump(data)
+                deliver(group=k, content=content, count=len(nochecks), starttime=starttime)
+    finally:
+        # 异常退出时也需关闭 clash 实例并保存存活检测缓存
+        cluster.stop()
+
+    if conversions:
+        artifacts = [x[1] for x in conversions]
+        success = subconverter.batch_convert(binname=subconverter_bin, artifacts=artifacts)
+        logger.info(f"subconverter completed, artifacts: {artifacts}\tsuccess=[{success}]")
+
+        for k, artifact, mixed, count, starttime in conversions:
+            source_file, dest_file = f"{artifact}.yaml", f"{artifact}.txt"
+            filepath = os.path.join(PATH, "subconverter", dest_file)
+
+            if not success or not os.path.exists(filepath) or not os.path.isfile(filepath):
+                logger.error(f"converted file {filepath} not found, group: {k}")
+            else:
                 content = " "
                 with open(filepath, "r", encoding="utf8") as f:
                     content = f.read()
@@ -583,28 +599,15 @@ def aggregate(args: argparse.Namespace) -> None:
                         content = base64.b64encode(content.encode(encoding="UTF8")).decode(encoding="UTF8")
                     except Exception as e:
                         logger.error(f"base64 encode error, message: {str(e)}")
-                        continue
+                        content = ""
 
-                # save to remote server
-                persisted = pushtool.push_to(content=content, push_conf=push_conf, group=k)
+                if content:
+                    deliver(group=k, content=content, count=count, starttime=starttime)
 
             # clean workspace
-            workflow.cleanup(
-                os.path.join(PATH, "subconverter"),
-                [source_file, dest_file, "generate.ini"],
-            )
-        else:
-            content = yaml.dump(data=data, allow_unicode=True)
-            persisted = pushtool.push_to(content=content, push_conf=push_conf, group=k)
-
-        if content and not persisted:
-            filename = os.path.join(PATH, "data", f"{k}.txt")
+            workflow.cleanup(os.path.join(PATH, "subconverter"), [source_file, dest_file])
 
-            logger.error(f"failed to push config to remote server, group: {k}, save it to {filename}")
-            utils.write_file(filename=filename, lines=content)
-
-        cost = "{:.2f}s".format(time.time() - starttime)
-        logger.info(f"group [{k}] process finished, count: {len(nochecks)}, cost: {cost}")
+        workflow.cleanup(os.path.join(PATH, "subconverter"), ["generate.ini"])
 
     config = {
         "domains": sites,
@@ -616,6 +619,9 @@ def aggregate(args: argparse.Namespace) -> None:
     skip_remark = utils.trim(os.environ.get("SKIP_REMARK", "false")).lower() in ["true", "1"]
     workflow.refresh(config=config, push=pushtool, alives=dict(subscribes), skip_remark=skip_remark)
 
+    # 节点校验未通过的原因统计
+    workflow.report_rejects(tasks=tasks, results=results)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -710,6 +716,15 @@ if __name__ == "__main__":
         help="test url",
     )
 
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        required=False,
+        default=0,
+        help="number of clash instances for checking proxies, defaults to the number of cpu cores",
+    )
+
     args = parser.parse_args()
     utils.load_dotenv(args.envrionment)
 
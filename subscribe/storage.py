@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import json
+import os
+import threading
+import time
+
+from logger import logger
+
+
+class Store(object):
+    """thread-safe key-value store with ttl, persisted as a json file when filepath is not empty"""
+
+    def __init__(self, filepath: str = "", ttl: float = 0):
+        # ttl 单位为秒，小于等于 0 表示永不过期
+        self.filepath = filepath
+        self.ttl = ttl
+        self.records = {}
+        self.lock = threading.RLock()
+
+        self.load()
+
+    def load(self) -> None:
+        if not self.filepath or not os.path.isfile(self.filepath):
+            return
+
+        try:
+            with open(self.filepath, "r", encoding="utf8") as f:
+                records = json.load(f)
+
+            if isinstance(records, dict):
+                now = time.time()
+                with self.lock:
+                    self.records = {
+                        k: v
+                        for k, v in records.items()
+                        if isinstance(v, dict) and (v.get("expire", 0) <= 0 or v.get("expire", 0) > now)
+                    }
+        except Exception:
+            logger.warning(f"[StoreWarn] ignore broken cache file: {self.filepath}")
+
+    def save(self) -> bool:
+        if not self.filepath:
+            return False
+
+        try:
+            self.evict()
+            with self.lock:
+                content = json.dumps(self.records)
+
+            directory = os.path.abspath(os.path.dirname(self.filepath))
+            os.makedirs(directory, exist_ok=True)
+
+            # 先写临时文件再替换，避免中断导致文件损坏
+            tempfile = f"{self.filepath}.tmp"
+            with open(tempfile, "w+", encoding="utf8") as f:
+                f.write(content)
+                f.flush()
+
+            os.replace(tempfile, self.filepath)
+            return True
+        except Exception:
+            logger.error(f"[StoreError] cannot save cache file: {self.filepath}")
+            return False
+
+    def get(self, key: str, default: object = None) -> object:
+        with self.lock:
+            record = self.records.get(key, None)
+            if not record:
+                return default
+
+            expire = record.get("expire", 0)
+            if expire > 0 and expire <= time.time():
+                self.records.pop(key, None)
+                return default
+
+            return record.get("value", default)
+
+    def set(self, key: str, value: object, ttl: float = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expire = time.time() + ttl if ttl > 0 else 0
+
+        with self.lock:
+            self.records[key] = {"value": value, "expire": expire}
+
+    def pop(self, key: str) -> object:
+        with self.lock:
+            record = self.records.pop(key, None)
+            return record.get("value", None) if record else None
+
+    def evict(self) -> int:
+        now = time.time()
+        with self.lock:
+            keys = [k for k, v in self.records.items() if 0 < v.get("expire", 0) <= now]
+            for k in keys:
+                self.records.pop(k, None)
+
+        return len(keys)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.records)
@@ -3,8 +3,19 @@
 # @Author  : wzdnzd
 # @Time    : 2022-07-15
 
+import atexit
+import itertools
 import os
-from threading import Lock
+import subprocess
+import threading
+import time
+import urllib
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import BoundedSemaphore, Condition, Lock
 
 import utils
 from logger import logger
@@ -13,6 +24,9 @@ PATH = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
 FILE_LOCK = Lock()
 
+# 覆盖默认 exclude 规则时使用的过滤规则
+SIMPLE_EXCLUDE_REMARKS = "流量|过期|剩余|时间|Expire|Traffic"
+
 
 def generate_conf(
     filepath: str,
@@ -39,7 +53,7 @@ def generate_conf(
             lines.append("list=true")
 
         if ignore_exclude:
-            lines.append("exclude=流量|过期|剩余|时间|Expire|Traffic")
+            lines.append(f"exclude={SIMPLE_EXCLUDE_REMARKS}")
 
         lines.append("\n")
         content = "\n".join(lines)
@@ -69,5 +83,331 @@ def convert(binname: str, artifact: str = "") -> bool:
     return success
 
 
+def batch_convert(binname: str, artifacts: list[str]) -> bool:
+    """generate multiple sections of generate.ini with a single subconverter invocation"""
+    artifacts = [x.strip() for x in artifacts if x and x.strip()] if artifacts else []
+    if not artifacts:
+        return False
+
+    return convert(binname=binname, artifact=",".join(artifacts))
+
+
+class Batcher(object):
+    """
+    collect conversion requests from concurrent workers and run subconverter once for all of them,
+    the first caller becomes the leader and waits for others to join as long as they keep arriving
+    within `gap` seconds, but no longer than `window` seconds in total
+    """
+
+    def __init__(self, binname: str, window: float = 1.0, capacity: int = 64, concurrency: int = 1, gap: float = 0.1):
+        self.binname = binname
+        self.window = max(0, window)
+        self.capacity = max(1, capacity)
+        self.concurrency = max(1, concurrency)
+        self.gap = max(0, gap)
+        self.pending = []
+        self.results = {}
+        self.leading = False
+        self.condition = Condition()
+
+    def collect(self) -> None:
+        """wait for other callers to join, must be called by the leader with condition acquired"""
+        # 只有一个调用方时无需等待
+        expected = min(self.capacity, self.concurrency)
+        deadline = time.time() + self.window
+
+        while len(self.pending) < expected:
+            count, remaining = len(self.pending), deadline - time.time()
+            if remaining <= 0:
+                break
+
+            # 一段时间内没有新的请求加入则不再等待
+            self.condition.wait_for(lambda: len(self.pending) > count, timeout=min(self.gap, remaining))
+            if len(self.pending) == count:
+                break
+
+    def convert(self, artifact: str) -> bool:
+        artifact = utils.trim(artifact)
+        if not artifact:
+            return False
+
+        # 以每次调用的票据区分结果，多个调用方转换同一 artifact 时互不影响
+        ticket = uuid.uuid4().hex
+        with self.condition:
+            self.pending.append((ticket, artifact))
+            leader = not self.leading
+            if leader:
+                self.leading = True
+                self.collect()
+                requests, self.pending, self.leading = self.pending, [], False
+            else:
+                self.condition.notify_all()
+
+        if leader:
+            success = False
+            try:
+                artifacts = list(dict.fromkeys(x for _, x in requests))
+                success = batch_convert(binname=self.binname, artifacts=artifacts)
+                logger.info(f"subconverter batch completed, count: [{len(artifacts)}]\tsuccess=[{success}]")
+            finally:
+                with self.condition:
+                    self.results.update({x: success for x, _ in requests})
+                    self.condition.notify_all()
+
+        with self.condition:
+            self.condition.wait_for(lambda: ticket in self.results)
+            return self.results.pop(ticket)
+
+
+BATCHERS, BATCHERS_LOCK = {}, Lock()
+
+# 批量转换参数，concurrency 为可能同时发起转换的调用方数量
+BATCH_OPTIONS = {"window": 1.0, "concurrency": 1}
+
+
+def configure(concurrency: int = 1, window: float = 1.0) -> None:
+    """set how many workers may convert concurrently in this process, batching is disabled if it's 1"""
+    with BATCHERS_LOCK:
+        BATCH_OPTIONS.update({"window": max(0, window), "concurrency": max(1, concurrency)})
+        for batcher in BATCHERS.values():
+            batcher.window, batcher.concurrency = BATCH_OPTIONS["window"], BATCH_OPTIONS["concurrency"]
+
+
+def batch(binname: str, artifact: str) -> bool:
+    """convert the section named by artifact, sharing one subconverter invocation with concurrent callers"""
+    with BATCHERS_LOCK:
+        batcher = BATCHERS.get(binname, None)
+        if batcher is None:
+            batcher = Batcher(binname=binname, **BATCH_OPTIONS)
+            BATCHERS[binname] = batcher
+
+    return batcher.convert(artifact=artifact)
+
+
 def getpath() -> str:
     return os.path.join(PATH, "subconverter")
+
+
+# 已启动的 subconverter 服务地址，通过环境变量传递给子进程
+SERVERS_ENV_NAME = "SUBCONVERTER_SERVERS"
+
+
+class Stash(object):
+    """serve contents to be converted over loopback so that subconverter can fetch them without temporary files"""
+
+    def __init__(self):
+        self.contents = {}
+        self.lock = Lock()
+
+        stash = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                with stash.lock:
+                    content = stash.contents.get(self.path.strip("/"), None)
+
+                if content is None:
+                    self.send_error(404)
+                    return
+
+                data = content.encode(encoding="utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def put(self, content: str) -> tuple[str, str]:
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.contents[token] = content
+
+        return token, f"http://127.0.0.1:{self.server.server_port}/{token}"
+
+    def pop(self, token: str) -> None:
+        with self.lock:
+            self.contents.pop(token, None)
+
+
+class ServerPool(object):
+    """long-lived subconverter servers, convert contents through http api instead of spawning a process each time"""
+
+    def __init__(self, addresses: list[str], workers: int = 8, processes: list = None):
+        self.addresses = [x for x in addresses if x]
+        self.processes = processes or []
+        self.healthy = {x: True for x in self.addresses}
+        self.cycle = itertools.cycle(self.addresses)
+        self.semaphore = BoundedSemaphore(max(1, workers))
+        self.lock = Lock()
+        self.stash, self.pid = None, os.getpid()
+
+    @staticmethod
+    def available(address: str, timeout: float = 3) -> bool:
+        try:
+            response = urllib.request.urlopen(f"http://{address}/version", timeout=timeout)
+            return response.getcode() == 200
+        except Exception:
+            return False
+
+    def pick(self) -> str:
+        with self.lock:
+            for _ in range(len(self.addresses)):
+                address = next(self.cycle)
+                if self.healthy.get(address, False):
+                    return address
+
+        return ""
+
+    def mark(self, address: str, healthy: bool) -> None:
+        with self.lock:
+            self.healthy[address] = healthy
+
+    def get_stash(self) -> Stash:
+        with self.lock:
+            # 子进程无法复用父进程的服务线程
+            if self.stash is None or self.pid != os.getpid():
+                self.stash, self.pid = Stash(), os.getpid()
+
+            return self.stash
+
+    def convert(
+        self,
+        content: str,
+        target: str = "clash",
+        list_only: bool = True,
+        ignore_exclude: bool = False,
+        timeout: float = 60,
+    ) -> str:
+        """return converted content, None means no healthy server so that caller can fallback to generate mode"""
+        stash = self.get_stash()
+        token, url = stash.put(content)
+
+        params = {"target": target, "url": url, "expand": str(not list_only).lower()}
+        if list_only:
+            params["list"] = "true"
+        if ignore_exclude:
+            params["exclude"] = SIMPLE_EXCLUDE_REMARKS
+
+        try:
+            for _ in range(len(self.addresses)):
+                address = self.pick()
+                if not address:
+                    break
+
+                try:
+                    # 仅转换请求占用并发数，健康检查在释放后进行
+                    with self.semaphore:
+                        request = f"http://{address}/sub?{urllib.parse.urlencode(params)}"
+                        response = urllib.request.urlopen(request, timeout=timeout)
+                        return str(response.read(), encoding="utf8")
+                except urllib.error.HTTPError:
+                    # 服务正常但内容无法转换
+                    return ""
+                except Exception:
+                    # 先标记为不可用避免其他线程继续使用，确认服务正常后再恢复
+                    self.mark(address=address, healthy=False)
+                    if self.available(address=address):
+                        self.mark(address=address, healthy=True)
+                    else:
+                        logger.warning(f"subconverter server is unhealthy, address: {address}")
+
+            return None
+        finally:
+            stash.pop(token)
+
+    def shutdown(self) -> None:
+        for process in self.processes:
+            try:
+                process.terminate()
+            except:
+                logger.error(f"terminate subconverter server error, pid: {process.pid}")
+
+        self.processes = []
+
+
+SERVER_POOL = None
+
+
+# 常驻 subconverter 服务数量，为 0 时禁用
+SERVER_NUM_ENV_NAME = "SUBCONVERTER_SERVER_NUM"
+
+
+def startup(binname: str, num: int = None, workers: int = 8, timeout: float = 15) -> bool:
+    """start subconverter servers for current run, all conversions of this process and its children will use them"""
+    global SERVER_POOL
+
+    if num is None:
+        try:
+            num = int(os.environ.get(SERVER_NUM_ENV_NAME, "0"))
+        except ValueError:
+            num = 0
+
+    if num <= 0:
+        return False
+
+    binpath = os.path.join(PATH, "subconverter", binname)
+    utils.chmod(binpath)
+
+    addresses, processes = [], []
+    for _ in range(num):
+        port = utils.free_port()
+        env = dict(os.environ, PORT=str(port))
+        process = subprocess.Popen(
+            [binpath],
+            cwd=os.path.dirname(binpath),
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        addresses.append(f"127.0.0.1:{port}")
+        processes.append(process)
+
+    deadline, readies = time.time() + timeout, []
+    for address in addresses:
+        while time.time() < deadline and not ServerPool.available(address=address, timeout=1):
+            time.sleep(0.2)
+
+        if ServerPool.available(address=address, timeout=1):
+            readies.append(address)
+
+    SERVER_POOL = ServerPool(addresses=readies, workers=workers, processes=processes)
+    if not readies:
+        logger.error("cannot startup subconverter servers, fallback to generate mode")
+        shutdown()
+        return False
+
+    os.environ[SERVERS_ENV_NAME] = ",".join(readies)
+    atexit.register(shutdown)
+
+    logger.info(f"subconverter servers startup success, addresses: {readies}")
+    return True
+
+
+def shutdown() -> None:
+    global SERVER_POOL
+
+    if SERVER_POOL is not None:
+        SERVER_POOL.shutdown()
+
+    SERVER_POOL = None
+    os.environ.pop(SERVERS_ENV_NAME, None)
+
+
+def server_pool() -> ServerPool:
+    """servers started by current process or inherited from parent process, None if server mode is disabled"""
+    global SERVER_POOL
+
+    if SERVER_POOL is None:
+        addresses = utils.trim(os.environ.get(SERVERS_ENV_NAME, ""))
+        if addresses:
+            SERVER_POOL = ServerPool(addresses=addresses.split(","))
+
+    return SERVER_POOL
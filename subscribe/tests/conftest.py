@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import os
+import sys
+
+# 模块之间以顶层方式导入，需将 subscribe 目录加入搜索路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
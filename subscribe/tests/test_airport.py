@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import os
+
+import clash
+import pytest
+import utils
+from airport import RENAME_SEPARATOR, Renamer
+
+PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EMOJI_PATTERNS = utils.load_emoji_pattern(os.path.join(PATH, "subconverter", "snippets", "emoji.txt"))
+
+NAMES = [
+    "\U0001F1FA\U0001F1F8 美国 01",
+    "\U0001F1FA\U0001F1F8 美国 01",
+    "美国 01",
+    "\U0001F1ED\U0001F1F0 香港 | 02 [1.5x]",
+    "\U0001F1ED\U0001F1F0 香港-02",
+    "香港 02 (IPLC)",
+    "\U0001F1EF\U0001F1F5 日本 ChatGPT",
+    "JP_GPT 03",
+    "www.example.com 官网",
+    "\U0001F680 新加坡 04",
+    "SG 04",
+    "SG 04",
+    "SG 04",
+    "\U0001F525 台湾【高速】05",
+    "台湾 05",
+    "倍率 2.0 美国 01",
+]
+
+
+def nodes() -> list[dict]:
+    proxies = [
+        {"name": x, "type": "ss", "server": f"{i}.example.com", "port": 443, "cipher": "aes-128-gcm", "password": "p"}
+        for i, x in enumerate(NAMES)
+    ]
+
+    # 与第一个节点相同，仅名称不同
+    proxies.append(dict(proxies[0], name="美国 01 备用"))
+    return proxies
+
+
+# 期望结果由重构前 AirPort.parse 的重命名逻辑及 clash.filter_proxies 生成
+@pytest.mark.parametrize(
+    "options, expected",
+    [
+        (
+            {"emoji_patterns": EMOJI_PATTERNS, "remained": True},
+            [
+                ("JP 03", True),
+                ("SG 04-1A", None),
+                ("SG 04-1B", None),
+                ("SG 04-1C", None),
+                ("X 2.0 美国 01", None),
+                ("台湾 05-1A", None),
+                ("台湾 05-1B", None),
+                ("新加坡 04", None),
+                ("美国 01", None),
+                ("美国 01 备用", None),
+                ("香港 02", None),
+                ("\U0001F1ED\U0001F1F0 香港 | 02", None),
+                ("\U0001F1ED\U0001F1F0 香港-02", None),
+                ("\U0001F1EF\U0001F1F5 日本", True),
+                ("\U0001F1FA\U0001F1F8 美国 01", None),
+            ],
+        ),
+        (
+            {"emoji_patterns": EMOJI_PATTERNS},
+            [
+                ("\U0001F1E8\U0001F1F3 台湾 05-1A", None),
+                ("\U0001F1E8\U0001F1F3 台湾 05-1B", None),
+                ("\U0001F1ED\U0001F1F0 香港 02", None),
+                ("\U0001F1ED\U0001F1F0 香港 | 02", None),
+                ("\U0001F1ED\U0001F1F0 香港-02", None),
+                ("\U0001F1EF\U0001F1F5 JP 03", True),
+                ("\U0001F1EF\U0001F1F5 日本", True),
+                ("\U0001F1F8\U0001F1EC SG 04-1A", None),
+                ("\U0001F1F8\U0001F1EC SG 04-1B", None),
+                ("\U0001F1F8\U0001F1EC SG 04-1C", None),
+                ("\U0001F1F8\U0001F1EC 新加坡 04", None),
+                ("\U0001F1FA\U0001F1F8 X 2.0 美国 01", None),
+                ("\U0001F1FA\U0001F1F8 美国 01-1A", None),
+                ("\U0001F1FA\U0001F1F8 美国 01-1B", None),
+                ("\U0001F1FA\U0001F1F8 美国 01-1C", None),
+            ],
+        ),
+        (
+            {"tag": "tg", "chatgpt": {"enable": True, "regex": "日本", "operate": "IN"}},
+            [
+                ("TG-JP 03", False),
+                ("TG-SG 04-1A", False),
+                ("TG-SG 04-1B", False),
+                ("TG-SG 04-1C", False),
+                ("TG-X 2.0 美国 01", False),
+                ("TG-台湾 05-1A", False),
+                ("TG-台湾 05-1B", False),
+                ("TG-新加坡 04", False),
+                ("TG-日本", True),
+                ("TG-美国 01-1A", False),
+                ("TG-美国 01-1B", False),
+                ("TG-美国 01-1C", False),
+                ("TG-香港 02", False),
+                ("TG-香港 | 02", False),
+                ("TG-香港-02", False),
+            ],
+        ),
+    ],
+)
+def test_renamer_as_baseline(options: dict, expected: list):
+    renamer = Renamer(name="example", exclude="官网", rename=f"倍率{RENAME_SEPARATOR}x", **options)
+    proxies = [x for x in nodes() if renamer.apply(x)]
+
+    # filter_proxies 负责去重及为重名节点编号
+    proxies = clash.filter_proxies(proxies).get("proxies", [])
+    assert sorted((x["name"], x.get("chatgpt")) for x in proxies) == expected
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import asyncio
+
+import checker
+
+
+class Probe(checker.Controller):
+    def __init__(self, error: Exception = None):
+        super().__init__("127.0.0.1:9090")
+        self.error = error
+        self.calls = 0
+
+    async def request(self, path: str, fresh: bool = False) -> tuple[int, bytes]:
+        self.calls += 1
+        if self.error is None:
+            # 模拟无响应的节点
+            await asyncio.sleep(3600)
+
+        raise self.error
+
+
+def test_delay_timeout_not_retried():
+    controller = Probe()
+    assert asyncio.run(controller.delay("node", "https://www.gstatic.com/generate_204", 0)) == -1
+    assert controller.calls == 1
+
+
+def test_delay_connection_error_retried():
+    controller = Probe(ConnectionResetError())
+    assert asyncio.run(controller.delay("node", "https://www.gstatic.com/generate_204", 100)) == -1
+    assert controller.calls == 2
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import urllib.parse
+
+import decoder
+
+
+def links(names: list[str]) -> str:
+    return "\n".join(f"trojan://password@{i}.example.com:443#{urllib.parse.quote(x)}" for i, x in enumerate(names))
+
+
+def test_decode_names_as_subconverter():
+    names = ["\U0001F1FA\U0001F1F8 US 01 2倍", "\U0001F1ED\U0001F1F0\U0001F525 香港 02", "\U0001F680", "JP 🚀 03", "SG 04"]
+
+    # subconverter 按 pref.toml 的配置（remove_old_emoji = true 及 rename_node）输出的名称
+    expected = ["US 01 2x", "香港 02", "\U0001F680", "JP 🚀 03", "SG 04"]
+
+    proxies = decoder.decode(links(names))
+    assert [x["name"] for x in proxies] == expected
+
+
+def test_decode_fallback_when_links_broken():
+    text = links(["US 01", "US 02", "US 03"]) + "\ntrojan://\ntrojan://@"
+    assert decoder.decode(text) is None
+
+    text = links([f"US {i:02d}" for i in range(10)]) + "\ntrojan://"
+    assert len(decoder.decode(text)) == 10
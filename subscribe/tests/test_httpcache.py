@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import threading
+import time
+from concurrent import futures
+
+import httpcache
+
+
+def test_status_cache_single_flight():
+    cache, calls, lock = httpcache.StatusCache(ttl=60), [], threading.Lock()
+
+    def check() -> dict:
+        with lock:
+            calls.append(1)
+
+        time.sleep(0.1)
+        return {"reachable": True}
+
+    urls = [f"https://{i % 4}.example.com/sub" for i in range(32)]
+    with futures.ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda x: cache.load(x, check), urls))
+
+    assert all(x.get("reachable") for x in results)
+    assert len(calls) == 4
+    assert not cache.locks
+
+
+def test_status_cache_failure_not_cached():
+    cache = httpcache.StatusCache(ttl=60)
+    assert cache.load("https://example.com/sub", lambda: {"cacheable": False}) == {"cacheable": False}
+    assert not cache.get("https://example.com/sub")
+    assert not cache.locks
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import threading
+
+import subconverter
+
+
+def test_batcher_duplicate_artifacts(monkeypatch):
+    calls = []
+
+    def convert(binname: str, artifacts: list[str]) -> bool:
+        calls.append(artifacts)
+        return True
+
+    monkeypatch.setattr(subconverter, "batch_convert", convert)
+    batcher = subconverter.Batcher(binname="subconverter", window=1.0, concurrency=4, gap=0.5)
+
+    artifacts, results = ["a", "a", "b", "a"], {}
+
+    def run(index: int) -> None:
+        results[index] = batcher.convert(artifacts[index])
+
+    # 使用守护线程，避免调用方一直阻塞时测试无法结束
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(len(artifacts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == {i: True for i in range(len(artifacts))}
+    assert sorted(x for artifacts in calls for x in artifacts) == ["a", "b"]
+    assert not batcher.results
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import time
+
+import crawl
+import pytest
+import utils
+
+
+def test_parse_userinfo():
+    expire = int(time.time()) + 86400
+    info = utils.parse_userinfo(f"Upload = 1,download=2.5;\nTOTAL='1.5E12'; expire={expire}")
+    assert info == utils.UserInfo(upload=1, download=2.5, total=1500000000000, expire=expire)
+    assert utils.parse_userinfo("upload=0; download=0; total=10; expire=") == utils.UserInfo(total=10)
+
+
+def test_unknown_fields_have_no_traffic():
+    assert utils.parse_userinfo("foo=1") == utils.UserInfo()
+    assert crawl.is_expired("foo=1") == (False, False)
+    assert crawl.is_expired("abc") == (False, False)
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["total=nan", "total=inf", "total=-inf", "total=1e999", "upload=1e999; total=1e12", "total=__import__('os')"],
+)
+def test_non_finite_values_are_rejected(header):
+    assert utils.parse_userinfo(header) is None
+    assert crawl.is_expired(header) == (True, False)
+
+
+def test_blank_header():
+    assert utils.parse_userinfo("") is None
+    assert utils.parse_userinfo("  ") is None
+    assert crawl.is_expired(None) == (True, False)
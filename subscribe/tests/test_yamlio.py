@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import io
+
+import yaml
+import yamlio
+
+
+def config() -> dict:
+    name = "\U0001F1ED\U0001F1F0 HK-01 香港"
+    return {
+        "mode": "rule",
+        "proxies": [
+            {"name": name, "type": "ss", "server": "1.1.1.1", "port": 443, "cipher": "aes-128-gcm", "password": "x"},
+            {"name": "US-02 美国", "type": "trojan", "server": "example.com", "port": 443, "password": "y"},
+        ],
+        "proxy-groups": [{"name": "\U0001F680 节点选择", "type": "select", "proxies": [name, "US-02 美国"]}],
+    }
+
+
+def test_dump_keeps_emoji_as_baseline():
+    data = config()
+    expected = yaml.dump(data, allow_unicode=True).encode("utf8")
+
+    assert yamlio.dump(data).encode("utf8") == expected
+
+    stream = io.StringIO()
+    yamlio.dump(data, stream)
+    assert stream.getvalue().encode("utf8") == expected
+
+
+def test_dump_round_trip():
+    data = config()
+    assert yamlio.load(yamlio.dump(data)) == data
+
+
+def test_dump_emoji_names_once():
+    flags = ["\U0001F1FA\U0001F1F8", "\U0001F1ED\U0001F1F0", "\U0001F1EF\U0001F1F5", "\U0001F680", "\U0001F525"]
+    proxies = [
+        {"name": f"{flags[i % len(flags)]} 节点-{i:03d}", "type": "ss", "server": f"s{i}.example.com", "port": 443}
+        for i in range(200)
+    ]
+    proxies.append({"name": "\U0001F1FA\U0001F1F8 tab\tname", "type": "ss", "server": "t.example.com", "port": 80})
+    data = {"proxies": proxies}
+    expected = yaml.dump(data, allow_unicode=True).encode("utf8")
+
+    dumpers, original = [], yaml.dump
+
+    def spy(*args, **kwargs):
+        dumpers.append(kwargs.get("Dumper"))
+        return original(*args, **kwargs)
+
+    yamlio.yaml.dump = spy
+    try:
+        text = yamlio.dump(data)
+    finally:
+        yamlio.yaml.dump = original
+
+    assert text.encode("utf8") == expected
+
+    # 每个节点仅输出一次
+    assert len(dumpers) == len(proxies)
@@ -3,8 +3,13 @@
 # @Author  : wzdnzd
 # @Time    : 2022-07-15
 
+import codecs
+import email.utils
+import functools
 import gzip
 import json
+import logging
+import math
 import multiprocessing
 import os
 import platform
@@ -15,6 +20,7 @@ import ssl
 import string
 import subprocess
 import sys
+import threading
 import time
 import traceback
 import typing
@@ -24,8 +30,10 @@ import urllib.parse
 import urllib.request
 import uuid
 from concurrent import futures
-from http.client import HTTPMessage, HTTPResponse
+from dataclasses import dataclass
+from http.client import HTTPMessage
 
+import urllib3
 from logger import logger
 from tqdm import tqdm
 from urlvalidator import isurl
@@ -52,6 +60,359 @@ DEFAULT_HTTP_HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
 }
 
+# 单个响应体最大字节数
+MAX_RESPONSE_SIZE = 64 * 1024 * 1024
+
+# 每个 host 保持的空闲连接数
+HTTP_POOL_SIZE = 16
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+
+class ResponseTooLargeError(Exception):
+    """response body exceeds the size limit"""
+
+
+class Response(object):
+    """fully read http response, compatible with the commonly used methods of http.client.HTTPResponse"""
+
+    def __init__(self, status: int, content: bytes, headers: HTTPMessage, url: str = ""):
+        self.status = status
+        self.content = content
+        self.headers = headers
+        self.url = url
+
+        # 服务端要求暂停请求的秒数
+        self.delay = 0
+
+    def getcode(self) -> int:
+        return self.status
+
+    def getheader(self, name: str, default: str = None) -> str:
+        return self.headers.get(name, default)
+
+    def geturl(self) -> str:
+        return self.url
+
+    def read(self) -> bytes:
+        return self.content
+
+    def text(self, strict: bool = False) -> str:
+        try:
+            return str(self.content, encoding="utf8")
+        except UnicodeDecodeError:
+            pass
+
+        # 部分服务端返回 gzip 压缩内容但未设置 Content-Encoding
+        try:
+            return gzip.decompress(self.content).decode("utf8")
+        except Exception:
+            if strict:
+                raise
+
+        return str(self.content, encoding="utf8", errors="ignore")
+
+
+class RateLimitedError(Exception):
+    """host is paused longer than the limiter is allowed to wait"""
+
+
+@dataclass
+class HostState(object):
+    # 同时进行的请求数限制
+    semaphore: threading.BoundedSemaphore = None
+
+    # 令牌桶剩余令牌及上次填充时间
+    tokens: float = 0
+
+    stamp: float = 0
+
+    # 在此时间之前暂停请求
+    until: float = 0
+
+
+class HostLimiter(object):
+    """
+    per-host max in-flight requests and token bucket rate, a host is paused as told by
+    Retry-After or GitHub's X-RateLimit-* headers so that its requests wait instead of failing
+    """
+
+    def __init__(self, policies: dict = None, max_wait: float = 120):
+        # host -> (最大并发数, 每秒请求数, 突发请求数)，未配置的 host 不限制
+        self.policies = policies or {}
+        self.max_wait = max_wait
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def policy(self, host: str) -> tuple[int, float, int]:
+        host = (host or "").lower()
+        while host:
+            if host in self.policies:
+                return self.policies[host]
+
+            # 逐级匹配上级域名
+            host = host.split(".", 1)[1] if "." in host else ""
+
+        return 0, 0, 0
+
+    def state(self, host: str) -> HostState:
+        with self.lock:
+            state = self.states.get(host, None)
+            if state is None:
+                concurrency, _, burst = self.policy(host)
+                semaphore = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+                state = HostState(semaphore=semaphore, tokens=max(burst, 1), stamp=time.time())
+                self.states[host] = state
+
+            return state
+
+    def pending(self, host: str) -> float:
+        """seconds to wait before the host accepts requests again"""
+        state = self.states.get(host, None)
+        return max(0, state.until - time.time()) if state else 0
+
+    def acquire(self, host: str) -> None:
+        """wait for the host, raise RateLimitedError if it's paused longer than max_wait"""
+        state = self.state(host)
+
+        delay = state.until - time.time()
+        if delay > self.max_wait:
+            raise RateLimitedError(f"host {host} is rate limited for {delay:.0f}s")
+        if delay > 0:
+            time.sleep(delay)
+
+        if state.semaphore is not None:
+            state.semaphore.acquire()
+
+        _, rate, burst = self.policy(host)
+        while rate > 0:
+            with self.lock:
+                now = time.time()
+                state.tokens = min(max(burst, 1), state.tokens + (now - state.stamp) * rate)
+                state.stamp = now
+
+                if state.tokens >= 1:
+                    state.tokens -= 1
+                    break
+
+                delay = (1 - state.tokens) / rate
+
+            time.sleep(delay)
+
+    def release(self, host: str) -> None:
+        state = self.states.get(host, None)
+        if state is not None and state.semaphore is not None:
+            state.semaphore.release()
+
+    def observe(self, host: str, status: int, headers: HTTPMessage) -> float:
+        """pause the host according to response headers, returns the seconds paused"""
+        if not headers:
+            return 0
+
+        delay = 0
+        if status in [429, 503]:
+            delay = retry_after(headers.get("Retry-After", ""))
+
+        # GitHub 限流时返回 403 或 429 并携带重置时间
+        if headers.get("X-RateLimit-Remaining", "") == "0":
+            try:
+                delay = max(delay, float(headers.get("X-RateLimit-Reset", "0")) - time.time())
+            except ValueError:
+                pass
+
+        if delay <= 0:
+            return 0
+
+        state = self.state(host)
+        with self.lock:
+            state.until = max(state.until, time.time() + delay)
+
+        logger.debug(f"[HostLimiter] pause requests to {host} for {delay:.1f}s, status: {status}")
+        return delay
+
+
+def retry_after(value: str) -> float:
+    """parse Retry-After header, it may be seconds or a http date"""
+    value = trim(value)
+    if not value:
+        return 0
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return 0
+
+
+# 爬取时频繁访问的站点
+HOST_POLICIES = {
+    "t.me": (4, 2, 4),
+    "github.com": (4, 2, 4),
+    "api.github.com": (4, 1, 5),
+    "raw.githubusercontent.com": (8, 10, 20),
+    "gist.githubusercontent.com": (8, 10, 20),
+}
+
+
+class HttpClient(object):
+    """http client keeping alive connections per host, shared by all threads of the current process"""
+
+    def __init__(self, maxsize: int = HTTP_POOL_SIZE, limit: int = MAX_RESPONSE_SIZE):
+        self.maxsize = maxsize
+        self.limit = limit
+        self.managers = {}
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def manager(self, proxy: str = "") -> urllib3.PoolManager:
+        with self.lock:
+            # fork 出的子进程不能复用父进程的连接
+            if self.pid != os.getpid():
+                self.managers, self.pid = {}, os.getpid()
+
+            manager = self.managers.get(proxy, None)
+            if manager is None:
+                options = dict(
+                    num_pools=128,
+                    maxsize=self.maxsize,
+                    block=False,
+                    ssl_context=CTX,
+                    cert_reqs=ssl.CERT_NONE,
+                    assert_hostname=False,
+                )
+                manager = urllib3.ProxyManager(proxy, **options) if proxy else urllib3.PoolManager(**options)
+                self.managers[proxy] = manager
+
+            return manager
+
+    def open(
+        self,
+        method: str,
+        url: str,
+        headers: dict = None,
+        body: bytes = None,
+        timeout: float = 10,
+        proxy: str = "",
+        redirect: bool = True,
+        limiter: HostLimiter = None,
+    ) -> urllib3.BaseHTTPResponse:
+        """
+        send request once and returns the response whose body is not read yet, the response must be passed
+        to close after use, raise urllib3.exceptions.HTTPError if failed or RateLimitedError if the host is paused too long
+        (only if limiter is given, requests are not throttled otherwise)
+        """
+        # 重试由调用方控制，此处只处理重定向
+        retries = urllib3.Retry(
+            total=None,
+            connect=0,
+            read=0,
+            status=0,
+            other=0,
+            redirect=10 if redirect else False,
+            raise_on_redirect=False,
+        )
+
+        host = urllib.parse.urlparse(url).hostname or ""
+        if limiter is not None:
+            limiter.acquire(host)
+
+        try:
+            response = self.manager(proxy=proxy).request(
+                method=method,
+                url=url,
+                headers=headers,
+                body=body,
+                timeout=urllib3.Timeout(connect=timeout, read=timeout),
+                retries=retries,
+                redirect=redirect,
+                preload_content=False,
+                decode_content=True,
+            )
+        except BaseException:
+            if limiter is not None:
+                limiter.release(host)
+            raise
+
+        response.host, response.limiter, response.delay = host, limiter, 0
+        if limiter is not None:
+            response.delay = limiter.observe(host=host, status=response.status, headers=response.headers)
+
+        return response
+
+    def close(self, response: urllib3.BaseHTTPResponse, discard: bool = False) -> None:
+        """return the connection to pool, discard it if the body is not read completely"""
+        try:
+            if discard:
+                response.close()
+            response.release_conn()
+        finally:
+            limiter = getattr(response, "limiter", None)
+            if limiter is not None:
+                limiter.release(getattr(response, "host", ""))
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict = None,
+        body: bytes = None,
+        timeout: float = 10,
+        proxy: str = "",
+        redirect: bool = True,
+        limiter: HostLimiter = None,
+    ) -> Response:
+        """
+        send request once and read the whole body, raise urllib3.exceptions.HTTPError if failed
+        or RateLimitedError if the host is paused too long
+        """
+        response = self.open(
+            method=method,
+            url=url,
+            headers=headers,
+            body=body,
+            timeout=timeout,
+            proxy=proxy,
+            redirect=redirect,
+            limiter=limiter,
+        )
+
+        chunks, size, completed = [], 0, False
+        try:
+            for chunk in response.stream(64 * 1024):
+                size += len(chunk)
+                if size > self.limit:
+                    raise ResponseTooLargeError(f"response body exceeds {self.limit} bytes")
+
+                chunks.append(chunk)
+
+            completed = True
+        finally:
+            # 丢弃未读取完的连接
+            self.close(response, discard=not completed)
+
+        headers = HTTPMessage()
+        for k, v in response.headers.items():
+            headers[k] = v
+
+        result = Response(status=response.status, content=b"".join(chunks), headers=headers, url=response.geturl() or url)
+        result.delay = response.delay
+
+        return result
+
+
+# 按域名限流，仅在爬取时显式传入，订阅获取等其他请求不受影响
+HTTP_LIMITER = HostLimiter(policies=HOST_POLICIES)
+
+HTTP_CLIENT = HttpClient()
+
+
+def backoff(attempt: int, interval: float = 0) -> None:
+    """sleep before retrying, jittered exponential delay is added on top of interval"""
+    time.sleep(max(0, interval) + random.uniform(0, min(0.25 * 2**attempt, 4)))
+
 
 def random_chars(length: int, punctuation: bool = False) -> str:
     length = max(length, 1)
@@ -72,88 +433,120 @@ def http_get(
     interval: float = 0,
     timeout: float = 10,
     trace: bool = False,
+    limiter: HostLimiter = None,
 ) -> str:
+    status, content, _ = http_fetch(
+        url=url,
+        headers=headers,
+        params=params,
+        retry=retry,
+        proxy=proxy,
+        interval=interval,
+        timeout=timeout,
+        trace=trace,
+        limiter=limiter,
+    )
+
+    return content if status == 200 else ""
+
+
+def http_fetch(
+    url: str,
+    headers: dict = None,
+    params: dict = None,
+    retry: int = 3,
+    proxy: str = "",
+    interval: float = 0,
+    timeout: float = 10,
+    trace: bool = False,
+    limiter: HostLimiter = None,
+) -> tuple[int, str, HTTPMessage | None]:
+    """same as http_get but returns status code and response headers too, status is 304 if not modified"""
     if not isurl(url=url):
         logger.error(f"invalid url: {url}")
-        return ""
+        return 0, "", None
 
     if retry <= 0:
-        logger.debug(f"achieves max retry, url={hide(url=url)}")
-        return ""
+        return 0, "", None
 
     headers = DEFAULT_HTTP_HEADERS if not headers else headers
 
     interval = max(0, interval)
     timeout = max(1, timeout)
-    try:
-        url = encoding_url(url=url)
-        if params and isinstance(params, dict):
-            data = urllib.parse.urlencode(params)
-            if "?" in url:
-                url += f"&{data}"
-            else:
-                url += f"?{data}"
 
-        request = urllib.request.Request(url=url, headers=headers)
-        if proxy and (proxy.startswith("https://") or proxy.startswith("http://")):
-            host, protocal = "", ""
-            if proxy.startswith("https://"):
-                host, protocal = proxy[8:], "https"
-            else:
-                host, protocal = proxy[7:], "http"
-            request.set_proxy(host=host, type=protocal)
+    url = encoding_url(url=url)
+    if params and isinstance(params, dict):
+        data = urllib.parse.urlencode(params)
+        if "?" in url:
+            url += f"&{data}"
+        else:
+            url += f"?{data}"
+
+    if not proxy or not (proxy.startswith("https://") or proxy.startswith("http://")):
+        proxy = ""
+
+    for attempt in range(retry):
+        if attempt > 0:
+            backoff(attempt=attempt, interval=interval)
 
-        response = urllib.request.urlopen(request, timeout=timeout, context=CTX)
-        content = response.read()
-        status_code = response.getcode()
         try:
-            content = str(content, encoding="utf8")
-        except:
-            content = gzip.decompress(content).decode("utf8")
-        if status_code != 200:
+            response = HTTP_CLIENT.request(
+                method="GET", url=url, headers=headers, timeout=timeout, proxy=proxy, limiter=limiter
+            )
+        except ResponseTooLargeError as e:
+            logger.error(f"{e}, url: {hide(url)}")
+            return 0, "", None
+        except RateLimitedError as e:
+            logger.warning(f"{e}, skip url: {hide(url)}")
+            return 429, "", None
+        except urllib3.exceptions.HTTPError as e:
             if trace:
-                logger.error(f"request failed, url: {hide(url)}, code: {status_code}, message: {content}")
+                logger.error(f"request failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
 
-            return ""
+            # 仅超时及 SSL 错误时重试，无法连接则直接返回
+            reason = e.reason if isinstance(e, urllib3.exceptions.MaxRetryError) else e
+            if isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.LocationParseError)):
+                return 0, "", None
 
-        return content
-    except urllib.error.URLError as e:
-        if isinstance(e.reason, (socket.timeout, ssl.SSLError)):
-            time.sleep(interval)
-            return http_get(
-                url=url,
-                headers=headers,
-                params=params,
-                retry=retry - 1,
-                proxy=proxy,
-                interval=interval,
-                timeout=timeout,
-            )
-        else:
-            return ""
-    except Exception as e:
-        if trace:
-            logger.error(f"request failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
+            continue
+        except Exception:
+            if trace:
+                logger.error(f"request failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
 
-        if isinstance(e, urllib.error.HTTPError):
-            try:
-                message = str(e.read(), encoding="utf8")
-            except:
-                message = "unknown error"
+            continue
 
-            if e.code != 503 or "token" in message:
-                return ""
+        # 内容未修改
+        if response.status == 304:
+            return response.status, "", response.headers
 
-        time.sleep(interval)
-        return http_get(
-            url=url,
-            headers=headers,
-            params=params,
-            retry=retry - 1,
-            proxy=proxy,
-            interval=interval,
-            timeout=timeout,
-        )
+        if response.status >= 400:
+            message = response.text()
+            if trace:
+                logger.error(f"request failed, url: {hide(url)}, code: {response.status}, message: {message}")
+
+            # 服务端要求稍后重试时等待后再次请求，其余错误直接返回
+            limited = limiter is not None and 0 < response.delay <= limiter.max_wait
+            if not limited and (response.status != 503 or "token" in message):
+                return response.status, "", response.headers
+
+            continue
+
+        if response.status != 200:
+            if trace:
+                logger.error(f"request failed, url: {hide(url)}, code: {response.status}, message: {response.text()}")
+
+            return response.status, "", response.headers
+
+        try:
+            content = response.text(strict=True)
+        except Exception:
+            logger.error(f"cannot decode response body, url: {hide(url)}")
+            return 0, "", response.headers
+
+        return response.status, content, response.headers
+
+    logger.debug(f"achieves max retry, url={hide(url=url)}")
+    return 0, "", None
 
 
 def extract_domain(url: str, include_protocal: bool = False) -> str:
@@ -205,6 +598,12 @@ def cmd(command: list, output: bool = False) -> tuple[bool, str]:
     return success, content
 
 
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
 def chmod(binfile: str) -> None:
     if not os.path.exists(binfile) or os.path.isdir(binfile):
         raise ValueError(f"cannot found bin file: {binfile}")
@@ -260,6 +659,60 @@ def write_file(filename: str, lines: list) -> bool:
         return False
 
 
+# subscription-userinfo 中的字段，兼容逗号、换行等不规范的分隔符
+USERINFO_FIELD_PATTERN = re.compile(r"(?:^|[;,\s])(upload|download|total|expire)\s*[=:]\s*([^;,\s]*)", flags=re.I)
+
+USERINFO_NUMBER_PATTERN = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+@dataclass(frozen=True)
+class UserInfo(object):
+    # 已用上传及下载流量，单位为字节
+    upload: float = 0
+
+    download: float = 0
+
+    # 总流量，单位为字节
+    total: float = 0
+
+    # 过期时间戳，None 表示永不过期
+    expire: float = None
+
+    @property
+    def remaining(self) -> float:
+        return self.total - (self.upload + self.download)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_userinfo(header: str) -> UserInfo | None:
+    """
+    parse header subscription-userinfo like 'upload=0; download=0; total=1e10; expire=1717171717',
+    missing fields are treated as 0 except expire, so a header without any known field has no traffic,
+    returns None if the header is blank or any value is empty (except expire), non-numeric or infinite
+    """
+    if isblank(header):
+        return None
+
+    values = {}
+    for key, text in USERINFO_FIELD_PATTERN.findall(header):
+        key, text = key.lower(), text.strip("'\"")
+
+        # expire 为空表示永不过期
+        if not text and key == "expire":
+            continue
+
+        if not USERINFO_NUMBER_PATTERN.fullmatch(text):
+            return None
+
+        value = float(text)
+        if not math.isfinite(value):
+            return None
+
+        values[key] = int(value) if value.is_integer() else value
+
+    return UserInfo(**values)
+
+
 def isb64encode(content: str, padding: bool = True) -> bool:
     if not content:
         return False
@@ -363,6 +816,96 @@ class NoRedirect(urllib.request.HTTPRedirectHandler):
         return fp
 
 
+def http_stream(
+    url: str,
+    headers: dict = None,
+    retry: int = 3,
+    proxy: str = "",
+    timeout: float = 10,
+    chunk_size: int = 64 * 1024,
+    trace: bool = False,
+    limiter: HostLimiter = None,
+) -> typing.Iterator[str]:
+    """
+    yields decoded text chunks of the response body, nothing is yielded if the request failed,
+    stop iterating or close the generator to abort the download
+    """
+    if not isurl(url=url) or retry <= 0:
+        return
+
+    headers = DEFAULT_HTTP_HEADERS if not headers else headers
+    timeout = max(1, timeout)
+    url = encoding_url(url=url)
+
+    if not proxy or not (proxy.startswith("https://") or proxy.startswith("http://")):
+        proxy = ""
+
+    response = None
+    for attempt in range(retry):
+        if attempt > 0:
+            backoff(attempt=attempt)
+
+        try:
+            response = HTTP_CLIENT.open(
+                method="GET", url=url, headers=headers, timeout=timeout, proxy=proxy, limiter=limiter
+            )
+        except RateLimitedError as e:
+            logger.warning(f"{e}, skip url: {hide(url)}")
+            return
+        except urllib3.exceptions.HTTPError as e:
+            if trace:
+                logger.error(f"request failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
+
+            reason = e.reason if isinstance(e, urllib3.exceptions.MaxRetryError) else e
+            if isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.LocationParseError)):
+                return
+
+            continue
+        except Exception:
+            if trace:
+                logger.error(f"request failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
+
+            continue
+
+        if response.status == 200:
+            break
+
+        HTTP_CLIENT.close(response, discard=True)
+        if trace:
+            logger.error(f"request failed, url: {hide(url)}, code: {response.status}")
+
+        limited = limiter is not None and 0 < response.delay <= limiter.max_wait
+        if not limited and response.status != 503:
+            return
+
+        response = None
+
+    if response is None:
+        return
+
+    decoder, size, completed = codecs.getincrementaldecoder("utf8")(errors="ignore"), 0, False
+    try:
+        for chunk in response.stream(chunk_size):
+            size += len(chunk)
+            if size > HTTP_CLIENT.limit:
+                logger.error(f"response body exceeds {HTTP_CLIENT.limit} bytes, url: {hide(url)}")
+                break
+
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        else:
+            completed = True
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
+    except Exception:
+        if trace:
+            logger.error(f"read response failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
+    finally:
+        HTTP_CLIENT.close(response, discard=not completed)
+
+
 def http_post(
     url: str,
     headers: dict = None,
@@ -370,33 +913,39 @@ def http_post(
     retry: int = 3,
     timeout: float = 6,
     allow_redirects: bool = True,
-) -> HTTPResponse:
+    limiter: HostLimiter = None,
+) -> "Response":
     if params is None or type(params) != dict or retry <= 0:
         return None
 
-    timeout, retry = max(timeout, 1), retry - 1
+    timeout = max(timeout, 1)
     if not headers:
         headers = {
             "User-Agent": USER_AGENT,
             "Content-Type": "application/json",
         }
-    try:
-        data = json.dumps(params).encode(encoding="UTF8")
-        request = urllib.request.Request(url=url, data=data, headers=headers, method="POST")
-        if allow_redirects:
-            return urllib.request.urlopen(request, timeout=timeout, context=CTX)
 
-        opener = urllib.request.build_opener(NoRedirect)
-        return opener.open(request, timeout=timeout)
-    except Exception:
-        time.sleep(random.random())
-        return http_post(
-            url=url,
-            headers=headers,
-            params=params,
-            retry=retry,
-            allow_redirects=allow_redirects,
-        )
+    data = json.dumps(params).encode(encoding="UTF8")
+    for attempt in range(retry):
+        if attempt > 0:
+            backoff(attempt=attempt)
+
+        try:
+            response = HTTP_CLIENT.request(
+                method="POST",
+                url=url,
+                headers=headers,
+                body=data,
+                timeout=timeout,
+                redirect=allow_redirects,
+                limiter=limiter,
+            )
+            if response.status < 400:
+                return response
+        except Exception:
+            pass
+
+    return None
 
 
 def verify_uuid(text: str) -> bool:
@@ -457,15 +1006,47 @@ def load_emoji_pattern(filepath: str) -> dict:
     return patterns
 
 
+# 已建立缓存的 emoji 规则，保留规则对象的引用以保证 id 不被复用
+EMOJI_MATCHERS = {}
+
+
+# 将数字统一替换为 0，编号不同的同名节点共用缓存
+DIGITS_TABLE = str.maketrans("123456789", "000000000")
+
+
+def emoji_matcher(patterns: dict) -> typing.Callable[[str], str | None]:
+    """first matched pattern wins, results are memoized since node names repeat heavily"""
+    items = list(patterns.items())
+
+    # 规则中不涉及具体数字时，任意数字的匹配结果相同
+    normalize = all(
+        isinstance(p, re.Pattern) and isinstance(p.pattern, str) and not re.search(r"[0-9]|\\N", p.pattern)
+        for p in patterns.keys()
+    )
+
+    @functools.lru_cache(maxsize=8192)
+    def search(text: str) -> str | None:
+        for pattern, emoji in items:
+            if pattern.search(text):
+                return emoji
+
+        return None
+
+    return (lambda text: search(text.translate(DIGITS_TABLE))) if normalize else search
+
+
 def get_emoji(text: str, patterns: dict, default: str = "") -> str:
     if not patterns or type(patterns) != dict or not text or type(text) != str:
         return default
 
-    for pattern, emoji in patterns.items():
-        if pattern.search(text):
-            return emoji
+    # 规则在加载后不再修改，每个规则对象只创建一次匹配器
+    record = EMOJI_MATCHERS.get(id(patterns), None)
+    if record is None or record[0] is not patterns or record[1] != len(patterns):
+        record = (patterns, len(patterns), emoji_matcher(patterns))
+        EMOJI_MATCHERS[id(patterns)] = record
 
-    return default
+    emoji = record[2](text)
+    return default if emoji is None else emoji
 
 
 def multi_process_run(func: typing.Callable, tasks: list) -> list:
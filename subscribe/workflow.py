@@ -88,7 +88,7 @@ class TaskConfig:
     invite_code: str = ""
 
 
-def execute(task_conf: TaskConfig) -> list:
+def execute(task_conf: TaskConfig, rejects: dict = None) -> list:
     if not task_conf:
         return []
 
@@ -134,6 +134,9 @@ def execute(task_conf: TaskConfig) -> list:
         remained=task_conf.remained,
     )
 
+    if rejects is not None:
+        rejects.update(obj.rejects)
+
     logger.info(
         f"finished fetch proxy: name=[{task_conf.name}]\tid=[{task_conf.index}]\tdomain=[{obj.ref}]\tcount=[{len(proxies)}]"
     )
@@ -141,13 +144,41 @@ def execute(task_conf: TaskConfig) -> list:
     return proxies
 
 
-def executewrapper(task_conf: TaskConfig) -> tuple[int, list]:
+def executewrapper(task_conf: TaskConfig) -> tuple[int, list, dict]:
     if not task_conf:
-        return (-1, [])
+        return (-1, [], {})
+
+    taskid, rejects = task_conf.taskid, {}
+    proxies = execute(task_conf=task_conf, rejects=rejects)
+    return (taskid, proxies, rejects)
+
+
+def report_rejects(tasks: list[TaskConfig], results: list[tuple]) -> dict:
+    """log reasons of invalid proxies for each subscription and the whole run, returns the totals"""
+    totals, records = {}, []
+    for task, result in zip(tasks, results):
+        rejects = result[2] if result and len(result) > 2 else {}
+        if not task or not rejects:
+            continue
+
+        for reason, count in rejects.items():
+            totals[reason] = totals.get(reason, 0) + count
+
+        source = utils.mask(url=task.sub) if task.sub else task.domain
+        records.append((sum(rejects.values()), task.name, source, rejects))
+
+    if not totals:
+        return totals
+
+    def readable(stats: dict) -> str:
+        items = sorted(stats.items(), key=lambda x: x[1], reverse=True)
+        return ", ".join([f"{k}={v}" for k, v in items])
+
+    for count, name, source, rejects in sorted(records, key=lambda x: x[0], reverse=True):
+        logger.info(f"[Rejects] name: {name}, source: {source}, count: {count}, reasons: {readable(rejects)}")
 
-    taskid = task_conf.taskid
-    proxies = execute(task_conf=task_conf)
-    return (taskid, proxies)
+    logger.info(f"[Rejects] total: {sum(totals.values())}, reasons: {readable(totals)}")
+    return totals
 
 
 def liveness_fillter(proxies: list) -> tuple[list, list]:
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# @Author  : wzdnzd
+# @Time    : 2024-06-01
+
+import io
+import re
+import typing
+
+import yaml
+from yaml.constructor import ConstructorError
+
+# 优先使用 libyaml 实现
+try:
+    from yaml import CDumper as Dumper
+    from yaml import CFullLoader as BaseFullLoader
+    from yaml import CSafeLoader as BaseSafeLoader
+
+    LIBYAML = True
+except ImportError:
+    from yaml import Dumper
+    from yaml import FullLoader as BaseFullLoader
+    from yaml import SafeLoader as BaseSafeLoader
+
+    LIBYAML = False
+
+
+# deal with !<str>
+def str_constructor(loader, node):
+    return str(loader.construct_scalar(node))
+
+
+def ignore_constructor(loader, suffix, node):
+    return None
+
+
+class SafeLoader(BaseSafeLoader):
+    """safe loader accepting the !<str> tag, constructors are registered on this class only"""
+
+
+class FullLoader(BaseFullLoader):
+    """full loader used when safe loader cannot construct some tags"""
+
+
+class PureLoader(yaml.SafeLoader):
+    """pure python loader, fallback when libyaml rejects the document"""
+
+
+for clazz in [SafeLoader, FullLoader, PureLoader]:
+    clazz.add_constructor("str", str_constructor)
+    clazz.add_multi_constructor("str", ignore_constructor)
+
+
+def load(stream: str | typing.IO) -> object:
+    """parse yaml document with libyaml if available, raise yaml.YAMLError if it's invalid"""
+
+    def rewind() -> None:
+        if not isinstance(stream, (str, bytes)):
+            stream.seek(0, 0)
+
+    try:
+        return yaml.load(stream, Loader=SafeLoader)
+    except ConstructorError:
+        rewind()
+        return yaml.load(stream, Loader=FullLoader)
+    except yaml.MarkedYAMLError:
+        if not LIBYAML:
+            raise
+
+        # libyaml 与纯 python 实现对个别不规范文档的处理存在差异
+        rewind()
+        return yaml.load(stream, Loader=PureLoader)
+
+
+def load_proxies(stream: str | typing.IO) -> list:
+    """parse yaml document and returns its proxies, raise yaml.YAMLError if it's invalid"""
+    data = load(stream)
+    if not data or not isinstance(data, dict):
+        return []
+
+    return data.get("proxies", None) or []
+
+
+# BMP 以外的字符（如 emoji），libyaml 即使设置了 allow_unicode 也会将其转义
+ASTRAL_PATTERN = re.compile("[\U00010000-\U0010FFFF]")
+
+# 私有区字符，libyaml 输出前临时替换 BMP 以外的字符，两种实现均将其视为可打印字符
+PRIVATE_PATTERN = re.compile("[\uE000-\uEFFF]")
+
+PRIVATE_START, PRIVATE_END = 0xE000, 0xF000
+
+# 纯 python 实现中会使用双引号输出的字符串：包含不可打印字符、空格与换行相邻
+QUOTED_PATTERN = re.compile(
+    "[^\n\x20-\x7E\x85\xA0-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFE]|\uFEFF|[ ][\n\x85\u2028\u2029]|[\n\x85\u2028\u2029][ ]"
+)
+
+
+def collect(data: object, chars: set) -> bool:
+    """
+    collect characters outside BMP in values of data, returns False if libyaml cannot produce
+    the same output as the pure python implementation
+    """
+    if isinstance(data, str):
+        if PRIVATE_PATTERN.search(data):
+            return False
+
+        # 双引号字符串中的非 ASCII 字符两种实现的折行位置不同
+        if not data.isascii() and QUOTED_PATTERN.search(data):
+            return False
+
+        chars.update(ASTRAL_PATTERN.findall(data))
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            # 替换键中的字符会改变排序结果
+            if isinstance(key, str) and (ASTRAL_PATTERN.search(key) or not collect(key, set())):
+                return False
+            if not collect(value, chars):
+                return False
+    elif isinstance(data, (list, tuple)):
+        for item in data:
+            if not collect(item, chars):
+                return False
+
+    return True
+
+
+def replace(data: object, table: dict) -> object:
+    if isinstance(data, str):
+        return data.translate(table)
+    elif isinstance(data, dict):
+        return {k: replace(v, table) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [replace(x, table) for x in data]
+    elif isinstance(data, tuple):
+        return tuple(replace(x, table) for x in data)
+
+    return data
+
+
+def emit(data: object, output: typing.IO) -> None:
+    chars = set()
+    if LIBYAML and (not collect(data, chars) or len(chars) > PRIVATE_END - PRIVATE_START):
+        output.write(yaml.dump(data, Dumper=yaml.Dumper, allow_unicode=True))
+    elif not chars:
+        output.write(yaml.dump(data, Dumper=Dumper, allow_unicode=True))
+    else:
+        # 以私有区字符代替后交由 libyaml 输出再还原，结果与纯 python 实现一致且无需重复输出
+        table = {ord(c): chr(PRIVATE_START + i) for i, c in enumerate(chars)}
+        text = yaml.dump(replace(data, table), Dumper=Dumper, allow_unicode=True)
+        output.write(text.translate({ord(v): k for k, v in table.items()}))
+
+
+def dump(data: dict, stream: typing.IO = None) -> str | None:
+    """
+    dump config with libyaml if available, entries of proxies are emitted one by one to stream,
+    returns the content if stream is None
+    """
+    output = io.StringIO() if stream is None else stream
+
+    for key in sorted(data.keys()):
+        value = data.get(key)
+        if key == "proxies" and isinstance(value, list) and value:
+            output.write("proxies:\n")
+            for item in value:
+                emit([item], output)
+        else:
+            emit({key: value}, output)
+
+    return output.getvalue() if stream is None else None
@@ -20,6 +20,11 @@ from dataclasses import dataclass
 import psutil
 import yaml
 
+# 复用 subscribe 中基于 libyaml 的加载器
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "subscribe"))
+
+from yamlio import FullLoader, SafeLoader
+
 CTX = ssl.create_default_context()
 CTX.check_hostname = False
 CTX.verify_mode = ssl.CERT_NONE
@@ -63,7 +68,7 @@ def parse(base: str, filename: str, provider: str = "", all: bool = False) -> AP
 
     with open(filepath, "r", encoding="utf8") as f:
         try:
-            data = yaml.load(f, Loader=yaml.SafeLoader)
+            data = yaml.load(f, Loader=SafeLoader)
             secret = trim(data.get("secret", ""))
             controller = trim(data.get("external-controller", "127.0.0.1:9090"))
             providers = [
@@ -290,10 +295,10 @@ def process(
 
     with open(filepath, "r", encoding="utf8") as f:
         try:
-            nodes = yaml.load(f, Loader=yaml.SafeLoader).get("proxies", [])
+            nodes = yaml.load(f, Loader=SafeLoader).get("proxies", [])
         except yaml.constructor.ConstructorError:
-            yaml.add_multi_constructor("str", lambda loader, suffix, node: None, Loader=yaml.SafeLoader)
-            nodes = yaml.load(f, Loader=yaml.FullLoader).get("proxies", [])
+            f.seek(0, 0)
+            nodes = yaml.load(f, Loader=FullLoader).get("proxies", [])
 
     proxies = [x for x in nodes if x.get("name", "") not in names]
     if not proxies: